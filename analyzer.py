@@ -1,50 +1,364 @@
+import queue
 import numpy as np
-import config
+from recording import iter_chunks, read_range, pcm_values, DEFAULT_CHUNK_SIZE
 
-def detect_and_print_specific_peaks(audio_array, threshold, silence_threshold):
+# 피크 감지 로그 출력 단계 (Settings.log_verbosity)
+LOG_QUIET = 0
+LOG_SUMMARY = 1
+LOG_ONSETS = 2
+SUMMARY_ONSET_LINES = 5  # 요약 단계에서 개별 출력할 피크 수
+
+# 다중 해상도 감지의 포락선 해상도 (Hz). 연주 시작은 초당 수십 개 이하이므로 수백 Hz 로 충분
+ENVELOPE_RATE = 400
+# 후보 블록을 샘플 단위로 확인할 때 한 번에 만드는 (블록 수, hop) 배열의 최대 원소 수 (녹음 길이와 무관한 메모리)
+ROW_BATCH_SAMPLES = 1 << 16
+
+
+def _quiet_runs(abs_signal, silence_threshold):
     """
-    정적 상태(silence_threshold)에서 피크(threshold)로 치솟는 순간을 감지하여 인덱스 리스트를 반환합니다.
+    silence_threshold 미만이 연속되는 구간(run)의 시작/끝(끝은 미포함) 인덱스를 반환합니다.
+    """
+    quiet = abs_signal < silence_threshold
+    if len(quiet) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    # 값이 바뀌는 지점으로 구간 경계를 구함 (run-length 인코딩)
+    change = np.flatnonzero(quiet[1:] != quiet[:-1]) + 1
+    bounds = np.concatenate(([0], change, [len(quiet)]))
+    is_quiet_run = quiet[bounds[:-1]]
+    return bounds[:-1][is_quiet_run], bounds[1:][is_quiet_run]
+
+
+def _scan_onsets(abs_signal, threshold, silence_threshold, required_silence, armed=True, counter=0):
+    """
+    정적 -> 피크 전이 지점을 벡터 연산으로 찾습니다. (블록 단위 상태 이월 지원)
+    armed/counter 는 이전 블록이 끝났을 때의 대기 상태와 무음 카운터입니다.
+    반환값: (피크 인덱스 배열, 마지막 대기 상태, 마지막 무음 카운터)
+    """
+    n = len(abs_signal)
+    hits = np.flatnonzero(abs_signal >= threshold)
+    starts, stops = _quiet_runs(abs_signal, silence_threshold)
+    long_runs = np.flatnonzero(stops - starts >= required_silence)
+
+    def next_rearm(p, carry):
+        # 마지막 리셋 지점 p 직후부터 무음이 required_silence 개 연속되는 마지막 샘플 위치
+        j = np.searchsorted(starts, p + 1, side="right") - 1
+        if j >= 0 and stops[j] > p + 1:
+            # p+1 이 무음 구간 안에 있으면 그 구간은 p+1 부터 센다 (이전 블록의 카운터 포함)
+            if stops[j] - (p + 1) + carry >= required_silence:
+                return p + required_silence - carry
+        k = np.searchsorted(long_runs, j + 1)
+        if k == len(long_runs):
+            return None
+        return starts[long_runs[k]] + required_silence - 1
+
+    detected = []
+    last_reset = -1
+    if armed:
+        pos = 0
+    else:
+        rearm = next_rearm(-1, counter)
+        pos = None if rearm is None else rearm + 1
+
+    while pos is not None:
+        k = np.searchsorted(hits, pos)
+        if k == len(hits):
+            break
+        peak = int(hits[k])
+        detected.append(peak)
+        last_reset = peak
+        counter = 0
+        rearm = next_rearm(peak, 0)
+        pos = None if rearm is None else rearm + 1
+
+    if pos is not None:
+        return np.asarray(detected, dtype=np.int64), True, 0
+
+    # 대기 상태로 돌아오지 못한 경우, 블록 끝에 걸친 무음 길이를 다음 블록으로 넘김
+    tail = 0
+    if len(stops) and stops[-1] == n:
+        eff_start = max(int(starts[-1]), last_reset + 1)
+        tail = n - eff_start
+        if eff_start == 0:
+            tail += counter
+    return np.asarray(detected, dtype=np.int64), False, tail
+
+
+def find_onset_indices(abs_signal, threshold, silence_threshold, required_silence):
+    """
+    정적 -> 피크 전이 지점을 벡터 연산으로 찾습니다.
+    샘플 단위 루프(무음 카운터)와 동일한 인덱스를 반환합니다.
+
+    - 대기 상태에서 abs_signal >= threshold 인 첫 샘플이 피크입니다.
+    - 피크 이후 silence_threshold 미만 샘플이 required_silence 개 연속되면 다시 대기 상태가 됩니다.
+    """
+    detected, _, _ = _scan_onsets(abs_signal, threshold, silence_threshold, required_silence)
+    return detected
+
+
+def find_onset_indices_chunked(signal, threshold, silence_threshold, required_silence,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    신호(np.memmap 포함)를 chunk 단위로 읽으며 피크를 찾습니다.
+    상태를 chunk 사이에 이월하므로 find_onset_indices 와 결과가 같고, 메모리 사용량은 chunk 크기로 제한됩니다.
+    """
+    detected = []
+    armed, counter = True, 0
+    for start, block in iter_chunks(signal, chunk_size):
+        onsets, armed, counter = _scan_onsets(
+            np.abs(block), threshold, silence_threshold, required_silence, armed, counter
+        )
+        detected.append(onsets + start)
+
+    if not detected:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(detected)
+
+
+def block_envelope(signal, hop, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    hop 샘플 단위 블록의 절대값 최대(block-max) 포락선을 계산합니다. 마지막 블록은 남은 샘플만 사용합니다.
+    """
+    chunk_size = max(hop, chunk_size // hop * hop)
+    envelope = np.zeros(-(-len(signal) // hop), dtype=np.float32)
+    for start, block in iter_chunks(signal, chunk_size):
+        b = start // hop
+        full = len(block) // hop * hop
+        if full:
+            shaped = block[:full].reshape(-1, hop)
+            envelope[b:b + full // hop] = np.maximum(shaped.max(axis=1), -shaped.min(axis=1))
+        if full < len(block):
+            tail = block[full:]
+            envelope[b + full // hop] = max(tail.max(), -tail.min())
+    return envelope
+
+
+def _abs_at(signal, indices):
+    """signal[indices] 의 절대값 (정수 PCM 은 -1.0 ~ 1.0 범위로 변환)"""
+    raw = pcm_values(signal[indices])
+    values = np.abs(np.asarray(raw, dtype=np.float64))
+    if np.issubdtype(raw.dtype, np.integer):
+        values /= float(np.iinfo(raw.dtype).max + 1)
+    return values
+
+
+def _row_batches(count, hop):
+    """(count, hop) 배열을 ROW_BATCH_SAMPLES 원소 이하씩 나눠 처리하기 위한 행 범위 slice"""
+    rows = max(1, ROW_BATCH_SAMPLES // hop)
+    for start in range(0, count, rows):
+        yield slice(start, start + rows)
+
+
+def _quiet_extents(signal, envelope, silence_threshold, required_silence, hop):
+    """
+    전체가 무음인 블록의 연속 구간을 양옆 블록의 무음 샘플까지 넓혀 실제 무음 구간 [시작, 끝) 을 구합니다.
+    넓혀도 required_silence 에 못 미치는 구간은 미리 제외합니다.
+    """
+    n = len(signal)
+    run_starts, run_stops = _quiet_runs(envelope, silence_threshold)
+    lo, hi = run_starts * hop, np.minimum(run_stops * hop, n)
+    keep = hi - lo + 2 * (hop - 1) >= required_silence
+    lo, hi = lo[keep], hi[keep]
+    offsets = np.arange(hop)
+
+    for rows in _row_batches(len(lo), hop):
+        # 앞 블록 끝에서부터 연속된 무음 샘플 수 (신호 시작 이전은 무음이 아닌 것으로 취급)
+        head = lo[rows, np.newaxis] - hop + offsets
+        quiet = (head >= 0) & (_abs_at(signal, np.clip(head, 0, None)) < silence_threshold)
+        quiet = quiet[:, ::-1]
+        lo[rows] -= np.where(quiet.all(axis=1), hop, quiet.argmin(axis=1))
+
+        # 뒤 블록 앞에서부터 연속된 무음 샘플 수 (신호 끝 이후는 무음이 아닌 것으로 취급)
+        tail = hi[rows, np.newaxis] + offsets
+        quiet = (tail < n) & (_abs_at(signal, np.clip(tail, None, n - 1)) < silence_threshold)
+        hi[rows] += np.where(quiet.all(axis=1), hop, quiet.argmin(axis=1))
+    return lo, hi
+
+
+def find_onset_indices_multires(signal, threshold, silence_threshold, required_silence, hop):
     """
+    2단계 감지: hop 단위 block-max 포락선으로 후보 블록을 먼저 찾고, 후보 블록 안에서만 원래 해상도로 확인합니다.
+    find_onset_indices 와 같은 인덱스를 반환합니다.
+
+    - 피크: 포락선이 threshold 이상인 블록만 샘플 단위로 확인
+    - 무음: 전체가 무음인 블록의 연속 구간을 찾고, 양 끝의 인접 블록만 샘플 단위로 확인해 길이를 잼
+      (required_silence >= 2 * hop - 1 이면 조건을 만족하는 무음 구간은 항상 전체 무음 블록을 포함.
+       그보다 hop 이 크면 전체 해상도 감지로 처리)
+    """
+    if hop <= 1 or required_silence < 2 * hop - 1 or len(signal) == 0:
+        return find_onset_indices_chunked(signal, threshold, silence_threshold, required_silence)
+
+    n = len(signal)
+    envelope = block_envelope(signal, hop)
+    loud = envelope >= threshold
+    loud_blocks = np.flatnonzero(loud)
+    quiet_lo, quiet_hi = _quiet_extents(signal, envelope, silence_threshold, required_silence, hop)
+    long_runs = np.flatnonzero(quiet_hi - quiet_lo >= required_silence)
+
+    # 연속된 후보 블록의 첫 블록마다 첫 threshold 이상 샘플 위치를 한 번에 구함
+    run_heads = loud_blocks[~loud[np.maximum(loud_blocks - 1, 0)] | (loud_blocks == 0)]
+    head_hits = run_heads * hop
+    for rows in _row_batches(len(run_heads), hop):
+        window = head_hits[rows, np.newaxis] + np.arange(hop)
+        over = (window < n) & (_abs_at(signal, np.minimum(window, n - 1)) >= threshold)
+        head_hits[rows] += over.argmax(axis=1)
+
+    def first_hit(pos):
+        # pos 이후 첫 threshold 이상 샘플
+        b = pos // hop
+        if b < len(loud) and loud[b]:
+            # pos 가 후보 블록 안에 있으면 그 블록부터 샘플 단위로 확인 (드묾)
+            k = np.searchsorted(loud_blocks, b)
+            while k < len(loud_blocks):
+                b = int(loud_blocks[k])
+                start = max(pos, b * hop)
+                hit = np.flatnonzero(np.abs(read_range(signal, start, (b + 1) * hop)) >= threshold)
+                if len(hit):
+                    return start + int(hit[0])
+                k += 1
+            return None
+        # 그 외에는 pos 뒤 첫 후보 구간의 첫 블록에 피크가 있음
+        k = np.searchsorted(run_heads, b + 1)
+        return int(head_hits[k]) if k < len(run_heads) else None
+
+    def next_rearm(peak):
+        # 피크 다음 샘플부터 무음이 required_silence 개 연속되는 마지막 샘플 위치
+        first = peak + 1
+        j = np.searchsorted(quiet_hi, first, side="right")
+        if j < len(quiet_hi):
+            lo = max(int(quiet_lo[j]), first)
+            if quiet_hi[j] - lo >= required_silence:
+                return lo + required_silence - 1
+        k = np.searchsorted(long_runs, j + 1)
+        if k == len(long_runs):
+            return None
+        return int(quiet_lo[long_runs[k]]) + required_silence - 1
+
+    detected = []
+    pos = 0
+    while True:
+        peak = first_hit(pos)
+        if peak is None:
+            break
+        detected.append(peak)
+        rearm = next_rearm(peak)
+        if rearm is None:
+            break
+        pos = rearm + 1
+    return np.asarray(detected, dtype=np.int64)
+
+
+def find_onset_indices_channels(signal, threshold, silence_threshold, required_silence, hop=1):
+    """
+    (frames, channels) 신호의 채널별 피크를 찾습니다.
+    채널마다 열 view (np.memmap 포함) 를 그대로 감지하므로 채널을 이어 붙인 복사본을 만들지 않습니다.
+    (hop > 1 이면 find_onset_indices_multires, 아니면 chunk 단위 전체 해상도 감지)
+    반환값: 채널별 피크 인덱스 배열 리스트
+    """
+    return [
+        find_onset_indices_multires(signal[:, ch], threshold, silence_threshold, required_silence, hop)
+        for ch in range(signal.shape[1])
+    ]
+
+
+def refine_onset_positions(signal, indices, threshold):
+    """
+    피크 샘플과 직전 샘플 사이에서 |신호| 가 threshold 를 지나는 지점을 선형 보간해
+    샘플 이하 해상도의 위치(float, 샘플 단위)를 반환합니다.
+    """
+    positions = np.asarray(indices, dtype=np.float64).copy()
+    for k, index in enumerate(indices):
+        if index <= 0:
+            continue
+        prev, curr = np.abs(read_range(signal, index - 1, index + 1)).astype(np.float64)
+        if curr > prev:
+            positions[k] = index - 1 + min(max((threshold - prev) / (curr - prev), 0.0), 1.0)
+    return positions
+
+
+class StreamingOnsetDetector:
+    """
+    오디오 블록을 받을 때마다 피크를 감지하는 증분형 감지기입니다.
+    대기 상태와 무음 카운터를 블록 사이에 이월하므로 결과는 일괄 분석과 동일합니다.
+    감지된 피크는 (샘플 인덱스, 값) 형태로 events 큐에 쌓입니다.
+    """
+    def __init__(self, threshold, silence_threshold, sample_rate):
+        self.threshold = threshold
+        self.silence_threshold = silence_threshold
+        # 정적 판단을 위한 최소 지속 시간 (50ms)
+        self.required_silence = int(sample_rate * 0.05)
+        self.reset()
+
+    def reset(self):
+        # 실시간 보기(live_view)가 비우는 큐 (이전 녹음의 이벤트는 버림)
+        self.events = queue.SimpleQueue()
+        self.indices = []
+        self.samples_seen = 0
+        self._armed = True
+        self._counter = 0
+
+    def process_block(self, block):
+        onsets, self._armed, self._counter = _scan_onsets(
+            np.abs(block), self.threshold, self.silence_threshold,
+            self.required_silence, self._armed, self._counter
+        )
+        for i in onsets:
+            index = self.samples_seen + int(i)
+            self.indices.append(index)
+            self.events.put((index, float(block[i])))
+        self.samples_seen += len(block)
+
+
+def print_detected_peaks(signal, detected_indices, settings):
+    """
+    감지된 피크 목록을 분석 로그 형식으로 출력합니다.
+    settings.log_verbosity: LOG_QUIET(총 개수만), LOG_SUMMARY(앞부분 몇 개 + 세기 통계), LOG_ONSETS(모든 피크)
+    """
+    threshold, silence_threshold = settings.threshold, settings.silence_threshold
+    sample_rate = settings.sample_rate
+    verbosity = settings.log_verbosity
     print(f"\n{'*'*20} 정적({silence_threshold}) -> 피크({threshold}) 분석 시작 {'*'*20}")
-    
-    # 채널 처리 (다채널일 경우 첫 번째 채널 사용)
-    if len(audio_array.shape) > 1:
-        signal = audio_array[:, 0]
+
+    if verbosity >= LOG_ONSETS:
+        shown = detected_indices
+    elif verbosity >= LOG_SUMMARY:
+        shown = detected_indices[:SUMMARY_ONSET_LINES]
     else:
-        signal = audio_array
+        shown = []
 
-    abs_signal = np.abs(signal)
-    detected_indices = []
-    
-    is_looking_for_start = True 
-    # 정적 판단을 위한 최소 지속 시간 (50ms)
-    required_silence_duration = int(config.SAMPLE_RATE * 0.05) 
-    silence_counter = 0
-
-    for i in range(len(abs_signal)):
-        curr_val = abs_signal[i]
-
-        if is_looking_for_start:
-            # 정적 상태에서 임계값을 돌파하는 시점 포착
-            if curr_val >= threshold:
-                print(f"[피크 감지] Index: {i:8d} | 시각: {i/config.SAMPLE_RATE:.3f}s | 값: {signal[i]:.4f}")
-                detected_indices.append(i)
-                is_looking_for_start = False 
-                silence_counter = 0
-        else:
-            # 다시 정적 상태로 돌아오는지 감시
-            if curr_val < silence_threshold:
-                silence_counter += 1
-            else:
-                silence_counter = 0 
-
-            if silence_counter >= required_silence_duration:
-                is_looking_for_start = True
+    for i in shown:
+        print(f"[피크 감지] Index: {i:8d} | 시각: {i/sample_rate:.3f}s | 값: {signal[i]:.4f}")
+    if len(shown) < len(detected_indices) and verbosity >= LOG_SUMMARY:
+        print(f"[피크 감지] ... 외 {len(detected_indices) - len(shown)}개 생략 (전체 출력: log_verbosity = {LOG_ONSETS})")
 
     if not detected_indices:
         print(f"조건을 만족하는 지점이 없습니다.")
     else:
         print(f"\n총 {len(detected_indices)}개의 유효한 연주 시작 지점을 발견했습니다.")
+        if verbosity >= LOG_SUMMARY:
+            values = np.abs(np.asarray(signal[np.asarray(detected_indices)], dtype=np.float64))
+            first, last = detected_indices[0] / sample_rate, detected_indices[-1] / sample_rate
+            print(f"구간: {first:.3f}s ~ {last:.3f}s | 세기 최소 {values.min():.4f} / "
+                  f"중앙값 {np.median(values):.4f} / 최대 {values.max():.4f}")
     print(f"{'*'*60}\n")
-    
-    return detected_indices
\ No newline at end of file
+
+
+def detect_and_print_specific_peaks(audio_array, settings):
+    """
+    정적 상태(silence_threshold)에서 피크(threshold)로 치솟는 순간을 감지하여 인덱스 리스트를 반환합니다.
+    """
+    # 채널 처리 (다채널일 경우 첫 번째 채널 사용)
+    if len(audio_array.shape) > 1:
+        signal = audio_array[:, 0]
+    else:
+        signal = audio_array
+
+    # 정적 판단을 위한 최소 지속 시간 (50ms), 포락선으로 후보를 찾은 뒤 원래 해상도로 확인
+    detected_indices = find_onset_indices_multires(
+        signal, settings.threshold, settings.silence_threshold, settings.required_silence,
+        settings.sample_rate // ENVELOPE_RATE
+    ).tolist()
+
+    print_detected_peaks(signal, detected_indices, settings)
+    return detected_indices
@@ -1,68 +1,340 @@
 # audio_engine.py
+import threading
+
 import numpy as np
-import config
 from utils import generate_sine_wave
+from analyzer import StreamingOnsetDetector
+from ring_buffer import RingBuffer, RingBufferConsumer
+from recording import MemorySink
+from callback_monitor import CallbackMonitor
+from calibration import NoiseFloorMeter
+from tempo_map import TempoMap, click_schedule, grid_window, window_points
+
+# 전송(transport) 상태: 콜백이 블록 안의 정확한 샘플 위치에서 다음 상태로 넘김
+TRANSPORT_IDLE = 0       # 대기 (수동 녹음/메트로놈 제어만 사용)
+TRANSPORT_ARMED = 1      # 시작 요청됨, 다음 블록 첫 샘플에서 카운트인 시작
+TRANSPORT_COUNTIN = 2    # 카운트인 (클릭 재생, 입력 잡음 측정)
+TRANSPORT_RECORDING = 3  # 녹음
+TRANSPORT_DONE = 4       # 녹음 샘플 수를 채움 (finished 이벤트 알림)
+
+# 예상 시간보다 이만큼 더 기다려도 상태가 바뀌지 않으면 스트림 오류로 판단
+TRANSPORT_TIMEOUT_MS = 5000
+
+
+def render_click_bar(beat_interval_samples, beats_per_bar, downbeat_sound, beat_sound):
+    """
+    한 마디 길이의 메트로놈 클릭 루프를 미리 렌더링합니다.
+    클릭음이 박 간격보다 길면 다음 박에서 잘립니다.
+    """
+    bar = np.zeros(beat_interval_samples * beats_per_bar, dtype=np.float32)
+    for beat in range(beats_per_bar):
+        sound = downbeat_sound if beat == 0 else beat_sound
+        length = min(len(sound), beat_interval_samples)
+        start = beat * beat_interval_samples
+        bar[start:start + length] = sound[:length]
+    return bar
 
 
 class AudioHandler:
-    def __init__(self):
-        # 리스트 대신 NumPy 배열을 미리 할당 (메모리 관리 최적화)
-        max_samples = int(config.SAMPLE_RATE * (config.RECORD_DURATION + 2)) # 여유분 포함
-        self.recorded_data = np.zeros(max_samples, dtype=np.float32)
-        self.write_ptr = 0  # 데이터를 기록할 위치 포인터
-        
+    def __init__(self, settings, recording_sink=None, ring_seconds=2.0, monitor_input=True):
+        # 이 세션의 설정 (불변 객체이므로 세션마다 다른 설정을 동시에 사용할 수 있음)
+        self.settings = settings
+        sample_rate = settings.sample_rate
+        # 콜백에서 속성 조회를 줄이기 위해 증폭 배율을 따로 보관
+        self.gain = settings.software_gain
+
+        # 녹음할 입력 채널. 한 채널이면 기존과 같은 1차원, 여러 채널이면 (frames, channels) 로 녹음
+        self.input_channels = tuple(settings.input_channels)
+        self.num_channels = len(self.input_channels)
+        if not self.input_channels or min(self.input_channels) < 0 or \
+                len(set(self.input_channels)) != self.num_channels:
+            raise ValueError(f"입력 채널 {list(self.input_channels)} 이 올바르지 않습니다. (0 이상, 중복 없이)")
+        multichannel = self.num_channels > 1
+        # np.take 인덱스 (한 채널이면 스칼라라서 결과가 1차원)
+        self._channel_index = np.asarray(self.input_channels) if multichannel else self.input_channels[0]
+
+        # 오디오 콜백은 링 버퍼에 복사만 하고, 분석/저장은 소비자 스레드가 담당
+        self.ring = RingBuffer(int(sample_rate * ring_seconds), channels=self.num_channels if multichannel else None)
+        # 녹음 데이터 저장소 (기본: 메모리, 긴 녹음은 recording.WavFileSink 사용)
+        self.recording_sink = recording_sink if recording_sink is not None else MemorySink()
+        self.consumer = None
+
+        # 수동 제어 (start_recording / metronome_active, 벤치마크 등에서 사용)
         self.is_recording = False
         self.metronome_active = False
-        
-        self.current_beat = 0
-        self.sample_counter = 0
-        self.beat_interval_samples = int(config.SAMPLE_RATE * 60.0 / config.METRONOME_BPM)
-        
+
+        # 카운트인 -> 녹음 -> 완료 전송 상태 (start_transport, 상태 전이는 콜백이 샘플 수로 수행)
+        self.state = TRANSPORT_IDLE
+        self.recording_started = threading.Event()
+        self.finished = threading.Event()
+        self.countin_samples = 0
+        self.record_samples = 0
+        self._position = 0  # 카운트인 시작 이후 처리한 샘플 수 (콜백 전용)
+        # 입력 소리를 출력으로 함께 내보낼지 여부 (루프백 지연 측정 시에는 끔)
+        self.monitor_input = monitor_input
+        # 녹음 첫 샘플에서의 클릭 루프 위치 (마디 시작 이후 샘플 수, 그리드 위치 보정에 사용)
+        self.record_start_click_pos = None
+
+        # 템포 맵 (분석 그리드와 같은 정의로 클릭 일정을 만듦, 카운트인은 첫 구간 첫 마디 템포)
+        self.tempo_map = TempoMap.from_settings(settings)
+        first = self.tempo_map.sections[0]
+        self.beat_interval_samples = int(sample_rate * 60.0 / first.bpm)
+
         # 소리 생성 (Sine Wave)
-        self.metronome_sound = generate_sine_wave(50, 1000, config.SAMPLE_RATE) * 0.3
-        self.downbeat_sound = generate_sine_wave(50, 1200, config.SAMPLE_RATE) * 0.3
-
-    def reset_state(self):
-        # 포인터 초기화
-        self.write_ptr = 0
-        self.recorded_data.fill(0) # 배열 내용 초기화
-        self.current_beat = 0
-        self.sample_counter = 0
+        self.metronome_sound = generate_sine_wave(50, 1000, sample_rate) * 0.3
+        self.downbeat_sound = generate_sine_wave(50, 1200, sample_rate) * 0.3
+
+        # 수동 메트로놈(metronome_active)용 한 마디 클릭 루프 (콜백에서는 슬라이싱만 수행)
+        self.click_bar = render_click_bar(
+            self.beat_interval_samples, first.beats_per_bar, self.downbeat_sound, self.metronome_sound
+        )
+        self.click_pos = 0  # 클릭 루프 내 현재 재생 위치
+
+        # 전송 세션 그리드 (카운트인 시작 = 0초, tempo_map.GRID_POINT_DTYPE)와 클릭 일정 (start_transport 에서 계산)
+        self.session_grid = None
+        self.click_times = np.zeros(0, dtype=np.int64)     # 클릭 시작 위치 (카운트인 시작 이후 샘플 수)
+        self.click_downbeats = np.zeros(0, dtype=bool)     # 강박 여부
+
+        # 콜백 실행 시간/xrun 기록 (세션 종료 후 monitor.report() 로 출력)
+        self.monitor = CallbackMonitor(sample_rate)
+        # 카운트인(메트로놈만 재생, 녹음 전) 동안의 입력 잡음 크기 (임계값 보정에 사용)
+        self.noise_meter = NoiseFloorMeter()
+
+        # 콜백에서 사용할 작업 버퍼 (블록마다 새 배열을 만들지 않도록 미리 할당)
+        self._alloc_work_buffers(settings.block_size)
+
+        # 녹음 중 블록 단위로 채널마다 피크를 감지 (녹음 종료 후 분석 비용 제거)
+        self.onset_detectors = [
+            StreamingOnsetDetector(settings.threshold, settings.silence_threshold, sample_rate)
+            for _ in self.input_channels
+        ]
+        # 기준(첫) 채널 감지기
+        self.onset_detector = self.onset_detectors[0]
+
+    def _alloc_work_buffers(self, frames):
+        shape = (frames, self.num_channels) if self.num_channels > 1 else frames
+        self.input_buffer = np.zeros(shape, dtype=np.float32)
+        self.mix_buffer = np.zeros(frames, dtype=np.float32)
+
+    @property
+    def overflow_count(self):
+        return self.ring.overflow_count
+
+    @property
+    def dropped_samples(self):
+        return self.ring.dropped_samples
+
+    def _detect_sink(self, chunk, start_index):
+        if chunk.ndim == 1:
+            self.onset_detector.process_block(chunk)
+            return
+        for ch, detector in enumerate(self.onset_detectors):
+            detector.process_block(chunk[:, ch])
+
+    @property
+    def detected_indices(self):
+        """채널별 감지된 피크 인덱스 리스트 (한 채널이면 리스트 하나)"""
+        if self.num_channels == 1:
+            return self.onset_detector.indices
+        return [detector.indices for detector in self.onset_detectors]
+
+    def _start_consumer(self):
+        """싱크와 감지기를 초기화하고 소비자 스레드를 시작합니다."""
+        self.recording_sink.reset()
+        for detector in self.onset_detectors:
+            detector.reset()
+        self.ring.discard()
+        self.consumer = RingBufferConsumer(self.ring, [self.recording_sink, self._detect_sink])
+        self.consumer.start()
+        self.record_start_click_pos = None
+
+    def _stop_consumer(self):
+        """링 버퍼에 남은 데이터를 모두 처리한 뒤 소비자 스레드를 종료합니다."""
+        if self.consumer is not None:
+            self.consumer.stop()
+            self.consumer = None
+        self.recording_sink.close()
+
+    def start_recording(self):
+        """수동 녹음: 소비자 스레드를 시작한 뒤 바로 녹음을 켭니다."""
+        self._start_consumer()
+        self.is_recording = True
+
+    def stop_recording(self):
+        """수동 녹음을 끄고 남은 데이터를 처리합니다."""
         self.is_recording = False
+        self._stop_consumer()
 
-    def callback(self, indata, outdata, frames, time_info, status):
-        if status:
-            print(status)
+    def start_transport(self, countin_samples, record_samples):
+        """
+        카운트인 -> 녹음 -> 완료를 콜백이 샘플 수로 진행하도록 준비합니다. (제어 스레드에서 호출)
+        다음 콜백 블록의 첫 샘플에서 카운트인을 시작하고, countin_samples 샘플 뒤부터
+        정확히 record_samples 샘플을 녹음한 뒤 finished 이벤트를 알립니다.
+        템포 맵은 녹음 첫 샘플에서 시작하며, 세션 그리드와 클릭 일정은 여기서 한 번만 계산합니다.
+        (녹음 시작은 recording_started 이벤트)
+        """
+        if self.state not in (TRANSPORT_IDLE, TRANSPORT_DONE):
+            raise RuntimeError("전송이 이미 진행 중입니다.")
+        self.countin_samples = int(countin_samples)
+        self.record_samples = int(record_samples)
+
+        sample_rate = self.settings.sample_rate
+        # 왕복 지연만큼 뒤로 옮긴 분석 그리드도 잘라 쓸 수 있도록 카운트인 한 마디 앞부터 계산
+        self.session_grid = self.tempo_map.grid_points(
+            (self.countin_samples + self.record_samples) / sample_rate,
+            offset=self.countin_samples / sample_rate,
+            start=-self.tempo_map.first_bar_seconds,
+        )
+        self.click_times, self.click_downbeats = click_schedule(self.session_grid, sample_rate)
+        self.recording_started.clear()
+        self.finished.clear()
+        self.noise_meter.reset()
+        self._start_consumer()
+        # 녹음 길이를 알고 있으므로 메모리 싱크는 한 번만 할당
+        self.recording_sink.reserve(self.record_samples, self.num_channels if self.num_channels > 1 else None)
+        # 준비가 끝난 뒤 마지막으로 상태를 공개 (이후 상태 전이는 콜백만 수행)
+        self.state = TRANSPORT_ARMED
+
+    def stop_transport(self):
+        """전송을 끝내고 녹음된 데이터를 모두 처리합니다. (finished 이후, 또는 중단 시 호출)"""
+        self.state = TRANSPORT_IDLE
+        self._stop_consumer()
+
+    def record_grid(self, grid_offset, num_samples):
+        """
+        세션 그리드 중 녹음 구간을 녹음 첫 샘플 기준 시각으로 잘라 반환합니다. (그리드 재계산 없음)
+        grid_offset: 그리드 이동량 (초, latency.grid_offset)
+        반환값: (시각 배열, 종류 배열) (timing.analyze_timing 의 grid)
+        """
+        sample_rate = self.settings.sample_rate
+        return grid_window(self.session_grid, self.countin_samples / sample_rate - grid_offset,
+                           num_samples / sample_rate)
 
-        guitar_input = indata[:, 0]
-        amplified = np.clip(guitar_input * config.SOFTWARE_GAIN, -1.0, 1.0)
+    def record_grid_points(self, grid_offset, num_samples):
+        """record_grid 와 같은 구간의 그리드 지점 (GRID_POINT_DTYPE, 마디 안 위치 포함)"""
+        sample_rate = self.settings.sample_rate
+        return window_points(self.session_grid, self.countin_samples / sample_rate - grid_offset,
+                             num_samples / sample_rate)
 
-        if self.is_recording:
-            # 리스트 extend 대신 배열 구간에 직접 할당
-            end_ptr = self.write_ptr + frames
-            if end_ptr <= len(self.recorded_data):
-                self.recorded_data[self.write_ptr:end_ptr] = amplified
-                self.write_ptr = end_ptr
+    def mix_clicks(self, out, position):
+        """
+        클릭 일정 중 세션 위치 [position, position + len(out)) 에 울리는 클릭을 out 에 더합니다.
+        클릭음이 다음 박까지보다 길면 다음 박에서 잘립니다. (위치는 이진 탐색, 새 배열을 만들지 않음)
+        """
+        times = self.click_times
+        stop = position + len(out)
+        # position 에서 아직 울리고 있을 수 있는 직전 클릭부터
+        k = max(int(np.searchsorted(times, position, side="right")) - 1, 0)
+        while k < len(times) and times[k] < stop:
+            sound = self.downbeat_sound if self.click_downbeats[k] else self.metronome_sound
+            begin = int(times[k])
+            end = begin + len(sound)
+            if k + 1 < len(times):
+                end = min(end, int(times[k + 1]))
+            lo, hi = max(begin, position), min(end, stop)
+            if lo < hi:
+                target = out[lo - position:hi - position]
+                np.add(target, sound[lo - begin:hi - begin], out=target)
+            k += 1
+
+    def _advance_transport(self, amplified, reference, out, frames):
+        """
+        블록 [position, position + frames) 를 카운트인/녹음 구간에 나눠 처리하고 그 구간의 클릭을 out 에 더합니다.
+        (오디오 콜백 전용)
+        """
+        if self.state == TRANSPORT_ARMED:
+            # 카운트인은 이 블록 첫 샘플에서 시작
+            self._position = 0
+            self.state = TRANSPORT_COUNTIN
+        elif self.state == TRANSPORT_DONE:
+            return
+
+        start = self._position
+        stop = start + frames
+        countin_end = self.countin_samples
+        record_end = countin_end + self.record_samples
+
+        if start < countin_end:
+            self.noise_meter.update(reference[:min(stop, countin_end) - start])
+
+        lo, hi = max(start, countin_end), min(stop, record_end)
+        if lo < hi:
+            if lo == countin_end:
+                # 템포 맵의 첫 마디가 녹음 첫 샘플에서 시작
+                self.record_start_click_pos = 0
+                self.state = TRANSPORT_RECORDING
+                self.recording_started.set()
+            # 실시간 스레드에서는 링 버퍼 복사만 수행 (공간 부족 시 오버플로 카운트)
+            self.ring.write(amplified[lo - start:hi - start])
+
+        self.mix_clicks(out, start)
+        self._position = stop
+        if stop >= record_end:
+            self.state = TRANSPORT_DONE
+            self.finished.set()
+
+    def _mix_click(self, out, frames):
+        """클릭 루프를 현재 위치부터 잘라 out 에 더합니다. (마디 경계에서 루프 순환)"""
+        bar = self.click_bar
+        done = 0
+        while done < frames:
+            n = min(frames - done, len(bar) - self.click_pos)
+            np.add(out[done:done + n], bar[self.click_pos:self.click_pos + n], out=out[done:done + n])
+            done += n
+            self.click_pos = (self.click_pos + n) % len(bar)
+
+    def check_channels(self, device_channels):
+        """
+        스트림을 열기 전에 입력 채널이 모두 장치에 있는지 확인합니다. (없으면 ValueError)
+        콜백의 np.take(mode="clip") 은 범위를 벗어난 채널을 마지막 채널로 바꿔 읽으므로 여기서 미리 막습니다.
+        """
+        if max(self.input_channels) >= device_channels:
+            raise ValueError(f"입력 채널 {list(self.input_channels)} 중 장치에 없는 채널이 있습니다. "
+                             f"(사용 가능: 0 ~ {device_channels - 1})")
+
+    def callback(self, indata, outdata, frames, time_info, status):
+        # 실시간 스레드에서 print 하지 않고 상태 플래그만 집계
+        self.monitor.begin(status)
 
-        output_signal = amplified.copy()
+        if frames > len(self.input_buffer):
+            # 블록 크기가 설정보다 큰 경우에만 재할당 (드묾)
+            self._alloc_work_buffers(frames)
 
-        if self.metronome_active:
-            for i in range(frames):
-                if self.sample_counter >= self.beat_interval_samples:
-                    self.sample_counter = 0
-                    self.current_beat = (self.current_beat + 1) % config.BEATS_PER_BAR
+        amplified = self.input_buffer[:frames]
+        # 선택한 채널만 작업 버퍼로 복사 (mode="clip" 은 out 에 바로 기록, 새 배열을 만들지 않음)
+        # 채널 범위는 스트림을 열기 전에 check_channels 로 확인됨
+        np.take(indata[:frames], self._channel_index, axis=1, out=amplified, mode="clip")
+        np.multiply(amplified, self.gain, out=amplified)
+        np.clip(amplified, -1.0, 1.0, out=amplified)
+        # 잡음 측정은 기준(첫) 채널로 함
+        reference = amplified if amplified.ndim == 1 else amplified[:, 0]
 
-                sound = self.downbeat_sound if self.current_beat == 0 else self.metronome_sound
-                
-                if self.sample_counter < len(sound):
-                    output_signal[i] += sound[self.sample_counter]
+        output_signal = self.mix_buffer[:frames]
+        if self.monitor_input and amplified.ndim > 1:
+            # 여러 채널은 합쳐서 모니터링
+            np.sum(amplified, axis=1, out=output_signal)
+        elif self.monitor_input:
+            np.copyto(output_signal, amplified)
+        else:
+            output_signal.fill(0)
 
-                self.sample_counter += 1
+        if self.state != TRANSPORT_IDLE:
+            # 전송 중에는 세션 클릭 일정을 재생
+            self._advance_transport(amplified, reference, output_signal, frames)
+        else:
+            if self.is_recording:
+                if self.record_start_click_pos is None:
+                    self.record_start_click_pos = self.click_pos if self.metronome_active else 0
+                # 실시간 스레드에서는 링 버퍼 복사만 수행 (공간 부족 시 오버플로 카운트)
+                self.ring.write(amplified)
+            elif self.metronome_active:
+                self.noise_meter.update(reference)
+            if self.metronome_active:
+                self._mix_click(output_signal, frames)
 
-        output_signal = np.clip(output_signal, -1.0, 1.0)
-        for ch in range(outdata.shape[1]):
-            outdata[:, ch] = output_signal
+        np.clip(output_signal, -1.0, 1.0, out=output_signal)
+        outdata[:] = output_signal[:, np.newaxis]
+        self.monitor.end(frames)
 
     def get_recorded_array(self):
-        # [수정] 실제 기록된 범위만 슬라이싱하여 반환
-        return self.recorded_data[:self.write_ptr].copy()
\ No newline at end of file
+        return self.recording_sink.get_array()
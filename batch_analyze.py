@@ -0,0 +1,185 @@
+# batch_analyze.py
+# WAV 녹음 파일 일괄 분석 CLI: 오디오 장치 없이 여러 파일을 프로세스 풀로 병렬 분석합니다.
+# (sounddevice 를 임포트하지 않으며, PNG 저장 시에만 matplotlib 을 불러옵니다.)
+#
+# 사용 예:
+#   python batch_analyze.py takes/ -o results.csv --bpm 90 --chromatic-beats 16
+#   python batch_analyze.py a.wav b.wav --png images/batch
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from settings import load_settings
+from recording import open_wav
+from analyzer import find_onset_indices_channels, refine_onset_positions, ENVELOPE_RATE
+from timing import analyze_timing_channels, compare_channels
+
+# 결과 행은 파일의 채널마다 하나 (channel_offset_* 은 첫 채널(기준) 대비 시차, 기준 채널 행은 비어 있음)
+RESULT_FIELDS = [
+    "file", "channel", "sample_rate", "duration_s", "onset_count", "off_grid_count", "off_grid_ratio",
+    "mean_error_ms", "std_error_ms", "missed_slots", "extra_onsets",
+    "paired_slots", "channel_offset_ms", "channel_offset_std_ms", "image", "error",
+]
+
+# 명령행 옵션 -> Settings 필드
+SETTINGS_OVERRIDES = {
+    "bpm": "metronome_bpm",
+    "beats_per_bar": "beats_per_bar",
+    "chromatic_beats": "chromatic_beats",
+    "tolerance": "tolerance",
+    "threshold": "threshold",
+    "silence_threshold": "silence_threshold",
+}
+
+
+def find_wav_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(".wav"))
+        else:
+            files.append(path)
+    return files
+
+
+def analyze_file(path, settings, gain=1.0, png_dir=None):
+    """
+    WAV 파일 하나를 분석해 채널별 결과 행(dict) 리스트를 반환합니다. (다채널 파일은 채널마다 한 행)
+    settings 의 샘플 레이트와 입력 채널은 파일의 값으로 바꿔 사용합니다.
+    gain 은 녹음 시 software_gain 과 같은 의미로, 신호 대신 임계값을 나눠 적용합니다.
+    """
+    row = dict.fromkeys(RESULT_FIELDS, "")
+    row["file"] = path
+    try:
+        audio, sample_rate = open_wav(path)
+        frames = audio if audio.ndim > 1 else audio[:, np.newaxis]
+        # 채널 번호는 파일 안의 채널 순서 (그림의 채널 제목에 사용)
+        settings = settings.replace(sample_rate=sample_rate, input_channels=tuple(range(frames.shape[1])))
+
+        threshold = settings.threshold / gain
+        # 채널마다 포락선으로 후보를 찾고 후보 구간만 원래 해상도로 확인, 연주 시각은 샘플 이하 해상도로 보정
+        channel_indices = find_onset_indices_channels(
+            frames, threshold, settings.silence_threshold / gain, settings.required_silence,
+            sample_rate // ENVELOPE_RATE
+        )
+        positions = [refine_onset_positions(frames[:, ch], indices, threshold)
+                     for ch, indices in enumerate(channel_indices)]
+        timings = analyze_timing_channels(channel_indices, len(audio), settings, positions)
+        # 첫 채널(기준) 대비 연주자 간 시차
+        pairs = {int(pair["channel"]): pair for pair in compare_channels(timings)}
+
+        rows = []
+        for ch, timing in enumerate(timings):
+            errors_ms = timing.onsets["error"] * 1000
+            channel_row = dict(row)
+            channel_row.update(
+                channel=ch,
+                sample_rate=sample_rate,
+                duration_s=round(len(audio) / sample_rate, 3),
+                onset_count=len(timing.onsets),
+                off_grid_count=timing.off_grid_count,
+                off_grid_ratio=round(timing.off_grid_ratio, 4),
+                mean_error_ms=round(float(np.mean(errors_ms)), 3) if len(errors_ms) else "",
+                std_error_ms=round(float(np.std(errors_ms)), 3) if len(errors_ms) else "",
+                missed_slots=len(timing.missed_slots),
+                extra_onsets=len(timing.extra_indices),
+            )
+            pair = pairs.get(ch)
+            if pair is not None:
+                channel_row["paired_slots"] = int(pair["paired"])
+                if pair["paired"]:
+                    channel_row["channel_offset_ms"] = round(float(pair["mean_offset"]) * 1000, 3)
+                    channel_row["channel_offset_std_ms"] = round(float(pair["std_offset"]) * 1000, 3)
+            rows.append(channel_row)
+
+        if png_dir:
+            # PNG 요청 시에만 matplotlib 을 화면 없는 Agg 백엔드로 로드 (모든 채널을 한 그림에)
+            import matplotlib
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+            from visualizer import create_waveform_with_metronome, save_analysis_image
+
+            fig = create_waveform_with_metronome(audio, settings, timing=timings if audio.ndim > 1 else timings[0])
+            name = os.path.splitext(os.path.basename(path))[0] + ".png"
+            image = save_analysis_image(fig, filename=name, output_dir=png_dir)
+            plt.close(fig)
+            for channel_row in rows:
+                channel_row["image"] = image
+        return rows
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return [row]
+
+
+def write_results(rows, output):
+    """결과를 CSV(.csv) 또는 JSON Lines(그 외/표준 출력) 로 기록합니다."""
+    if output and output.lower().endswith(".csv"):
+        with open(output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return
+
+    stream = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+    finally:
+        if output:
+            stream.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WAV 녹음 파일 일괄 리듬 분석")
+    parser.add_argument("paths", nargs="+", help="WAV 파일 또는 폴더")
+    parser.add_argument("-o", "--output", help="결과 파일 (.csv 또는 .jsonl, 생략 시 표준 출력)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="작업 프로세스 수")
+    parser.add_argument("--png", metavar="DIR", help="분석 이미지를 저장할 폴더 (지정 시에만 생성)")
+    parser.add_argument("--gain", type=float, default=1.0, help="입력 증폭 배율 (녹음 파일은 이미 증폭됨: 1.0)")
+    parser.add_argument("--bpm", type=float)
+    parser.add_argument("--beats-per-bar", type=int)
+    parser.add_argument("--chromatic-beats", type=int)
+    parser.add_argument("--no-tempo-map", action="store_true",
+                        help="settings.json 의 템포 맵 대신 BPM/박자 설정으로 일정한 그리드 사용 (--bpm 등을 주면 자동)")
+    parser.add_argument("--tolerance", type=float)
+    parser.add_argument("--threshold", type=float)
+    parser.add_argument("--silence-threshold", type=float)
+    args = parser.parse_args(argv)
+
+    overrides = {
+        name: getattr(args, option) for option, name in SETTINGS_OVERRIDES.items()
+        if getattr(args, option) is not None
+    }
+    if args.no_tempo_map:
+        overrides["tempo_map"] = ()
+    # BPM/박자/그리드 단위를 바꾸면 그 값을 덮어쓰는 템포 맵은 지움
+    settings = load_settings().replace_grid(**overrides)
+    print(f"[설정] 그리드: {settings.grid_label}", file=sys.stderr)
+    files = find_wav_files(args.paths)
+    if not files:
+        print("[오류] 분석할 WAV 파일이 없습니다.", file=sys.stderr)
+        return 1
+
+    if args.png:
+        # 작업 프로세스가 동시에 폴더를 만들거나 표준 출력(결과)에 로그를 섞지 않도록 미리 생성
+        os.makedirs(args.png, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        rows = [row for file_rows in pool.map(analyze_file, files, [settings] * len(files),
+                                              [args.gain] * len(files), [args.png] * len(files))
+                for row in file_rows]
+
+    write_results(rows, args.output)
+    failed = sum(1 for row in rows if row["error"])
+    print(f"[완료] {len(files)}개 파일 분석 ({len(rows)}개 채널, 실패 {failed}개)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
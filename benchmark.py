@@ -0,0 +1,677 @@
+# benchmark.py
+# 성능 측정 스크립트: 분석기, 오디오 콜백, 그리드 매칭, 그림 렌더링의 속도와 감지 정확도를 측정합니다.
+#
+# 사용 예:
+#   python benchmark.py                 # 전체 측정
+#   python benchmark.py --quick         # 짧은 녹음만 측정
+#   python benchmark.py --only memory --quick    # 단계별 메모리 상한만 빠르게 확인 (30초 녹음)
+#   python benchmark.py --only analyzer,grid --save    # 결과를 기록 파일에 추가
+#   python benchmark.py --compare       # 직전 기록과 비교해 속도/정확도 퇴보 표시
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from settings import Settings
+from analyzer import (find_onset_indices, find_onset_indices_multires, find_onset_indices_channels,
+                      StreamingOnsetDetector, ENVELOPE_RATE)
+from synthetic import generate_take, score_detection
+from calibration import sweep_thresholds, DEFAULT_THRESHOLDS, DEFAULT_SILENCE_THRESHOLDS
+from tempo_map import TempoMap, TempoSection
+from rhythm_stats import RhythmStats, analysis_stats, DRIFT_RUSHING, DRIFT_DRAGGING
+
+# 측정 결과 기록 파일 (한 줄에 한 번의 실행 결과)
+HISTORY_FILE = "benchmark_history.jsonl"
+
+# 직전 기록 대비 이 비율 이상 느려지면 퇴보로 표시
+SLOWDOWN_LIMIT = 1.2
+# 측정 잡음으로 보고 무시할 최소 차이 (단위별)
+NOISE_FLOOR = {"_s": 0.005, "_ms": 1.0, "_us": 20.0, "_mb": 1.0}
+
+# 녹음 -> 감지 -> 매칭 -> 임계값 보정 -> 저장 -> 그림 단계별 최대 메모리 할당 상한 (MB, tracemalloc 기준).
+# 오디오는 WAV 파일(np.memmap)과 chunk 단위 float32 블록으로만 다루므로 녹음 길이/샘플 레이트와 무관한 값이며,
+# memory 항목이 이 상한을 넘으면 실패합니다. (memmap 으로 읽은 페이지는 OS 캐시라 포함하지 않음)
+MEMORY_BUDGET_MB = {"record": 16, "detect": 16, "match": 8, "calibration": 16, "store": 24, "render": 32}
+
+
+def reference_peak_loop(abs_signal, threshold, silence_threshold, required_silence):
+    """
+    기존 detect_and_print_specific_peaks 의 샘플 단위 루프 (비교 기준용)
+    """
+    detected_indices = []
+    is_looking_for_start = True
+    silence_counter = 0
+
+    for i in range(len(abs_signal)):
+        curr_val = abs_signal[i]
+
+        if is_looking_for_start:
+            if curr_val >= threshold:
+                detected_indices.append(i)
+                is_looking_for_start = False
+                silence_counter = 0
+        else:
+            if curr_val < silence_threshold:
+                silence_counter += 1
+            else:
+                silence_counter = 0
+
+            if silence_counter >= required_silence:
+                is_looking_for_start = True
+
+    return detected_indices
+
+
+def reference_grid(duration, bpm, beats_per_bar, chromatic_beats, offset):
+    """
+    기존 build_grid 의 일정 템포 그리드 (비교 기준용, 정박과 겹치는 세부 그리드는 1e-5초 이내로 판정)
+    """
+    def points(step):
+        numbers = np.arange(np.ceil(-offset / step), (duration - offset) / step)
+        return numbers.astype(np.int64), offset + numbers * step
+
+    beat_interval = 60.0 / bpm
+    beat_numbers, times = points(beat_interval)
+    kinds = np.where(beat_numbers % beats_per_bar == 0, 0, 1)
+    _, sub_times = points(beat_interval / (chromatic_beats / 4))
+    close = np.abs(sub_times[:, np.newaxis] - times[np.newaxis, :]).min(axis=1, initial=np.inf) <= 1e-5
+    times = np.concatenate((times, sub_times[~close]))
+    kinds = np.concatenate((kinds, np.full(np.count_nonzero(~close), 2)))
+    order = np.argsort(times, kind="stable")
+    keep = times[order] < duration
+    return times[order][keep], kinds[order][keep]
+
+
+def run_streaming(signal, threshold, silence_threshold, sample_rate, block_sizes):
+    """
+    신호를 주어진 크기 목록을 순환하며 잘라 증분형 감지기에 공급합니다.
+    """
+    detector = StreamingOnsetDetector(threshold, silence_threshold, sample_rate)
+    pos = 0
+    k = 0
+    while pos < len(signal):
+        size = block_sizes[k % len(block_sizes)]
+        detector.process_block(signal[pos:pos + size])
+        pos += size
+        k += 1
+    return detector.indices
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """repeat 회 실행 중 가장 짧은 시간(초)과 마지막 결과를 반환합니다."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def check_equivalence(sample_rate=44100):
+    """
+    여러 합성 신호에서 벡터화 감지기(일괄/블록 단위)와 기존 루프의 결과가 동일한지 확인합니다.
+    """
+    required = int(sample_rate * 0.05)
+    rng = np.random.default_rng(1)
+    cases = []
+
+    for seed in range(5):
+        cases.append(("pluck", generate_take(3, sample_rate, seed=seed)[0], 0.25, 0.15))
+
+    # 무음 구간이 정확히 required / required - 1 샘플인 경계 케이스
+    edge = np.zeros(required * 6, dtype=np.float32)
+    edge[10] = 0.5
+    edge[11 + required - 1] = 0.5
+    edge[11 + required + 5] = 0.5
+    edge[11 + 2 * required + 10] = 0.5
+    edge[-1] = 0.5
+    cases.append(("edge", edge, 0.25, 0.15))
+
+    # 무음 임계값이 피크 임계값보다 큰 비정상 설정과 랜덤 잡음
+    cases.append(("inverted", generate_take(2, sample_rate, seed=7)[0], 0.1, 0.3))
+    cases.append(("noise", rng.uniform(-0.5, 0.5, sample_rate * 2).astype(np.float32), 0.45, 0.2))
+    cases.append(("empty", np.zeros(0, dtype=np.float32), 0.25, 0.15))
+
+    check_grid_equivalence(sample_rate)
+    check_rhythm_stats(sample_rate)
+
+    for name, signal, threshold, silence_threshold in cases:
+        abs_signal = np.abs(signal)
+        expected = reference_peak_loop(abs_signal, threshold, silence_threshold, required)
+        results = {"batch": find_onset_indices(abs_signal, threshold, silence_threshold, required).tolist()}
+        # 블록 경계가 피크/무음 구간 중간에 걸리도록 여러 블록 크기로 나눠 공급
+        for sizes in ([32], [64], [1, 7, 300], [required - 1, required + 1], [len(signal) or 1]):
+            label = f"stream{sizes}"
+            results[label] = run_streaming(signal, threshold, silence_threshold, sample_rate, sizes)
+        # 포락선 블록 크기를 바꿔 가며 다중 해상도 감지 (마지막은 전체 해상도로 대체되는 경우)
+        for hop in (sample_rate // ENVELOPE_RATE, 17, required // 2, required):
+            results[f"multires[{hop}]"] = find_onset_indices_multires(
+                signal, threshold, silence_threshold, required, hop
+            ).tolist()
+
+        mismatched = [label for label, actual in results.items() if actual != expected]
+        # 다채널 한 번 감지 (두 번째 채널은 신호를 뒤집어 다른 결과가 나오게 함)
+        per_channel = find_onset_indices_channels(
+            np.stack((signal, signal[::-1]), axis=1), threshold, silence_threshold, required,
+            sample_rate // ENVELOPE_RATE
+        )
+        if per_channel[0].tolist() != expected or per_channel[1].tolist() != reference_peak_loop(
+                abs_signal[::-1], threshold, silence_threshold, required):
+            mismatched.append("channels")
+        # 임계값 조합 평가(calibration.sweep_thresholds)의 감지 수도 같은지 확인
+        sweep = sweep_thresholds(signal, Settings(sample_rate=sample_rate), [threshold], [silence_threshold])
+        if sweep["onsets"][0] != len(expected):
+            mismatched.append("sweep")
+        status = "OK" if not mismatched else f"MISMATCH {mismatched}"
+        print(f"[일치 검사] {name:9s} | 피크 {len(expected):4d}개 | {status}")
+        if mismatched:
+            raise AssertionError(f"{name}: 결과 불일치")
+
+
+def check_grid_equivalence(sample_rate=44100):
+    """
+    일정 템포 템포 맵 그리드가 기존 그리드와 같은지, 클릭 일정이 블록 크기와 무관하게 세션 그리드의 박에 맞는지 확인합니다.
+    """
+    from timing import build_grid
+    from audio_engine import AudioHandler
+
+    mismatched = []
+    for bpm, beats_per_bar, chromatic_beats, offset in [(100, 4, 16, 0.0), (110, 3, 12, -0.37), (133.3, 7, 8, 0.004)]:
+        expected = reference_grid(20.0, bpm, beats_per_bar, chromatic_beats, offset)
+        times, kinds = build_grid(20.0, bpm, beats_per_bar, True, chromatic_beats, offset)
+        if len(times) != len(expected[0]) or not np.allclose(times, expected[0], atol=1e-9) or \
+                not np.array_equal(kinds, expected[1]):
+            mismatched.append(f"constant[{bpm}]")
+
+    # 템포 증가 + 박자 변경 맵의 클릭 일정: 블록 단위로 섞은 클릭이 한 번에 그린 클릭과 같아야 함
+    sections = (TempoSection(2, 90, 4, 2, 120), TempoSection(2, 120, 7, 3))
+    settings = Settings(sample_rate=sample_rate, tempo_map=sections)
+    handler = AudioHandler(settings, monitor_input=False)
+    record_samples = sample_rate * 12
+    countin = handler.tempo_map.countin_samples(1, sample_rate)
+    handler.start_transport(countin, record_samples)
+    rendered = np.zeros(countin + record_samples, dtype=np.float32)
+    handler.mix_clicks(rendered, 0)
+    played = []
+    for frames in [64, 100, 257] * ((countin + record_samples) // 421 + 1):
+        out = np.zeros((frames, 2), dtype=np.float32)
+        handler.callback(np.zeros((frames, 1), dtype=np.float32), out, frames, None, None)
+        played.append(out[:, 0])
+    handler.stop_transport()
+    if not np.array_equal(np.concatenate(played)[:len(rendered)], rendered):
+        mismatched.append("clicks")
+
+    # 세션 그리드의 박마다 클릭음을 다음 박까지 잘라 놓은 신호와 비교
+    beats = handler.session_grid[(handler.session_grid["kind"] != 2) & (handler.session_grid["time"] >= 0)]
+    starts = np.round(beats["time"] * sample_rate).astype(np.int64)
+    expected = np.zeros_like(rendered)
+    for start, kind, end in zip(starts, beats["kind"], np.append(starts[1:], len(expected))):
+        sound = handler.downbeat_sound if kind == 0 else handler.metronome_sound
+        n = min(len(sound), end - start)
+        expected[start:start + n] = sound[:n]
+    if not np.array_equal(handler.click_times, starts) or not np.array_equal(rendered, expected):
+        mismatched.append("schedule")
+
+    status = "OK" if not mismatched else f"MISMATCH {mismatched}"
+    print(f"[일치 검사] {'grid':9s} | 클릭 {len(beats):4d}개 | {status}")
+    if mismatched:
+        raise AssertionError("grid: 결과 불일치")
+
+
+def check_rhythm_stats(sample_rate=44100):
+    """
+    연주마다 갱신한 리듬 통계가 한 번에 계산한 값과 같은지, 알려진 빨라짐/느려짐 구간과
+    박 안 위치별 치우침(셋잇단 템포 맵 그리드)을 찾는지 확인합니다.
+    """
+    from timing import analyze_timing, settings_grid_points
+
+    mismatched = []
+    rng = np.random.default_rng(3)
+    # 90 BPM 8분음표: 10 ~ 16초는 2% 빨라지고 16 ~ 22초는 2% 느려져 제자리로 (뒷박은 항상 8ms 늦음)
+    times = np.arange(0, 40, 60 / 90 / 2)
+    phases = (np.arange(len(times)) % 2) / 2
+    errors = rng.normal(0, 0.003, len(times)) + np.where(phases == 0.5, 0.008, 0.0) \
+        - 0.02 * np.clip(times - 10, 0, 6) + 0.02 * np.clip(times - 16, 0, 6)
+    stats = RhythmStats()
+    stats.extend(times + errors, errors, phases)
+    summary = stats.summary()
+    if not np.isclose(stats.mean, errors.mean()) or not np.isclose(stats.std, errors.std()):
+        mismatched.append("moments")
+    for position in summary["positions"]:
+        part = errors[phases == position["phase"]]
+        if position["count"] != len(part) or sum(position["histogram"]) != len(part) or \
+                not np.isclose(position["mean_error_ms"], part.mean() * 1000, atol=1e-3) or \
+                not np.isclose(position["std_error_ms"], part.std() * 1000, atol=1e-3):
+            mismatched.append(f"phase[{position['phase']}]")
+    segments = summary["drift_segments"]
+    if [s["state"] for s in segments] != [DRIFT_RUSHING, DRIFT_DRAGGING] or \
+            not (segments[0]["start_s"] < 16 < segments[1]["end_s"] and segments[0]["end_s"] > 10):
+        mismatched.append("drift")
+
+    # 셋잇단 템포 맵에서 세 번째 셋잇단만 6ms 늦게 연주: 녹음 후 통계가 그 위치만 치우쳐야 함
+    settings = Settings(sample_rate=sample_rate, tempo_map=(TempoSection(4, 80, 3, 3), TempoSection(4, 120, 4, 3)))
+    num_samples = sample_rate * 20
+    points = settings_grid_points(num_samples, settings)
+    late = np.isclose(np.mod(points["beat"], 1.0), 2 / 3)
+    played = points["time"] + np.where(late, 0.006, 0.0)
+    analysis = analyze_timing(np.round(played * sample_rate).astype(np.int64), num_samples, settings,
+                              positions=played * sample_rate)
+    positions = analysis_stats(analysis, points["beat"]).summary()["positions"]
+    by_phase = {p["phase"]: p["mean_error_ms"] for p in positions}
+    expected = {round(slot / 3, 4): 6.0 if slot == 2 else 0.0 for slot in range(3)}
+    if by_phase.keys() != expected.keys() or \
+            not np.allclose([by_phase[k] for k in expected], list(expected.values()), atol=1e-3):
+        mismatched.append("tempo_map")
+
+    status = "OK" if not mismatched else f"MISMATCH {mismatched}"
+    print(f"[일치 검사] {'rhythm':9s} | 연주 {stats.count:4d}개 | {status}")
+    if mismatched:
+        raise AssertionError("rhythm: 결과 불일치")
+
+
+def bench_analyzer(results, lengths, sample_rates, loop_limit=30):
+    """
+    녹음 길이/샘플 레이트별 감지 시간과 정답 대비 정확도를 측정합니다.
+    (기존 루프는 loop_limit 초 이하에서만 측정)
+    """
+    print(f"\n[분석기] {'SR':>6} | {'길이(s)':>7} | {'루프(s)':>8} | {'벡터(s)':>8} | {'포락선(s)':>8} | {'블록(s)':>8} | "
+          f"{'재현율':>6} | {'정밀도':>6} | {'오차(ms)':>8}")
+    for sample_rate in sample_rates:
+        required = int(sample_rate * 0.05)
+        for seconds in lengths:
+            signal, truth, _ = generate_take(seconds, sample_rate, seed=seconds)
+            abs_signal = np.abs(signal)
+            key = f"analyzer.{sample_rate}.{seconds}s"
+
+            vec_time, detected = timed(find_onset_indices, abs_signal, 0.25, 0.15, required)
+            multires_time, _ = timed(find_onset_indices_multires, signal, 0.25, 0.15, required,
+                                     sample_rate // ENVELOPE_RATE)
+            # 실제 콜백과 같은 흐름(블록 단위)의 처리량은 1024 샘플 블록으로 측정
+            stream_time, _ = timed(run_streaming, signal, 0.25, 0.15, sample_rate, [1024], repeat=1)
+            score = score_detection(detected, truth, sample_rate)
+
+            results[f"{key}.vector_s"] = vec_time
+            results[f"{key}.multires_s"] = multires_time
+            results[f"{key}.stream_s"] = stream_time
+            results[f"{key}.recall"] = score["recall"]
+            results[f"{key}.precision"] = score["precision"]
+            results[f"{key}.error_ms"] = score["mean_abs_error_ms"]
+
+            loop_text = "-"
+            if seconds <= loop_limit:
+                loop_time, _ = timed(reference_peak_loop, abs_signal, 0.25, 0.15, required, repeat=1)
+                results[f"{key}.loop_s"] = loop_time
+                loop_text = f"{loop_time:.3f}"
+            print(f"         {sample_rate:6d} | {seconds:7d} | {loop_text:>8} | {vec_time:8.4f} | {multires_time:8.4f} | "
+                  f"{stream_time:8.4f} | {score['recall']:6.3f} | {score['precision']:6.3f} | "
+                  f"{score['mean_abs_error_ms']:8.3f}")
+
+
+def bench_callback(results, block_sizes, sample_rates, seconds=5, settings=None):
+    """
+    블록 크기별 AudioHandler.callback 1회 실행 시간을 블록 시간 예산(frames / SAMPLE_RATE)과 비교합니다.
+    (메트로놈 재생 + 녹음 중 상태)
+    """
+    from audio_engine import AudioHandler
+
+    settings = settings or Settings.from_config()
+
+    print(f"\n[콜백]   {'SR':>6} | {'블록':>5} | {'예산(us)':>9} | {'p50(us)':>8} | {'p99(us)':>8} | "
+          f"{'max(us)':>8} | {'p99 사용률':>9}")
+    for sample_rate in sample_rates:
+        for frames in block_sizes:
+            handler = AudioHandler(settings.replace(sample_rate=sample_rate, block_size=frames))
+            signal, _, _ = generate_take(seconds, sample_rate)
+            indata = (signal / settings.software_gain).astype(np.float32)[:, np.newaxis]
+            outdata = np.zeros((frames, 2), dtype=np.float32)
+
+            # 실제 녹음과 같은 전송 경로 (카운트인 없이 클릭 일정 재생 + 녹음)
+            handler.start_transport(0, len(signal))
+            count = len(signal) // frames
+            durations = np.empty(count)
+            for i in range(count):
+                block = indata[i * frames:(i + 1) * frames]
+                t0 = time.perf_counter()
+                handler.callback(block, outdata, frames, None, None)
+                durations[i] = time.perf_counter() - t0
+            handler.stop_transport()
+
+            budget_us = frames / sample_rate * 1e6
+            p50, p99 = np.percentile(durations, [50, 99]) * 1e6
+            peak = durations.max() * 1e6
+            key = f"callback.{sample_rate}.{frames}"
+            results[f"{key}.p50_us"] = p50
+            results[f"{key}.p99_us"] = p99
+            results[f"{key}.budget_use_p99"] = p99 / budget_us
+            print(f"         {sample_rate:6d} | {frames:5d} | {budget_us:9.1f} | {p50:8.1f} | {p99:8.1f} | "
+                  f"{peak:8.1f} | {p99 / budget_us * 100:8.1f}%")
+
+
+def bench_grid(results, lengths, densities, sample_rate=44100, settings=None):
+    """
+    그리드 생성과 연주 지점 매칭 시간을 녹음 길이와 그리드 밀도별로 측정합니다.
+    """
+    from timing import build_grid, match_onsets
+
+    settings = settings or Settings.from_config()
+
+    print(f"\n[그리드] {'길이(s)':>7} | {'음표':>4} | {'그리드':>7} | {'연주':>7} | {'생성(ms)':>9} | {'매칭(ms)':>9}")
+    for seconds in lengths:
+        for chromatic_beats in densities:
+            notes_per_beat = chromatic_beats / 4
+            _, truth, _ = generate_take(seconds, sample_rate, bpm=settings.metronome_bpm,
+                                        notes_per_beat=notes_per_beat, noise_floor=0.0)
+            build_time, (grid, _) = timed(build_grid, seconds, settings.metronome_bpm, settings.beats_per_bar,
+                                          True, chromatic_beats)
+            match_time, _ = timed(match_onsets, truth, grid, sample_rate, settings.tolerance)
+
+            key = f"grid.{seconds}s.{chromatic_beats}th"
+            results[f"{key}.build_ms"] = build_time * 1000
+            results[f"{key}.match_ms"] = match_time * 1000
+            print(f"         {seconds:7d} | {chromatic_beats:4d} | {len(grid):7d} | {len(truth):7d} | "
+                  f"{build_time * 1000:9.3f} | {match_time * 1000:9.3f}")
+
+        # 마디마다 템포가 바뀌는 템포 맵 (스피드 트레이너: 100 -> 160 BPM, 셋잇단 구간 포함)
+        tempo_map = TempoMap([TempoSection(32, 100, 4, 4, 160), TempoSection(8, 160, 7, 3)])
+        build_time, (grid, _) = timed(tempo_map.grid, seconds)
+        match_time, _ = timed(match_onsets, truth, grid, sample_rate, settings.tolerance)
+        key = f"grid.{seconds}s.ramp"
+        results[f"{key}.build_ms"] = build_time * 1000
+        results[f"{key}.match_ms"] = match_time * 1000
+        print(f"         {seconds:7d} | {'ramp':>4} | {len(grid):7d} | {len(truth):7d} | "
+              f"{build_time * 1000:9.3f} | {match_time * 1000:9.3f}")
+
+
+def bench_render(results, lengths, sample_rate=44100, settings=None):
+    """
+    분석 그림 생성 + 미리보기/전체 해상도 PNG 저장 시간을 녹음 길이별로 측정합니다. (16분음표 그리드)
+    마지막 길이로는 저장을 작업 프로세스(render_queue.RenderQueue)에 넘기는 데 걸리는 시간(분석 직후 대기 시간)도 잽니다.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from visualizer import create_waveform_with_metronome, SAVE_DPI, PREVIEW_DPI
+    from timing import analyze_timing
+    from take_store import TakeStore
+    from render_queue import RenderQueue
+
+    settings = (settings or Settings.from_config()).replace(sample_rate=sample_rate, chromatic_beats=16)
+
+    print(f"\n[렌더링] {'길이(s)':>7} | {'그림(s)':>8} | {'미리보기(s)':>10} | {'저장(s)':>8}")
+    for seconds in lengths:
+        signal, truth, _ = generate_take(seconds, sample_rate, bpm=settings.metronome_bpm)
+        t0 = time.perf_counter()
+        fig = create_waveform_with_metronome(signal, settings, detected_indices=truth)
+        build_time = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fig.savefig(io.BytesIO(), format="png", dpi=PREVIEW_DPI, bbox_inches="tight")
+        preview_time = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fig.savefig(io.BytesIO(), format="png", dpi=SAVE_DPI, bbox_inches="tight")
+        save_time = time.perf_counter() - t0
+        plt.close(fig)
+
+        results[f"render.{seconds}s.figure_s"] = build_time
+        results[f"render.{seconds}s.preview_s"] = preview_time
+        results[f"render.{seconds}s.save_s"] = save_time
+        print(f"         {seconds:7d} | {build_time:8.3f} | {preview_time:10.3f} | {save_time:8.3f}")
+
+    # 백그라운드 저장: submit 은 작업만 넘기고 바로 반환해야 함 (작업 프로세스 시작은 측정에서 제외)
+    with tempfile.TemporaryDirectory() as folder:
+        store = TakeStore(folder)
+        timing = analyze_timing(truth, len(signal), settings)
+        take_id = store.save_take(signal, settings, [truth], [truth.astype(np.float64)])
+        renderer = RenderQueue(on_saved=lambda *args: None)
+        renderer.pool.submit(int).result()
+        t0 = time.perf_counter()
+        renderer.submit(store, take_id, settings, [timing], "bench.png", output_dir=folder)
+        handoff = time.perf_counter() - t0
+        renderer.close()
+        total = time.perf_counter() - t0
+    results[f"render.{seconds}s.handoff_ms"] = handoff * 1000
+    print(f"[렌더링] {seconds}s 백그라운드 저장: 넘기기 {handoff * 1000:.1f}ms | 저장 완료까지 {total:.3f}s")
+
+
+def bench_calibration(results, lengths, sample_rate=44100, settings=None):
+    """
+    임계값 조합 전체 평가 시간을 조합마다 감지를 다시 실행하는 방식과 비교합니다.
+    """
+    settings = (settings or Settings.from_config()).replace(sample_rate=sample_rate)
+    required = settings.required_silence
+    pairs = len(DEFAULT_THRESHOLDS) * len(DEFAULT_SILENCE_THRESHOLDS)
+
+    print(f"\n[보정]   {'길이(s)':>7} | {'조합':>5} | {'반복(s)':>8} | {'일괄(s)':>8}")
+    for seconds in lengths:
+        signal, _, _ = generate_take(seconds, sample_rate, bpm=settings.metronome_bpm)
+        abs_signal = np.abs(signal)
+
+        def rerun_each_pair():
+            return [find_onset_indices(abs_signal, t, s, required)
+                    for s in DEFAULT_SILENCE_THRESHOLDS for t in DEFAULT_THRESHOLDS]
+
+        rerun_time, _ = timed(rerun_each_pair, repeat=1)
+        sweep_time, _ = timed(sweep_thresholds, signal, settings, repeat=1)
+        key = f"calibration.{seconds}s"
+        results[f"{key}.rerun_s"] = rerun_time
+        results[f"{key}.sweep_s"] = sweep_time
+        print(f"         {seconds:7d} | {pairs:5d} | {rerun_time:8.3f} | {sweep_time:8.3f}")
+
+
+def _pluck_source(sample_rate, bpm, gain):
+    """
+    16분음표마다 감쇠하는 사인파가 반복되는 입력을 블록 단위로 만드는 함수 (긴 입력을 메모리에 만들지 않음)
+    반환값: fill(block, start) -> block 에 start 샘플부터의 입력을 채움
+    """
+    period = int(round(sample_rate * 60.0 / bpm / 4))
+    t = np.arange(period) / sample_rate
+    pattern = (np.sin(2 * np.pi * 220 * t) * np.exp(-t * 60) * 0.6 / gain).astype(np.float32)
+    pattern[int(period * 0.6):] = 0
+
+    def fill(block, start):
+        np.take(pattern, np.arange(start, start + len(block)) % period, out=block[:, 0])
+    return fill
+
+
+def check_memory_budget(results, lengths, sample_rate=96000, block_size=1024, settings=None):
+    """
+    긴 녹음을 실제와 같은 경로(콜백 -> 링 버퍼 -> WAV 싱크/증분 감지 -> memmap 분석 -> 임계값 보정 -> take 저장 -> 그림)로
+    처리하며 단계별 최대 메모리 할당을 tracemalloc 으로 측정하고 MEMORY_BUDGET_MB 를 넘으면 실패합니다.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from audio_engine import AudioHandler
+    from analyzer import refine_onset_positions
+    from recording import WavFileSink
+    from timing import analyze_timing_channels
+    from take_store import TakeStore
+    from visualizer import create_waveform_with_metronome, save_analysis_image
+
+    settings = (settings or Settings.from_config()).replace(
+        sample_rate=sample_rate, block_size=block_size, chromatic_beats=16, input_channels=(0,)
+    )
+    stages = list(MEMORY_BUDGET_MB)
+    print(f"\n[메모리] {'SR':>6} | {'길이(s)':>7} | {'녹음(MB)':>8} | " +
+          " | ".join(f"{stage:>{max(7, len(stage))}}" for stage in stages) + " | (MB, 상한 " +
+          "/".join(str(MEMORY_BUDGET_MB[stage]) for stage in stages) + ")")
+
+    over = []
+    for seconds in lengths:
+        with tempfile.TemporaryDirectory() as folder:
+            peaks = {}
+
+            def measure(stage, func, *args, **kwargs):
+                tracemalloc.start()
+                try:
+                    result = func(*args, **kwargs)
+                    peaks[stage] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                finally:
+                    tracemalloc.stop()
+                return result
+
+            def record():
+                handler = AudioHandler(settings, recording_sink=WavFileSink(
+                    os.path.join(folder, "take.wav"), sample_rate), monitor_input=False)
+                fill = _pluck_source(sample_rate, settings.metronome_bpm, settings.software_gain)
+                indata = np.zeros((block_size, 1), dtype=np.float32)
+                outdata = np.zeros((block_size, 2), dtype=np.float32)
+                handler.start_transport(0, seconds * sample_rate)
+                position = 0
+                while not handler.finished.is_set():
+                    fill(indata, position)
+                    handler.callback(indata, outdata, block_size, None, None)
+                    position += block_size
+                handler.stop_transport()
+                return handler
+
+            handler = measure("record", record)
+            audio = handler.get_recorded_array()
+
+            def detect(audio):
+                # 저장된 녹음을 다시 감지하는 경로 (take_store.detect, memmap 을 포락선 + chunk 단위로 읽음)
+                found = find_onset_indices_multires(audio, settings.threshold, settings.silence_threshold,
+                                                    settings.required_silence, sample_rate // ENVELOPE_RATE)
+                return [found], [refine_onset_positions(audio, found, settings.threshold)]
+            indices, positions = measure("detect", detect, audio)
+            if indices[0].tolist() != handler.onset_detector.indices:
+                over.append(f"{seconds}s detect: 증분 감지와 결과 불일치")
+
+            def match(audio, handler):
+                grid = handler.record_grid(0.0, len(audio))
+                return analyze_timing_channels(indices, len(audio), settings, positions, grid=grid)
+            timings = measure("match", match, audio, handler)
+            measure("calibration", sweep_thresholds, audio, settings)
+            measure("store", TakeStore(os.path.join(folder, "takes")).save_take, audio, settings, indices, positions)
+
+            def render(audio):
+                fig = create_waveform_with_metronome(audio, settings, timing=timings[0])
+                save_analysis_image(fig, "memory.png", folder)
+                plt.close(fig)
+            measure("render", render, audio)
+            # 임시 폴더를 지우기 전에 memmap 을 닫음
+            del audio, handler
+
+        take_mb = seconds * sample_rate * 4 / 2 ** 20
+        key = f"memory.{sample_rate}.{seconds}s"
+        for stage in stages:
+            results[f"{key}.{stage}_mb"] = peaks[stage]
+            if peaks[stage] > MEMORY_BUDGET_MB[stage]:
+                over.append(f"{seconds}s {stage}: 최대 {peaks[stage]:.2f}MB > 상한 {MEMORY_BUDGET_MB[stage]}MB")
+        print(f"         {sample_rate:6d} | {seconds:7d} | {take_mb:8.1f} | " +
+              " | ".join(f"{peaks[stage]:{max(7, len(stage))}.2f}" for stage in stages))
+
+    if over:
+        raise AssertionError(f"메모리 상한 초과 (SR {sample_rate}): " + "; ".join(over))
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_history(path=HISTORY_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_record(results, path=HISTORY_FILE):
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"\n[기록] {path} 에 저장했습니다. (revision {record['revision'] or '-'})")
+
+
+def compare_with_previous(results, history):
+    """
+    직전 기록과 비교해 시간 지표는 SLOWDOWN_LIMIT 이상 느려진 항목,
+    정확도 지표(recall/precision)는 낮아진 항목을 퇴보로 표시합니다.
+    반환값: 퇴보 항목 수
+    """
+    if not history:
+        print("\n[비교] 이전 기록이 없습니다.")
+        return 0
+
+    previous = history[-1]["results"]
+    regressions = 0
+    print(f"\n[비교] 기준: {history[-1]['timestamp']} ({history[-1].get('revision') or '-'})")
+    for key, value in sorted(results.items()):
+        old = previous.get(key)
+        if old is None or not np.isfinite(value) or not np.isfinite(old):
+            continue
+        if key.endswith((".recall", ".precision")):
+            worse = value < old - 1e-9
+        elif key.endswith(("_s", "_ms", "_us")):
+            floor = next(f for suffix, f in NOISE_FLOOR.items() if key.endswith(suffix))
+            worse = old > 0 and value / old > SLOWDOWN_LIMIT and value - old > floor
+        else:
+            continue
+        if worse:
+            regressions += 1
+            print(f"  [퇴보] {key}: {old:.6g} -> {value:.6g}")
+    print(f"[비교] 퇴보 {regressions}건")
+    return regressions
+
+
+SUITES = ("equivalence", "analyzer", "callback", "grid", "render", "calibration", "memory")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="메트로놈 분석기 성능/정확도 측정")
+    parser.add_argument("--quick", action="store_true", help="짧은 녹음과 일부 설정만 측정")
+    parser.add_argument("--only", help=f"실행할 항목 (쉼표 구분: {', '.join(SUITES)})")
+    parser.add_argument("--save", action="store_true", help=f"결과를 {HISTORY_FILE} 에 추가")
+    parser.add_argument("--compare", action="store_true", help="직전 기록과 비교")
+    args = parser.parse_args(argv)
+
+    suites = args.only.split(",") if args.only else SUITES
+    if args.quick:
+        lengths, sample_rates, blocks = (5, 30), (44100,), (64, 256)
+        grid_lengths, render_lengths, memory_lengths = (60,), (20, 120), (30,)
+    else:
+        lengths, sample_rates, blocks = (5, 30, 120, 300), (44100, 96000), (32, 64, 128, 256)
+        grid_lengths, render_lengths, memory_lengths = (60, 600, 3600), (20, 120, 600), (60, 600)
+
+    results = {}
+    if "equivalence" in suites:
+        check_equivalence()
+    if "analyzer" in suites:
+        bench_analyzer(results, lengths, sample_rates)
+    if "callback" in suites:
+        bench_callback(results, blocks, sample_rates)
+    if "grid" in suites:
+        bench_grid(results, grid_lengths, (4, 8, 12, 16))
+    if "render" in suites:
+        bench_render(results, render_lengths)
+    if "calibration" in suites:
+        bench_calibration(results, lengths[:2])
+    if "memory" in suites:
+        check_memory_budget(results, memory_lengths)
+
+    regressions = compare_with_previous(results, load_history()) if args.compare else 0
+    if args.save:
+        save_record(results)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
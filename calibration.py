@@ -0,0 +1,227 @@
+# calibration.py
+# 임계값 자동 보정: 카운트인 동안 입력 잡음 크기를 재고, 녹음된 take 하나로
+# THRESHOLD / SILENCE_THRESHOLD 조합 전체를 한 번에 평가해 추천값을 고릅니다.
+
+import numpy as np
+from analyzer import _quiet_runs
+from recording import iter_chunks
+from timing import settings_grid, match_onsets
+
+# 기본 탐색 범위 (증폭 후 신호 크기 기준)
+DEFAULT_THRESHOLDS = np.round(np.arange(0.05, 0.801, 0.05), 2)
+DEFAULT_SILENCE_THRESHOLDS = np.round(np.arange(0.02, 0.401, 0.02), 2)
+
+# 잡음 수준(블록 최대값 p95) 대비 여유 배율: 무음/피크 임계값은 잡음 수준보다 각각 이만큼 커야 함
+SILENCE_NOISE_MARGIN = 1.25
+THRESHOLD_NOISE_MARGIN = 2.0
+SWEEP_PRINT_ROWS = 5  # 요약 출력할 상위 조합 수
+# 임계값 평가 chunk 크기: chunk 마다 피크 임계값별 후보 배열을 만들므로 recording.DEFAULT_CHUNK_SIZE 보다 작게
+SWEEP_CHUNK_SIZE = 1 << 18
+
+# 임계값 조합별 평가 결과
+SWEEP_DTYPE = np.dtype([
+    ("threshold", np.float64),
+    ("silence_threshold", np.float64),
+    ("onsets", np.int64),           # 감지된 연주 수
+    ("off_grid_ratio", np.float64), # 그리드에서 어긋난 비율
+    ("missed", np.int64),           # 놓친 그리드 지점 수
+    ("extra", np.int64),            # 추가 연주 수 (어긋남 + 같은 지점 중복)
+])
+
+
+class NoiseFloorMeter:
+    """
+    카운트인 동안의 입력 잡음 크기를 블록 단위로 기록합니다.
+    실시간 스레드에서는 미리 할당한 배열에 블록 최대값/제곱합만 기록합니다. (CallbackMonitor 와 같은 방식)
+    """
+    def __init__(self, capacity=1 << 14):
+        self.peaks = np.zeros(capacity, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self.block_count = 0
+        self.sample_count = 0
+        self.square_sum = 0.0
+
+    def update(self, block):
+        """증폭된 입력 블록 하나를 기록합니다. (오디오 콜백에서 호출, 새 배열을 만들지 않음)"""
+        if len(block) == 0:
+            return
+        self.peaks[self.block_count % len(self.peaks)] = max(block.max(), -block.min())
+        self.square_sum += float(np.dot(block, block))
+        self.sample_count += len(block)
+        self.block_count += 1
+
+    def summary(self):
+        """
+        잡음 통계를 dict 로 반환합니다. (기록이 없으면 None)
+        level 은 블록 최대값의 95 백분위수로, 카운트인 중 잠깐 현을 건드린 블록은 제외됩니다.
+        """
+        n = min(self.block_count, len(self.peaks))
+        if n == 0:
+            return None
+        peaks = self.peaks[:n]
+        return {
+            "rms": float(np.sqrt(self.square_sum / self.sample_count)),
+            "level": float(np.percentile(peaks, 95)),
+            "peak": float(peaks.max()),
+            "blocks": n,
+        }
+
+
+def _window_max(values, width):
+    """
+    길이 width 의 구간 최대값 W[i] = max(values[i:i + width]) 를 구합니다. (2배씩 늘리는 O(n log width))
+    """
+    n = len(values) - width + 1
+    if n <= 0:
+        return np.zeros(0, dtype=values.dtype)
+    result = values.copy()
+    span = 1
+    while span * 2 <= width:
+        np.maximum(result[:-span], result[span:], out=result[:-span])
+        span *= 2
+    # span 은 width 이하 최대 2의 거듭제곱: 두 구간을 겹쳐 width 를 덮음
+    return np.maximum(result[:n], result[width - span:width - span + n])
+
+
+def _walk(hits, quiet_starts, quiet_stops, required_silence, state=(0, None)):
+    """
+    피크 후보(hits)와 무음 구간 끝 위치의 구간들 [quiet_starts, quiet_stops) 로 감지 상태 머신을 따라갑니다.
+    chunk 단위로 나눠 호출할 수 있도록 state = (대기 시작 위치, 기다리는 무음 구간 끝 또는 None) 를 이월합니다.
+    반환값: (감지 인덱스 배열, 다음 state). 전체를 이어 붙이면 analyzer.find_onset_indices 와 같은 인덱스입니다.
+    """
+    pos, quiet_end = state
+    detected = []
+    while True:
+        if quiet_end is not None:
+            # 피크 다음 샘플부터 required_silence 개가 모두 무음인 첫 구간의 끝에서 다시 대기 상태
+            q = np.searchsorted(quiet_stops, quiet_end, side="right")
+            if q == len(quiet_stops):
+                break
+            pos, quiet_end = max(int(quiet_starts[q]), quiet_end) + 1, None
+        k = np.searchsorted(hits, pos)
+        if k == len(hits):
+            break
+        peak = int(hits[k])
+        detected.append(peak)
+        quiet_end = peak + required_silence
+    return np.asarray(detected, dtype=np.int64), (pos, quiet_end)
+
+
+def sweep_thresholds(signal, settings, thresholds=DEFAULT_THRESHOLDS,
+                     silence_thresholds=DEFAULT_SILENCE_THRESHOLDS, grid_offset=0.0,
+                     chunk_size=SWEEP_CHUNK_SIZE):
+    """
+    임계값 조합 전체를 녹음 하나에 대해 평가합니다.
+    신호(np.memmap 포함)는 chunk 단위로 한 번만 훑고 (절대값 + 무음 판정용 구간 최대값), 조합별로는 추린 후보만 탐색하며
+    감지 상태와 그리드 매칭 집계를 다음 chunk 로 이월합니다. (감지 인덱스를 모아 두지 않아 메모리 사용량은 chunk 크기로 제한)
+    그리드/허용 오차/샘플 레이트는 settings 값을 사용합니다. (grid_offset 은 timing.analyze_timing 참고)
+    반환값: SWEEP_DTYPE 구조화 배열 (threshold, silence_threshold 순으로 정렬)
+    """
+    thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))
+    silence_thresholds = np.sort(np.asarray(silence_thresholds, dtype=np.float64))
+    sample_rate = settings.sample_rate
+    required = settings.required_silence
+
+    grid_times, _ = settings_grid(len(signal), settings, grid_offset)
+
+    # 신호를 chunk 단위로 한 번만 훑으며 조합마다 감지 상태와 매칭 집계를 이월함 (감지 인덱스도 남기지 않음)
+    # 앞 chunk 의 마지막 required - 1 샘플을 이어 붙여 구간 최대값을 이어서 구하고,
+    # quiet_max[i] < s 이면 i ~ i+required-1 구간이 모두 무음이므로 무음 구간 끝(i + required - 1)의 연속 구간을 사용
+    shape = (len(silence_thresholds), len(thresholds))
+    states = {}
+    onsets = np.zeros(shape, dtype=np.int64)
+    off_grid = np.zeros(shape, dtype=np.int64)
+    hit_slots = np.zeros(shape, dtype=np.int64)     # 허용 오차 이내로 맞힌 서로 다른 그리드 지점 수
+    last_slot = np.full(shape, -1, dtype=np.int64)  # 마지막으로 맞힌 그리드 지점 (연주는 시간순이므로 중복 판정에 사용)
+    carry = np.zeros(0, dtype=np.float32)
+    for start, block in iter_chunks(signal, chunk_size):
+        abs_block = np.abs(block)
+        window = np.concatenate((carry, abs_block))
+        quiet_max = _window_max(window, required)
+        first_end = start - len(carry) + required - 1
+        carry = window[max(0, len(window) - (required - 1)):]
+        del window
+
+        # 가장 낮은 피크 임계값을 넘는 샘플만 후보로 남기고, 높은 임계값은 후보를 다시 거름
+        candidates = np.flatnonzero(abs_block >= thresholds[0]) if len(thresholds) else np.zeros(0, np.int64)
+        candidate_values = abs_block[candidates]
+        candidates += start
+        hits = [candidates[candidate_values >= threshold] for threshold in thresholds]
+        for k, silence_threshold in enumerate(silence_thresholds):
+            run_starts, run_stops = _quiet_runs(quiet_max, silence_threshold)
+            run_starts += first_end
+            run_stops += first_end
+            for j in range(len(thresholds)):
+                found, states[k, j] = _walk(hits[j], run_starts, run_stops, required, states.get((k, j), (0, None)))
+                if len(found) == 0:
+                    continue
+                # timing.TimingAnalysis 와 같은 집계: 어긋난 연주, 맞힌 그리드 지점 (같은 지점을 다시 맞히면 추가 연주)
+                matched = match_onsets(found, grid_times, sample_rate, settings.tolerance)
+                slots = matched["slot"][matched["on_grid"]]
+                onsets[k, j] += len(found)
+                off_grid[k, j] += len(found) - len(slots)
+                if len(slots):
+                    hit_slots[k, j] += np.count_nonzero(np.diff(slots, prepend=last_slot[k, j]))
+                    last_slot[k, j] = slots[-1]
+
+    results = np.zeros(shape, dtype=SWEEP_DTYPE)
+    results["threshold"] = thresholds[np.newaxis, :]
+    results["silence_threshold"] = silence_thresholds[:, np.newaxis]
+    results["onsets"] = onsets
+    results["off_grid_ratio"] = np.divide(off_grid, onsets, out=np.zeros(shape), where=onsets > 0)
+    results["missed"] = len(grid_times) - hit_slots
+    results["extra"] = onsets - hit_slots
+    results = results.ravel()
+
+    return results[np.lexsort((results["silence_threshold"], results["threshold"]))]
+
+
+def _rank(sweep):
+    """점수(놓친 그리드 + 추가 연주)가 낮은 순, 같으면 두 임계값 간격이 넓은 순, 피크 임계값이 높은 순"""
+    score = sweep["missed"] + sweep["extra"]
+    gap = sweep["threshold"] - sweep["silence_threshold"]
+    return np.lexsort((-sweep["threshold"], -gap, score))
+
+
+def recommend_thresholds(sweep, noise=None):
+    """
+    놓친 그리드 + 추가 연주 수가 가장 적은 조합을 추천합니다.
+    무음 임계값이 피크 임계값보다 작은 조합만 고려하고, 잡음 통계(noise)가 있으면
+    잡음에 반응하거나 무음을 판정할 수 없는 조합은 제외합니다.
+    같은 점수면 두 임계값 간격이 넓어(히스테리시스) 중복 감지에 강한 조합을 고릅니다.
+    반환값: SWEEP_DTYPE 한 행 (조건을 만족하는 조합이 없으면 None)
+    """
+    valid = (sweep["silence_threshold"] < sweep["threshold"]) & (sweep["onsets"] > 0)
+    if noise is not None:
+        valid &= sweep["threshold"] > noise["level"] * THRESHOLD_NOISE_MARGIN
+        valid &= sweep["silence_threshold"] > noise["level"] * SILENCE_NOISE_MARGIN
+    candidates = sweep[valid]
+    if len(candidates) == 0:
+        return None
+    return candidates[_rank(candidates)[0]]
+
+
+def print_calibration_summary(sweep, recommendation, noise=None):
+    """
+    잡음 측정 결과와 점수 상위 조합, 추천값을 출력합니다.
+    """
+    print(f"\n{'*'*20} 임계값 보정 ({len(sweep)}개 조합) {'*'*20}")
+    if noise is not None:
+        print(f"[잡음] RMS {noise['rms']:.4f} | 수준(p95) {noise['level']:.4f} | 최대 {noise['peak']:.4f}")
+    else:
+        print("[잡음] 카운트인 입력이 없어 잡음 측정을 건너뜁니다.")
+
+    order = _rank(sweep)
+    print(f"{'피크':>6} | {'무음':>6} | {'연주':>5} | {'어긋남':>6} | {'놓침':>5} | {'추가':>5}")
+    for entry in sweep[order[:SWEEP_PRINT_ROWS]]:
+        print(f"{entry['threshold']:6.2f} | {entry['silence_threshold']:6.2f} | {entry['onsets']:5d} | "
+              f"{entry['off_grid_ratio'] * 100:5.1f}% | {entry['missed']:5d} | {entry['extra']:5d}")
+
+    if recommendation is None:
+        print("[추천] 조건을 만족하는 조합이 없습니다. 게인 또는 탐색 범위를 확인하세요.")
+    else:
+        print(f"[추천] THRESHOLD = {recommendation['threshold']:.2f} | "
+              f"SILENCE_THRESHOLD = {recommendation['silence_threshold']:.2f}")
+    print(f"{'*'*60}\n")
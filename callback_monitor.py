@@ -0,0 +1,79 @@
+# callback_monitor.py
+import time
+import numpy as np
+
+
+class CallbackMonitor:
+    """
+    오디오 콜백의 블록별 실행 시간과 xrun(입력 오버플로/출력 언더플로)을 기록합니다.
+    실시간 스레드에서는 미리 할당한 배열에 값만 기록하고, 출력은 세션 종료 후 report() 에서 합니다.
+    capacity 를 넘는 블록은 처음부터 덮어씁니다. (최근 capacity 개 블록 유지)
+    """
+    def __init__(self, sample_rate, capacity=1 << 18):
+        self.sample_rate = sample_rate
+        self.durations = np.zeros(capacity, dtype=np.float64)
+        self.frames = np.zeros(capacity, dtype=np.int32)
+        self.reset()
+
+    def reset(self):
+        self.block_count = 0
+        self.input_overflows = 0
+        self.output_underflows = 0
+        self._start = 0.0
+
+    def begin(self, status):
+        """콜백 시작 시 호출: 상태 플래그를 집계하고 시간 측정을 시작합니다."""
+        if status:
+            if status.input_overflow:
+                self.input_overflows += 1
+            if status.output_underflow:
+                self.output_underflows += 1
+        self._start = time.perf_counter()
+
+    def end(self, frames):
+        """콜백 종료 시 호출: 실행 시간을 기록합니다."""
+        i = self.block_count % len(self.durations)
+        self.durations[i] = time.perf_counter() - self._start
+        self.frames[i] = frames
+        self.block_count += 1
+
+    def summary(self):
+        """실행 시간 통계(μs)와 블록 예산 대비 여유(headroom)를 dict 로 반환합니다."""
+        n = min(self.block_count, len(self.durations))
+        if n == 0:
+            return None
+        durations_us = self.durations[:n] * 1e6
+        budgets_us = self.frames[:n] / self.sample_rate * 1e6
+        usage = durations_us / budgets_us
+        p50, p90, p99, p999 = np.percentile(durations_us, [50, 90, 99, 99.9])
+        return {
+            "blocks": self.block_count,
+            "budget_us": float(np.median(budgets_us)),
+            "p50_us": p50, "p90_us": p90, "p99_us": p99, "p999_us": p999,
+            "max_us": float(durations_us.max()),
+            "headroom_p99": 1.0 - float(np.percentile(usage, 99)),
+            "over_budget": int(np.count_nonzero(usage >= 1.0)),
+            "input_overflows": self.input_overflows,
+            "output_underflows": self.output_underflows,
+        }
+
+    def report(self, bins=(0.1, 0.25, 0.5, 0.75, 1.0)):
+        """세션 종료 후 백분위수, 여유율, xrun 횟수, 예산 사용률 히스토그램을 출력합니다."""
+        stats = self.summary()
+        if stats is None:
+            print("[콜백] 기록된 블록이 없습니다.")
+            return
+
+        print(f"\n[콜백] 블록 {stats['blocks']}개 | 예산 {stats['budget_us']:.0f}us")
+        print(f"[콜백] p50 {stats['p50_us']:.0f}us | p90 {stats['p90_us']:.0f}us | "
+              f"p99 {stats['p99_us']:.0f}us | p99.9 {stats['p999_us']:.0f}us | max {stats['max_us']:.0f}us")
+        print(f"[콜백] p99 여유율 {stats['headroom_p99'] * 100:.1f}% | 예산 초과 {stats['over_budget']}회 | "
+              f"입력 오버플로 {stats['input_overflows']}회 | 출력 언더플로 {stats['output_underflows']}회")
+
+        # 예산 사용률 구간별 블록 수
+        n = min(self.block_count, len(self.durations))
+        usage = self.durations[:n] / (self.frames[:n] / self.sample_rate)
+        edges = (0.0,) + tuple(bins) + (np.inf,)
+        counts, _ = np.histogram(usage, bins=edges)
+        labels = [f"<{int(b * 100)}%" for b in bins] + [f">={int(bins[-1] * 100)}%"]
+        print("[콜백] 예산 사용률 분포: " + " | ".join(f"{l} {c}" for l, c in zip(labels, counts)))
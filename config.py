@@ -18,3 +18,6 @@ TOLERANCE = 0.06
 
 THRESHOLD = 0.25
 SILENCE_THRESHOLD = 0.15
+
+# 로그 출력 단계 (0: 총 개수만, 1: 요약, 2: 모든 피크 출력)
+LOG_VERBOSITY = 1
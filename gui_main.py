@@ -1,6 +1,5 @@
 import os
-import sys
-import subprocess
+import queue
 import threading
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
@@ -12,25 +11,13 @@ try:
 except ImportError:
     sd = None
 
-# 초기 기본값을 가져오기 위해 임포트
-try:
-    import config
-except ImportError:
-    class DummyConfig:
-        ASIO_DEVICE_ID = 0
-        SAMPLE_RATE = 44100
-        BLOCK_SIZE = 64
-        RECORD_DURATION = 10
-        SOFTWARE_GAIN = 60.0
-        METRONOME_BPM = 100
-        COUNTIN_BARS = 2
-        BEATS_PER_BAR = 4
-        CHROMATIC_ENABLED = True
-        CHROMATIC_BEATS = 4
-        TOLERANCE = 0.03
-        THRESHOLD = 0.25
-        SILENCE_THRESHOLD = 0.1
-    config = DummyConfig()
+# 저장된 설정(settings.json) 또는 config.py 기본값을 불러오기 위해 임포트
+from settings import Settings, load_settings, save_settings
+from worker import WorkerClient
+
+LOG_POLL_MS = 50              # 로그 큐를 비우는 주기
+MAX_RECORDS_PER_DRAIN = 5000  # 한 번에 처리할 최대 기록 수 (나머지는 다음 주기에)
+MAX_LOG_LINES = 2000          # 로그 창에 유지할 최대 줄 수
 
 class MetronomeLauncher:
     def __init__(self, root):
@@ -44,10 +31,22 @@ class MetronomeLauncher:
         self._setup_styles()
         
         # 설정값 변수 초기화
+        try:
+            self.settings = load_settings()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("설정 오류", f"settings.json 을 읽을 수 없어 기본값을 사용합니다: {e}")
+            self.settings = Settings.from_config()
         self._init_vars()
         self._build_ui()
         
-        self.process = None
+        # 워커 스레드에서 온 로그/이벤트는 큐에 쌓고 Tk 메인 루프에서 일괄 처리
+        self.records = queue.SimpleQueue()
+        self.root.after(LOG_POLL_MS, self.drain_records)
+
+        # 분석 워커는 한 번만 실행해 두고 재사용 (임포트/장치 초기화 비용을 첫 실행에서만 지불)
+        self.worker = WorkerClient(on_output=self.relay_worker_output, on_event=self.on_worker_event)
+        self.worker.start()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # 시작 시 장치 목록 출력
         self.root.after(100, self.check_and_print_devices)
@@ -62,16 +61,22 @@ class MetronomeLauncher:
         self.style.map("Run.TButton", background=[('active', '#341f97'), ('disabled', '#cccccc')])
 
     def _init_vars(self):
-        self.asio_id_var = tk.IntVar(value=config.ASIO_DEVICE_ID)
-        self.sample_rate_var = tk.IntVar(value=config.SAMPLE_RATE)
-        self.block_size_var = tk.IntVar(value=config.BLOCK_SIZE)
-        self.duration_var = tk.IntVar(value=config.RECORD_DURATION)
-        self.gain_var = tk.DoubleVar(value=config.SOFTWARE_GAIN)
-        self.bpm_var = tk.IntVar(value=config.METRONOME_BPM)
-        self.chromatic_beats_var = tk.IntVar(value=config.CHROMATIC_BEATS)
-        self.tolerance_var = tk.DoubleVar(value=config.TOLERANCE)
-        self.threshold_var = tk.DoubleVar(value=config.THRESHOLD)
-        self.silence_threshold_var = tk.DoubleVar(value=config.SILENCE_THRESHOLD)
+        self.asio_id_var = tk.IntVar(value=self.settings.asio_device_id)
+        self.input_channels_var = tk.StringVar(value=", ".join(str(ch) for ch in self.settings.input_channels))
+        self.sample_rate_var = tk.IntVar(value=self.settings.sample_rate)
+        self.block_size_var = tk.IntVar(value=self.settings.block_size)
+        self.duration_var = tk.IntVar(value=self.settings.record_duration)
+        self.gain_var = tk.DoubleVar(value=self.settings.software_gain)
+        self.bpm_var = tk.IntVar(value=self.settings.metronome_bpm)
+        self.chromatic_beats_var = tk.IntVar(value=self.settings.chromatic_beats)
+        self.tolerance_var = tk.DoubleVar(value=self.settings.tolerance)
+        self.threshold_var = tk.DoubleVar(value=self.settings.threshold)
+        self.silence_threshold_var = tk.DoubleVar(value=self.settings.silence_threshold)
+        self.verbosity_var = tk.IntVar(value=self.settings.log_verbosity)
+        self.live_view_var = tk.BooleanVar(value=self.settings.live_view)
+        self.calibrate_var = tk.BooleanVar(value=False)
+        self.grid_label_var = tk.StringVar(value=self.settings.grid_label)
+        self.recommendation = None  # 마지막 보정 실행의 임계값 추천값
 
     def check_and_print_devices(self):
         """현재 시스템의 ASIO 장치 목록을 로그 창에 출력합니다."""
@@ -140,13 +145,28 @@ class MetronomeLauncher:
         g1 = ttk.LabelFrame(sf, text=" 하드웨어 설정 ", padding=10)
         g1.pack(fill=tk.X, padx=15, pady=5)
         self._add_field(g1, "ASIO Device ID", self.asio_id_var, "아래 로그 창에서 확인한 ID 번호를 입력하세요")
+        self._add_field(g1, "Input Channels", self.input_channels_var,
+                        "녹음할 입력 채널 번호 (0부터, 예: 0, 1 → 두 연주자 동시 녹음, 첫 채널이 기준)")
         self._add_dropdown(g1, "Sample Rate", self.sample_rate_var, [44100, 48000, 88200, 96000], "인터페이스 설정과 동일해야 함")
         self._add_dropdown(g1, "Block Size", self.block_size_var, [32, 64, 128, 256, 512, 1024], "인터페이스 설정과 동일해야 함")
+        self.latency_button = ttk.Button(g1, text="왕복 지연 측정 (루프백)", command=self.measure_latency)
+        self.latency_button.pack(fill=tk.X, pady=4, padx=10)
+        ttk.Label(g1, text="- 출력 단자를 입력 단자에 연결한 뒤 실행하면 장치/샘플 레이트/블록 크기별로 저장되어 그리드가 자동 보정됨",
+                  style="Desc.TLabel", wraplength=460).pack(side=tk.LEFT, padx=10)
 
         # 2. 녹음 및 음악 설정
         g2 = ttk.LabelFrame(sf, text=" 녹음 및 음악 설정 ", padding=10)
         g2.pack(fill=tk.X, padx=15, pady=5)
         self._add_field(g2, "Metronome BPM", self.bpm_var, "템포")
+        tempo_row = ttk.Frame(g2)
+        tempo_row.pack(fill=tk.X, pady=4, padx=10)
+        ttk.Label(tempo_row, text="Grid", width=22).pack(side=tk.LEFT)
+        ttk.Label(tempo_row, textvariable=self.grid_label_var).pack(side=tk.LEFT)
+        self.clear_tempo_map_button = ttk.Button(tempo_row, text="템포 맵 지우기", command=self.clear_tempo_map,
+                                                 state=tk.NORMAL if self.settings.tempo_map else tk.DISABLED)
+        self.clear_tempo_map_button.pack(side=tk.RIGHT)
+        ttk.Label(g2, text="- settings.json 의 템포 맵이 있으면 BPM/Chromatic Beats 대신 사용 (값을 바꾸면 템포 맵은 지워짐)",
+                  style="Desc.TLabel", wraplength=460).pack(side=tk.LEFT, padx=10)
         self._add_field(g2, "Record Duration (s)", self.duration_var, "녹음 시간")
         self._add_field(g2, "Software Gain", self.gain_var, "기타 증폭")
 
@@ -157,6 +177,17 @@ class MetronomeLauncher:
         self._add_field(g3, "Tolerance (s)", self.tolerance_var, "민감도")
         self._add_field(g3, "Threshold", self.threshold_var, "피크 임계값")
         self._add_field(g3, "Silence Threshold", self.silence_threshold_var, "무음 임계값")
+        self._add_dropdown(g3, "Log Verbosity", self.verbosity_var, [0, 1, 2], "0: 개수만, 1: 요약, 2: 모든 피크")
+        ttk.Checkbutton(g3, text="녹음 중 실시간 타이밍 보기", variable=self.live_view_var).pack(anchor=tk.W, pady=4, padx=10)
+
+        calib_row = ttk.Frame(g3)
+        calib_row.pack(fill=tk.X, pady=4, padx=10)
+        ttk.Checkbutton(calib_row, text="임계값 자동 보정", variable=self.calibrate_var).pack(side=tk.LEFT)
+        self.apply_button = ttk.Button(calib_row, text="추천 임계값 적용", state=tk.DISABLED,
+                                       command=self.apply_recommendation)
+        self.apply_button.pack(side=tk.RIGHT)
+        ttk.Label(g3, text="- 카운트인 잡음과 녹음으로 Threshold/Silence Threshold 추천값 계산",
+                  style="Desc.TLabel").pack(side=tk.LEFT, padx=10)
 
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -171,71 +202,180 @@ class MetronomeLauncher:
         self.run_button = ttk.Button(self.root, text="설정 저장 및 분석 시작", style="Run.TButton", command=self.save_and_run)
         self.run_button.pack(fill=tk.X, padx=15, pady=15)
 
-    def save_config(self):
-        """UI의 값을 config.py 파일로 물리적으로 저장합니다."""
-        config_content = f"""# config.py (Launcher에 의해 자동 생성됨)
-
-ASIO_DEVICE_ID = {self.asio_id_var.get()}
-SAMPLE_RATE = {self.sample_rate_var.get()}
-BLOCK_SIZE = {self.block_size_var.get()}
-
-RECORD_DURATION = {self.duration_var.get()}
-SOFTWARE_GAIN = {self.gain_var.get()}
+    @staticmethod
+    def _parse_channels(text):
+        """'0, 1' 형식의 채널 목록을 튜플로 변환합니다. (잘못된 값은 다른 입력 오류와 같이 TclError)"""
+        try:
+            channels = tuple(int(part) for part in text.replace(",", " ").split())
+        except ValueError:
+            channels = ()
+        if not channels or min(channels) < 0 or len(set(channels)) != len(channels):
+            raise tk.TclError(f"입력 채널 '{text}' 을 해석할 수 없습니다.")
+        return channels
 
-METRONOME_BPM = {self.bpm_var.get()}
-COUNTIN_BARS = {config.COUNTIN_BARS}
-BEATS_PER_BAR = {config.BEATS_PER_BAR}
+    def collect_settings(self):
+        """UI의 값으로 새 설정 객체를 만듭니다. (BPM/그리드 단위를 바꾸면 템포 맵은 지움)"""
+        grid = {"metronome_bpm": self.bpm_var.get(), "chromatic_beats": self.chromatic_beats_var.get()}
+        changed = {name: value for name, value in grid.items() if value != getattr(self.settings, name)}
+        return self.settings.replace_grid(
+            asio_device_id=self.asio_id_var.get(),
+            input_channels=self._parse_channels(self.input_channels_var.get()),
+            sample_rate=self.sample_rate_var.get(),
+            block_size=self.block_size_var.get(),
+            record_duration=self.duration_var.get(),
+            software_gain=self.gain_var.get(),
+            tolerance=self.tolerance_var.get(),
+            threshold=self.threshold_var.get(),
+            silence_threshold=self.silence_threshold_var.get(),
+            log_verbosity=self.verbosity_var.get(),
+            live_view=self.live_view_var.get(),
+            **changed,
+        )
 
-CHROMATIC_ENABLED = {config.CHROMATIC_ENABLED}
-CHROMATIC_BEATS = {self.chromatic_beats_var.get()}
+    def _show_grid(self):
+        self.grid_label_var.set(self.settings.grid_label)
+        self.clear_tempo_map_button.config(state=tk.NORMAL if self.settings.tempo_map else tk.DISABLED)
 
-TOLERANCE = {self.tolerance_var.get()}
+    def clear_tempo_map(self):
+        """템포 맵을 지워 BPM/Chromatic Beats 로 일정한 그리드를 사용합니다. (다음 실행 시 settings.json 에 저장)"""
+        self.settings = self.settings.replace(tempo_map=())
+        self._show_grid()
+        self.append_log("[정보] 템포 맵을 지웠습니다. BPM/Chromatic Beats 설정으로 그리드를 만듭니다.\n")
 
-THRESHOLD = {self.threshold_var.get()}
-SILENCE_THRESHOLD = {self.silence_threshold_var.get()}
-"""
+    def save_and_run(self):
         try:
-            with open("config.py", "w", encoding="utf-8") as f:
-                f.write(config_content)
-        except Exception as e:
-            messagebox.showerror("저장 오류", f"config.py 저장 중 오류 발생: {e}")
+            settings = self.collect_settings()
+        except tk.TclError as e:
+            messagebox.showerror("입력 오류", f"설정값을 확인하세요: {e}")
+            return
+        try:
+            save_settings(settings)
+        except OSError as e:
+            messagebox.showerror("저장 오류", f"settings.json 저장 중 오류 발생: {e}")
+        self.settings = settings
+        self._show_grid()
 
-    def save_and_run(self):
-        self.save_config()
         self.log_area.delete(1.0, tk.END)
-        self.log_area.insert(tk.END, "[정보] 설정을 저장했습니다.\n")
+        self.append_log("[정보] 설정을 저장하고 워커로 전송합니다.\n")
         self.run_button.config(state=tk.DISABLED)
-        
-        thread = threading.Thread(target=self.relay_main_output, daemon=True)
+
+        thread = threading.Thread(target=self.submit_run, args=(settings, self.calibrate_var.get()), daemon=True)
         thread.start()
 
-    def relay_main_output(self):
-        """main.py를 서브프로세스로 실행하고 표준 출력을 GUI에 중계합니다."""
+    def measure_latency(self):
         try:
-            self.process = subprocess.Popen(
-                [sys.executable, "-u", "main.py"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                encoding='utf-8'
-            )
-
-            for line in self.process.stdout:
-                self.log_area.insert(tk.END, line)
-                self.log_area.see(tk.END)
-            
-            self.process.wait()
-            
-            if self.process.returncode == 0:
-                self.log_area.insert(tk.END, "\n--- 분석 프로세스가 정상 종료되었습니다. ---\n")
-            else:
-                self.log_area.insert(tk.END, f"\n--- 프로세스가 종료되었습니다 (코드: {self.process.returncode}) ---\n")
+            settings = self.collect_settings()
+        except tk.TclError as e:
+            messagebox.showerror("입력 오류", f"설정값을 확인하세요: {e}")
+            return
+        self.append_log("[정보] 루프백 왕복 지연 측정을 시작합니다.\n")
+        self.run_button.config(state=tk.DISABLED)
+        self.latency_button.config(state=tk.DISABLED)
+        threading.Thread(target=self.submit_latency, args=(settings,), daemon=True).start()
 
+    def submit_latency(self, settings):
+        try:
+            self.worker.submit_latency(settings)
         except Exception as e:
-            messagebox.showerror("실행 오류", f"main.py 실행 중 오류 발생: {e}")
-        finally:
+            self.records.put(("error", f"지연 측정 요청 중 오류 발생: {e}"))
+
+    def submit_run(self, settings, calibrate=False):
+        """워커에 분석 실행을 요청합니다. (워커가 종료되었으면 새로 실행)"""
+        try:
+            self.worker.submit(settings, calibrate=calibrate)
+        except Exception as e:
+            self.records.put(("error", f"분석 워커 실행 중 오류 발생: {e}"))
+
+    def relay_worker_output(self, line):
+        """워커의 표준 출력 한 줄을 기록 큐에 넣습니다. (워커 중계 스레드에서 호출)"""
+        self.records.put(("log", line))
+
+    def on_worker_event(self, event):
+        """워커가 보낸 완료/종료 이벤트를 기록 큐에 넣습니다. (워커 중계 스레드에서 호출)"""
+        self.records.put(("event", event))
+
+    def drain_records(self):
+        """
+        Tk 메인 루프에서 주기적으로 기록 큐를 비웁니다.
+        여러 줄을 한 번에 삽입하고, 위젯 조작은 모두 이 메인 스레드에서만 수행합니다.
+        """
+        pending = []
+        for _ in range(MAX_RECORDS_PER_DRAIN):
+            try:
+                kind, payload = self.records.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "log":
+                pending.append(payload)
+            elif kind == "event":
+                pending.append(self.handle_worker_event(payload))
+            elif kind == "error":
+                self.append_log("".join(pending))
+                pending = []
+                messagebox.showerror("실행 오류", payload)
+                self.run_button.config(state=tk.NORMAL)
+                self.latency_button.config(state=tk.NORMAL)
+
+        if pending:
+            self.append_log("".join(pending))
+        self.root.after(LOG_POLL_MS, self.drain_records)
+
+    def handle_worker_event(self, event):
+        """완료/종료 이벤트에 따라 버튼 상태를 바꾸고 로그에 남길 문자열을 반환합니다."""
+        kind = event.get("event")
+        if kind == "done":
+            self.run_button.config(state=tk.NORMAL)
+            if event.get("recommendation"):
+                self.recommendation = event["recommendation"]
+                self.apply_button.config(state=tk.NORMAL)
+            if event.get("ok"):
+                return "\n--- 분석이 정상 종료되었습니다. ---\n"
+            return "\n--- 분석이 실패했습니다. ---\n"
+        if kind == "image_saved":
+            # 분석 완료 후 워커의 작업 프로세스가 형식별로 저장을 마칠 때마다 도착 (다음 분석과 무관)
+            if event.get("ok"):
+                return f"\n--- 분석 이미지 저장 완료 ({event['format']}): {event['path']} ---\n"
+            return f"\n--- 분석 이미지 저장 실패 ({event['format']}): {event.get('error')} ---\n"
+        if kind == "latency_done":
             self.run_button.config(state=tk.NORMAL)
+            self.latency_button.config(state=tk.NORMAL)
+            if event.get("ok"):
+                return f"\n--- 왕복 지연 {event['latency_ms']:.2f}ms 저장 완료 (다음 분석부터 그리드 보정) ---\n"
+            return "\n--- 왕복 지연 측정에 실패했습니다. ---\n"
+        if kind == "exited":
+            self.run_button.config(state=tk.NORMAL)
+            self.latency_button.config(state=tk.NORMAL)
+            return f"\n--- 워커 프로세스가 종료되었습니다 (코드: {event.get('returncode')}) ---\n"
+        return ""
+
+    def apply_recommendation(self):
+        """마지막 보정 결과의 추천 임계값을 입력란에 반영하고 settings.json 에 저장합니다."""
+        if self.recommendation is None:
+            return
+        self.threshold_var.set(self.recommendation["threshold"])
+        self.silence_threshold_var.set(self.recommendation["silence_threshold"])
+        try:
+            self.settings = self.collect_settings()
+            save_settings(self.settings)
+        except (tk.TclError, OSError) as e:
+            messagebox.showerror("저장 오류", f"추천값 저장 중 오류 발생: {e}")
+            return
+        self.append_log(f"[정보] 추천 임계값 적용: Threshold {self.recommendation['threshold']:.2f} / "
+                        f"Silence Threshold {self.recommendation['silence_threshold']:.2f}\n")
+
+    def append_log(self, text):
+        """로그 창 끝에 문자열을 추가하고, MAX_LOG_LINES 를 넘는 오래된 줄은 잘라냅니다."""
+        if not text:
+            return
+        self.log_area.insert(tk.END, text)
+        line_count = int(self.log_area.index("end-1c").split(".")[0])
+        if line_count > MAX_LOG_LINES:
+            self.log_area.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
+        self.log_area.see(tk.END)
+
+    def on_close(self):
+        self.worker.close()
+        self.root.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
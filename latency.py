@@ -0,0 +1,163 @@
+# latency.py
+# 왕복 지연(출력 -> 입력) 측정과 그리드 위치 보정:
+# 메트로놈 클릭을 루프백(출력 단자를 입력 단자에 케이블로 연결)으로 녹음해 FFT 상호상관으로 지연을 재고,
+# 장치/샘플 레이트/블록 크기 조합별로 저장해 두었다가 분석 때 그리드를 자동으로 옮깁니다.
+#
+# 실행: python latency.py                      (실제 장치, settings.json 의 장치/샘플 레이트/블록 크기)
+#       python latency.py --simulate-delay 300  (가상 루프백 장치 시험)
+
+import os
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+LATENCY_FILE = "latency.json"
+MEASURE_SECONDS = 3.0   # 측정 녹음 길이
+MAX_LATENCY_MS = 250    # 탐색할 최대 지연 (클릭 한 박 간격보다 작게 제한됨)
+MIN_SCORE = 0.3         # 이보다 상관값이 낮으면 루프백 연결이 없는 것으로 보고 저장하지 않음
+
+
+def latency_key(settings):
+    """지연은 장치와 샘플 레이트, 블록 크기에 따라 달라지므로 세 값의 조합으로 구분합니다."""
+    return f"{settings.asio_device_id}:{settings.sample_rate}:{settings.block_size}"
+
+
+def load_latencies(path=LATENCY_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_latency(settings, path=LATENCY_FILE):
+    """settings 조합에 저장된 왕복 지연(샘플 수)을 반환합니다. (측정값이 없으면 None)"""
+    entry = load_latencies(path).get(latency_key(settings))
+    return None if entry is None else entry["latency_samples"]
+
+
+def save_latency(settings, latency_samples, score, path=LATENCY_FILE):
+    """측정값을 기존 기록에 더해 저장합니다. (임시 파일에 쓴 뒤 교체)"""
+    entries = load_latencies(path)
+    entries[latency_key(settings)] = {
+        "latency_samples": float(latency_samples),
+        "latency_ms": float(latency_samples / settings.sample_rate * 1000),
+        "score": float(score),
+        "measured": datetime.now().isoformat(timespec="seconds"),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def estimate_delay(recorded, reference, max_lag):
+    """
+    FFT 상호상관으로 reference 가 recorded 에 몇 샘플 늦게 나타나는지 구합니다. (0 ~ max_lag)
+    최대값 주변을 포물선 보간해 샘플 이하 해상도로 반환합니다.
+    반환값: (지연 샘플 수, 정규화 상관값 0 ~ 1)
+    """
+    recorded = np.asarray(recorded, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    nfft = 1 << (len(recorded) + len(reference) - 1).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(recorded, nfft) * np.conj(np.fft.rfft(reference, nfft)), nfft)
+    lags = corr[:max_lag + 1]
+
+    k = int(np.argmax(lags))
+    frac = 0.0
+    if 0 < k < len(lags) - 1:
+        left, peak, right = lags[k - 1], lags[k], lags[k + 1]
+        curvature = left - 2 * peak + right
+        if curvature < 0:
+            frac = 0.5 * (left - right) / curvature
+
+    norm = np.linalg.norm(recorded) * np.linalg.norm(reference)
+    score = float(lags[k] / norm) if norm > 0 else 0.0
+    return float(k + frac), score
+
+
+def measure_round_trip_latency(settings, backend, seconds=MEASURE_SECONDS):
+    """
+    AudioHandler 의 클릭을 재생하며 루프백 입력을 녹음하고, 출력한 클릭과 상호상관해 왕복 지연을 측정합니다.
+    입력 모니터링은 꺼서 루프백으로 되먹임되지 않게 합니다.
+    다채널 설정이어도 첫 번째(기준) 입력 채널 하나만 녹음해 측정합니다.
+    반환값: (지연 샘플 수, 정규화 상관값)
+    """
+    from audio_engine import AudioHandler, TRANSPORT_TIMEOUT_MS
+
+    settings = settings.replace(software_gain=1.0, input_channels=settings.input_channels[:1])
+    handler = AudioHandler(settings, monitor_input=False)
+    channels = backend.query_channels(settings.asio_device_id)
+    handler.check_channels(channels)
+    with backend.open_stream(
+        device=settings.asio_device_id,
+        samplerate=settings.sample_rate,
+        blocksize=settings.block_size,
+        channels=channels,
+        callback=handler.callback,
+    ):
+        # 카운트인 없이 클릭 시작과 같은 샘플부터 녹음
+        handler.start_transport(0, int(seconds * settings.sample_rate))
+        backend.wait(handler.finished, int(seconds * 1000) + TRANSPORT_TIMEOUT_MS)
+        handler.stop_transport()
+
+    recorded = handler.get_recorded_array()
+    if len(recorded) == 0 or handler.record_start_click_pos is None:
+        return 0.0, 0.0
+
+    # 실제로 출력한 클릭 신호를 클릭 일정으로 다시 만듦 (카운트인이 없으므로 녹음 첫 샘플 = 세션 위치 0)
+    reference = np.zeros(len(recorded), dtype=np.float32)
+    handler.mix_clicks(reference, 0)
+    # 클릭은 한 박마다 반복되므로 한 박 간격 이상의 지연은 구분할 수 없음
+    max_lag = min(int(settings.sample_rate * MAX_LATENCY_MS / 1000), handler.beat_interval_samples - 1)
+    return estimate_delay(recorded, reference, max_lag)
+
+
+def grid_offset(settings, click_pos, latency_samples):
+    """
+    녹음 시작 기준 첫 마디 시작 시각(초)을 계산합니다. (timing.analyze_timing 의 grid_offset)
+    - click_pos: 녹음 첫 샘플에서의 클릭 루프 위치 (마디 시작이 그만큼 앞에 있음)
+    - latency_samples: 왕복 지연 (클릭을 듣고 친 소리는 그만큼 늦게 녹음됨, 측정값이 없으면 None)
+    """
+    return ((latency_samples or 0.0) - (click_pos or 0)) / settings.sample_rate
+
+
+def calibrate_latency(settings, backend, seconds=MEASURE_SECONDS, path=LATENCY_FILE):
+    """
+    왕복 지연을 측정해 결과를 출력하고, 상관값이 충분하면 저장합니다.
+    반환값: (지연 샘플 수, 정규화 상관값, 저장 여부)
+    """
+    latency, score = measure_round_trip_latency(settings, backend, seconds)
+    print(f"[지연] {latency_key(settings)} | {latency:.1f} 샘플 "
+          f"({latency / settings.sample_rate * 1000:.2f}ms) | 상관값 {score:.2f}")
+    if score < MIN_SCORE:
+        print("[지연] 상관값이 낮아 저장하지 않습니다. 출력과 입력이 루프백으로 연결되어 있는지 확인하세요.")
+        return latency, score, False
+    save_latency(settings, latency, score, path)
+    print(f"[지연] {path} 에 저장했습니다.")
+    return latency, score, True
+
+
+def main(argv=None):
+    from settings import load_settings
+    from stream_backend import SoundDeviceBackend, SimulatedBackend
+
+    parser = argparse.ArgumentParser(description="루프백으로 왕복 지연을 측정해 저장")
+    parser.add_argument("--seconds", type=float, default=MEASURE_SECONDS, help="측정 녹음 길이 (초)")
+    parser.add_argument("--simulate-delay", type=int, metavar="SAMPLES",
+                        help="실제 장치 대신 지정한 샘플 수만큼 지연되는 가상 루프백 사용")
+    args = parser.parse_args(argv)
+
+    settings = load_settings()
+    if args.simulate_delay is not None:
+        backend = SimulatedBackend(loopback_delay=args.simulate_delay)
+    else:
+        backend = SoundDeviceBackend()
+
+    _, _, saved = calibrate_latency(settings, backend, args.seconds)
+    return 0 if saved else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,169 @@
+# live_view.py
+# 녹음 중 실시간 타이밍 보기: 감지기(StreamingOnsetDetector)의 events 큐로 들어온 연주 지점을
+# 마디 안 위치(가로) / 그리드 대비 부호 있는 오차(세로)로 표시합니다.
+# 그리드는 클릭 재생에 쓰는 세션 그리드(AudioHandler.session_grid)를 이진 탐색합니다.
+# 채널마다 rhythm_stats.RhythmStats 를 함께 갱신해 빨라짐/느려짐을 표시합니다. (녹음 후 분석과 같은 통계)
+# 배경(그리드, 허용 오차 구간)은 한 번만 그리고 매 프레임 점과 글자만 blitting 으로 다시 그리므로
+# 갱신 비용이 녹음 길이와 무관하게 일정하고, 오디오 콜백과는 큐로만 연결되어 콜백을 막지 않습니다.
+
+import time
+import queue
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgb
+
+from tempo_map import GRID_SUB
+from rhythm_stats import RhythmStats, DRIFT_RUSHING, DRIFT_DRAGGING
+
+LIVE_FPS = 20            # 화면 갱신 주기 (초당 프레임)
+MAX_LIVE_POINTS = 64     # 화면에 남길 최근 연주 지점 수 (오래된 점일수록 흐리게)
+MAX_EVENTS_PER_FRAME = 256  # 한 프레임에 처리할 최대 이벤트 수 (나머지는 다음 프레임에)
+
+# 빨라짐/느려짐 표시
+DRIFT_TEXT = {DRIFT_RUSHING: " | Rushing", DRIFT_DRAGGING: " | Dragging"}
+
+# 채널별 점 색 (정박 / 어긋남)
+CHANNEL_COLORS = [("#2ECC71", "#E74C3C"), ("#3498DB", "#E67E22"), ("#9B59B6", "#F1C40F")]
+
+
+class LiveTimingView:
+    """
+    녹음 중 최근 연주 지점의 타이밍 오차를 표시하는 창입니다. (메인 스레드에서 update/run_for 호출)
+    handler: audio_engine.AudioHandler (start_transport 이후, 감지기 events 큐와 세션 그리드를 읽음)
+    latency_samples: 저장된 왕복 지연 (latency.load_latency, 없으면 None)
+    """
+    def __init__(self, handler, settings, latency_samples=None, fps=LIVE_FPS, max_points=MAX_LIVE_POINTS):
+        self.handler = handler
+        self.settings = settings
+        self.latency_samples = latency_samples
+        self.frame_ms = max(1, int(1000 / fps))
+
+        self.grid = handler.session_grid
+        self.bar_beats = handler.tempo_map.max_beats_per_bar
+
+        # 최근 연주 지점 (고정 크기 순환 버퍼)
+        self.positions = np.zeros(max_points)   # 마디 안 위치 (박)
+        self.errors_ms = np.zeros(max_points)
+        self.channels = np.zeros(max_points, dtype=np.int64)
+        self.on_grid = np.zeros(max_points, dtype=bool)
+        self.count = 0
+        self.latest_text = ""
+        # 채널별 리듬 통계 (녹음 후 분석과 같은 RhythmStats, 연주마다 O(1) 갱신)
+        self.stats = [RhythmStats() for _ in handler.onset_detectors]
+        # (채널, 어긋남 여부) -> RGB
+        self._palette = np.array([[to_rgb(good), to_rgb(bad)] for good, bad in CHANNEL_COLORS])
+
+        self._build_figure()
+
+    def _build_figure(self):
+        tolerance_ms = self.settings.tolerance * 1000
+        # 가장 넓은 그리드 간격의 절반까지 표시
+        spacing = np.diff(self.grid["time"]).max() if len(self.grid) > 1 else 0.0
+        limit_ms = max(spacing * 500, tolerance_ms * 1.5)
+
+        self.fig, ax = plt.subplots(figsize=(9, 4))
+        self.ax = ax
+        ax.set_xlim(0, self.bar_beats)
+        ax.set_ylim(-limit_ms, limit_ms)
+        ax.axhspan(-tolerance_ms, tolerance_ms, color="#2ECC71", alpha=0.12, label="Tolerance")
+        ax.axhline(0, color="#333333", linewidth=1.0)
+        sub_lines = np.unique(self.grid["beat"][self.grid["kind"] == GRID_SUB])
+        ax.vlines(sub_lines, -limit_ms, limit_ms, colors="#F18B8B", linewidth=0.8, alpha=0.5)
+        ax.vlines(np.arange(self.bar_beats + 1), -limit_ms, limit_ms, colors="#FF0000", linewidth=1.2, alpha=0.7)
+        ax.set_xlabel("Position in bar (beats)")
+        ax.set_ylabel("Error (ms, + = late)")
+        ax.set_title(f"Live Timing | {self.handler.tempo_map.label}", fontweight="bold")
+
+        # 매 프레임 다시 그리는 아티스트 (배경 이미지에는 포함하지 않음)
+        self.points = ax.scatter([], [], s=60, animated=True, zorder=3)
+        self.label = ax.text(0.01, 0.95, "", transform=ax.transAxes, va="top", fontsize=12,
+                             fontweight="bold", animated=True)
+
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
+        plt.show(block=False)
+        self.fig.canvas.draw()
+        self.fig.canvas.flush_events()
+
+    def _on_draw(self, event):
+        # 창 크기 변경 등으로 전체를 다시 그리면 배경을 새로 저장
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _grid_offset(self):
+        from latency import grid_offset
+        return grid_offset(self.settings, self.handler.record_start_click_pos, self.latency_samples)
+
+    def _collect(self):
+        """감지기 큐에 쌓인 연주 지점을 가장 가까운 그리드 지점과 비교해 버퍼에 추가합니다."""
+        if self.handler.record_start_click_pos is None or len(self.grid) == 0:
+            return
+        sample_rate = self.settings.sample_rate
+        # 녹음 시각 -> 세션 그리드 시각
+        shift = self.handler.countin_samples / sample_rate - self._grid_offset()
+        times = self.grid["time"]
+        size = len(self.positions)
+        for channel, detector in enumerate(self.handler.onset_detectors):
+            for _ in range(MAX_EVENTS_PER_FRAME):
+                try:
+                    index, _ = detector.events.get_nowait()
+                except queue.Empty:
+                    break
+                t = index / sample_rate + shift
+                # timing.match_onsets 와 같은 가장 가까운 지점 선택 (이진 탐색)
+                right = min(int(np.searchsorted(times, t)), len(times) - 1)
+                left = max(right - 1, 0)
+                slot = right if abs(times[right] - t) < abs(t - times[left]) else left
+                error = t - times[slot]
+                k = self.count % size
+                self.positions[k] = self.grid["beat"][slot]
+                self.errors_ms[k] = error * 1000
+                self.channels[k] = channel
+                self.on_grid[k] = abs(error) < self.settings.tolerance
+                self.count += 1
+                stats = self.stats[channel]
+                stats.add(index / sample_rate, error, self.grid["beat"][slot] % 1.0)
+                prefix = f"CH{self.handler.input_channels[channel]} " if self.handler.num_channels > 1 else ""
+                self.latest_text = f"{prefix}{error * 1000:+.1f} ms{DRIFT_TEXT.get(stats.drift_state, '')}"
+
+    def _draw_animated(self):
+        n = min(self.count, len(self.positions))
+        if n:
+            # 가장 오래된 점부터 순서대로, 최근 점일수록 진하게
+            order = (np.arange(n) + self.count - n) % len(self.positions)
+            colors = np.empty((n, 4))
+            off_grid = (~self.on_grid[order]).astype(int)
+            colors[:, :3] = self._palette[self.channels[order] % len(self._palette), off_grid]
+            colors[:, 3] = np.linspace(0.15, 1.0, n)
+            self.points.set_offsets(np.column_stack((self.positions[order], self.errors_ms[order])))
+            self.points.set_facecolors(colors)
+        self.label.set_text(self.latest_text)
+        self.ax.draw_artist(self.points)
+        self.ax.draw_artist(self.label)
+
+    def update(self):
+        """큐를 비우고 점과 글자만 다시 그립니다. (배경 복원 + blitting)"""
+        self._collect()
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        self._draw_animated()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def run_for(self, backend, ms, until):
+        """
+        until 이벤트(녹음 완료)가 설정되거나 ms 가 지날 때까지 프레임마다 화면을 갱신합니다.
+        그리기에 걸린 시간만큼 대기 시간을 줄입니다.
+        """
+        elapsed = 0
+        while elapsed < ms:
+            step = min(self.frame_ms, ms - elapsed)
+            t0 = time.perf_counter()
+            self.update()
+            draw_ms = int((time.perf_counter() - t0) * 1000)
+            if backend.wait(until, max(step - draw_ms, 0)):
+                break
+            elapsed += step
+
+    def close(self):
+        plt.close(self.fig)
@@ -1,99 +1,256 @@
 import os
 import sys
+import argparse
 
-# ASIO 활성화를 위해 라이브러리 임포트 전 환경변수 설정
-os.environ["SD_ENABLE_ASIO"] = "1"
-
-import sounddevice as sd
 import matplotlib.pyplot as plt
 import numpy as np
-import config
-from utils import bars_to_sleep_ms
-from audio_engine import AudioHandler
-from visualizer import create_waveform_with_metronome, save_analysis_image
+from datetime import datetime
+from settings import load_settings
+from audio_engine import AudioHandler, TRANSPORT_TIMEOUT_MS
+from recording import WavFileSink, RECORDING_DIR
+from visualizer import create_waveform_with_metronome, save_analysis_image, default_image_filename, \
+    primary_image_format
 # 분리된 분석 함수를 임포트합니다.
-from analyzer import detect_and_print_specific_peaks
+from analyzer import print_detected_peaks, refine_onset_positions
+from timing import analyze_timing_channels, print_timing_summary, compare_channels, print_channel_comparison
+from calibration import sweep_thresholds, recommend_thresholds, print_calibration_summary
+from latency import load_latency, grid_offset, LATENCY_FILE
+from take_store import TakeStore
+from render_queue import RenderQueue
+from rhythm_stats import analysis_stats, print_rhythm_summary
+from live_view import LiveTimingView
+from stream_backend import SoundDeviceBackend, SimulatedBackend
 
-def run_analysis_process():
+def run_analysis_process(settings=None, backend=None, show=True, calibrate=False, store=None, renderer=None):
     """
     녹음 및 분석 프로세스를 수행하는 핵심 함수입니다.
     GUI의 stdout 리다이렉션을 통해 실시간 로그가 출력됩니다.
+
+    settings: 이 실행의 설정 (settings.Settings, 기본: settings.json 또는 config.py 기본값)
+    backend: 오디오 스트림 백엔드 (기본: 실제 장치, 테스트/벤치마크는 stream_backend.SimulatedBackend)
+    calibrate: True 이면 카운트인 잡음과 임계값 조합 평가로 THRESHOLD/SILENCE_THRESHOLD 추천값을 계산
+    store: 녹음과 감지 결과를 저장할 take_store.TakeStore (기본: takes 폴더)
+    renderer: 분석 이미지를 작업 프로세스에서 저장할 render_queue.RenderQueue
+              (기본: 이 프로세스에서 저장이 끝날 때까지 기다림)
+    반환값: 분석 결과 dict (오류 또는 녹음 데이터가 없으면 None)
     """
-    audio_handler = AudioHandler()
+    if settings is None:
+        settings = load_settings()
+    if backend is None:
+        backend = SoundDeviceBackend()
+    if store is None:
+        store = TakeStore()
+
+    # 녹음은 WAV 파일로 바로 기록 (긴 녹음에도 메모리 사용량 일정, 비정상 종료 시에도 보존)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    recording_path = os.path.join(RECORDING_DIR, f"take_{timestamp}.wav")
+    channel_count = len(settings.input_channels)
+    try:
+        audio_handler = AudioHandler(
+            settings, recording_sink=WavFileSink(recording_path, settings.sample_rate, channels=channel_count)
+        )
+    except ValueError as e:
+        # 입력 채널 설정 오류 (장치 채널 수는 스트림을 열기 전에 check_channels 로 확인)
+        print(f"\n[에러] 오류 발생: {e}")
+        return None
     
-    # 카운트인 계산
-    countin_ms, countin_beats = bars_to_sleep_ms(
-        config.COUNTIN_BARS, config.METRONOME_BPM, config.SAMPLE_RATE, config.BEATS_PER_BAR
-    )
+    # 카운트인 계산 (템포 맵 첫 마디 템포/박자)
+    tempo_map = audio_handler.tempo_map
+    countin_samples = tempo_map.countin_samples(settings.countin_bars, settings.sample_rate)
+    countin_ms = int(countin_samples / settings.sample_rate * 1000)
+    countin_beats = settings.countin_bars * tempo_map.sections[0].beats_per_bar
 
     print(f"{'='*70}")
-    print(f"[정보] 분석 프로세스 시작 ({config.METRONOME_BPM} BPM)")
-    print(f"카운트인: {config.COUNTIN_BARS} bar ({countin_beats} beats)")
-    print(f"녹음 시간: {config.RECORD_DURATION}초")
+    print(f"[정보] 분석 프로세스 시작 ({settings.grid_label})")
+    print(f"카운트인: {settings.countin_bars} bar ({countin_beats} beats)")
+    print(f"녹음 시간: {settings.record_duration}초")
     print(f"{'='*70}\n")
 
+    # 저장된 왕복 지연 (그리드 위치 보정, 녹음 중 실시간 보기에도 사용)
+    try:
+        latency_samples = load_latency(settings)
+    except (OSError, ValueError) as e:
+        print(f"[경고] {LATENCY_FILE} 을 읽을 수 없어 지연 보정 없이 분석합니다: {e}")
+        latency_samples = None
+
     try:
         # 2. 장치 설정
-        info = sd.query_devices(config.ASIO_DEVICE_ID)
-        channels = min(info["max_input_channels"], info["max_output_channels"])
+        channels = backend.query_channels(settings.asio_device_id)
+        audio_handler.check_channels(channels)
         
         # 3. 스트림 실행 및 녹음
-        with sd.Stream(
-            device=config.ASIO_DEVICE_ID,
-            samplerate=config.SAMPLE_RATE,
-            blocksize=config.BLOCK_SIZE,
-            dtype="float32",
+        with backend.open_stream(
+            device=settings.asio_device_id,
+            samplerate=settings.sample_rate,
+            blocksize=settings.block_size,
             channels=channels,
             callback=audio_handler.callback,
         ):
-            audio_handler.metronome_active = True
-            print(f"카운트인 시작! ({config.COUNTIN_BARS} bar)")
-            sd.sleep(countin_ms)
-
-            # 녹음 상태 리셋 및 시작
-            audio_handler.reset_state()
-            audio_handler.is_recording = True
-            
+            # 카운트인 -> 녹음 -> 완료 전환은 콜백이 샘플 수로 수행 (녹음 시작이 클릭과 샘플 단위로 맞음)
+            audio_handler.start_transport(countin_samples, settings.record_duration * settings.sample_rate)
+            print(f"카운트인 시작! ({settings.countin_bars} bar)")
+            if not backend.wait(audio_handler.recording_started, countin_ms + TRANSPORT_TIMEOUT_MS):
+                audio_handler.stop_transport()
+                raise RuntimeError("오디오 스트림이 진행되지 않아 녹음을 시작할 수 없습니다.")
+
             print("\n녹음 시작! 크로매틱 연습을 시작하세요.\n")
-            for i in range(config.RECORD_DURATION, 0, -1):
-                # GUI 로그 가독성을 위해 한 줄씩 출력
+            # 실시간 타이밍 보기 (대기 시간 동안 프레임 단위로 갱신, 오디오 콜백과는 감지기 큐로만 연결)
+            live = LiveTimingView(audio_handler, settings, latency_samples) if show and settings.live_view else None
+            for i in range(settings.record_duration, 0, -1):
+                # GUI 로그 가독성을 위해 한 줄씩 출력 (녹음 길이는 콜백이 정확히 맞춤)
                 print(f"  녹음 중... {i:2d}초 남음") 
-                sd.sleep(1000)
+                if live is None:
+                    backend.wait(audio_handler.finished, 1000)
+                else:
+                    live.run_for(backend, 1000, audio_handler.finished)
+                if audio_handler.finished.is_set():
+                    break
 
-            audio_handler.metronome_active = False
-            audio_handler.is_recording = False
+            completed = backend.wait(audio_handler.finished, TRANSPORT_TIMEOUT_MS)
+            audio_handler.stop_transport()
+            if live is not None:
+                live.close()
+            if not completed:
+                print("[경고] 녹음이 예정된 길이에 도달하기 전에 스트림이 멈췄습니다.")
 
         print("\n녹음 완료! 분석 중...")
+        audio_handler.monitor.report()
+        if audio_handler.overflow_count:
+            print(f"[경고] 버퍼 오버플로 {audio_handler.overflow_count}회 "
+                  f"({audio_handler.dropped_samples} 샘플 손실)")
 
-        # 4. 데이터 결과 처리
+        # 4. 데이터 결과 처리 (녹음 파일을 memmap 으로 열기)
         audio_data = audio_handler.get_recorded_array()
+        print(f"녹음 파일: {recording_path}")
         
         if len(audio_data) == 0:
             print("[오류] 녹음된 데이터가 없습니다.")
-            return
+            return None
 
-        # 5. 피크 감지 수행
-        detected_indices = detect_and_print_specific_peaks(
-            audio_data, 
-            threshold=config.THRESHOLD, 
-            silence_threshold=config.SILENCE_THRESHOLD
-        )
+        # 5. 피크 감지 결과 (녹음 중 블록 단위로 채널마다 이미 감지됨, 첫 채널이 기준)
+        multichannel = channel_count > 1
+        signals = [audio_data[:, ch] for ch in range(channel_count)] if multichannel else [audio_data]
+        channel_indices = [detector.indices for detector in audio_handler.onset_detectors]
+        for input_channel, signal, indices in zip(settings.input_channels, signals, channel_indices):
+            if multichannel:
+                print(f"[입력 채널 {input_channel}]")
+            print_detected_peaks(signal, indices, settings)
+        detected_indices = channel_indices[0]
 
-        # 6. 시각화 및 이미지 저장
-        fig = create_waveform_with_metronome(
-            audio_data, 
-            detected_indices=detected_indices, 
-            tolerance=config.TOLERANCE
-        )
-        filename = save_analysis_image(fig)
+        # 6. 그리드 위치 보정 (녹음 시작 시 클릭 위치 + 저장된 왕복 지연)
+        offset = grid_offset(settings, audio_handler.record_start_click_pos, latency_samples)
+        latency_text = "측정값 없음" if latency_samples is None else \
+            f"{latency_samples / settings.sample_rate * 1000:.2f}ms"
+        print(f"[그리드] 시작 위치 {offset * 1000:+.2f}ms (왕복 지연 {latency_text})")
+
+        # 7. 그리드 매칭 (정박/어긋남, 놓친 음, 추가 연주, 모든 채널을 한 번에), 연주 시각은 샘플 이하 해상도로 보정
+        #    그리드는 클릭 재생에 쓴 세션 그리드를 잘라 사용
+        positions = [
+            refine_onset_positions(signal, indices, settings.threshold)
+            for signal, indices in zip(signals, channel_indices)
+        ]
+        grid = audio_handler.record_grid(offset, len(audio_data))
+        timings = analyze_timing_channels(channel_indices, len(audio_data), settings, positions, grid=grid)
+        timing = timings[0]
+        if multichannel:
+            # 채널별 타이밍과 기준 채널 대비 연주자 간 시차
+            print_channel_comparison(timings, compare_channels(timings), settings.input_channels)
+        else:
+            print_timing_summary(timing)
+
+        # 리듬 통계 (박 안 위치별 오차, 빨라짐/느려짐 구간), take 와 함께 저장
+        grid_beats = audio_handler.record_grid_points(offset, len(audio_data))["beat"]
+        rhythm = [analysis_stats(analysis, grid_beats).summary() for analysis in timings]
+        for input_channel, summary in zip(settings.input_channels, rhythm):
+            if multichannel:
+                print(f"\n[채널 {input_channel}]")
+            print_rhythm_summary(summary)
+
+        # take 저장 (나중에 설정을 바꿔 재녹음/재감지 없이 다시 채점: python take_store.py rescore)
+        take_id = store.save_take(audio_data, settings, channel_indices, positions, offset, latency_samples,
+                                  rhythm=rhythm)
+        print(f"[저장] take {take_id}")
+
+        # 이미지 저장은 작업 프로세스로 넘기고 기다리지 않음 (저장된 take 에서 다시 그림)
+        filename = default_image_filename()
+        image_paths = None
+        if renderer is not None:
+            image_paths = [path for _, path in renderer.submit(store, take_id, settings, timings, filename)]
+            print(f"[그림] 백그라운드 저장 시작 ({', '.join(settings.image_formats)})")
 
-        print(f"\n[완료] 분석 완료: {filename}")
-        plt.show()
+        # 임계값 보정 (같은 녹음으로 조합 전체를 평가, 재녹음 불필요)
+        recommendation = None
+        if calibrate:
+            noise = audio_handler.noise_meter.summary()
+            sweep = sweep_thresholds(signals[0], settings, grid_offset=offset)
+            recommendation = recommend_thresholds(sweep, noise)
+            print_calibration_summary(sweep, recommendation, noise)
+
+        # 8. 시각화 및 이미지 저장 (renderer 가 없으면 여기서 형식마다 저장)
+        # 분석 창(show)은 확대/이동이 되는 대화형 창이라 이 프로세스에서 그림을 따로 만듦 (저장은 하지 않음)
+        fig = None
+        pending = image_paths is not None
+        if not pending or show:
+            fig = create_waveform_with_metronome(
+                audio_data,
+                settings,
+                detected_indices=detected_indices,
+                timing=timings if multichannel else timing
+            )
+        if not pending:
+            image_paths = [save_analysis_image(fig, filename, image_format=image_format)
+                           for image_format in settings.image_formats]
+
+        print(f"\n[완료] 분석 완료{' (이미지 저장 중)' if pending else ''}: {', '.join(image_paths)}")
+        if show:
+            plt.show()
+        elif fig is not None:
+            plt.close(fig)
+
+        saved = dict(zip(settings.image_formats, image_paths))
+        return {
+            "recording_path": recording_path,
+            "take_id": take_id,
+            "detected_indices": detected_indices,
+            "timing": timing,
+            "channel_timings": timings,
+            "rhythm": rhythm,
+            "image_path": saved.get(primary_image_format(settings.image_formats)),  # 대표(전체 해상도) 형식
+            "image_paths": image_paths,  # settings.image_formats 순서
+            "recommendation": recommendation,
+        }
 
     except Exception as e:
         print(f"\n[에러] 오류 발생: {e}")
         import traceback
         traceback.print_exc()
+        return None
 
 if __name__ == "__main__":
-    run_analysis_process()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="메트로놈 녹음 및 리듬 분석")
+    parser.add_argument("--simulate", metavar="SOURCE", nargs="?", const="",
+                        help="ASIO 장치 대신 가상 장치 사용 (WAV 경로를 주면 입력으로 재생, 생략 시 무음)")
+    parser.add_argument("--simulate-scale", type=float, default=1.0,
+                        help="가상 입력 배율 (녹음된 take 를 다시 넣을 때는 1/SOFTWARE_GAIN)")
+    parser.add_argument("--realtime", action="store_true", help="가상 장치를 실제 시간 속도로 실행")
+    parser.add_argument("--no-show", action="store_true", help="분석 창을 띄우지 않음")
+    parser.add_argument("--calibrate", action="store_true", help="THRESHOLD/SILENCE_THRESHOLD 추천값 계산")
+    parser.add_argument("--no-live", action="store_true", help="녹음 중 실시간 타이밍 보기 창을 띄우지 않음")
+    parser.add_argument("--no-tempo-map", action="store_true",
+                        help="settings.json 의 템포 맵 대신 BPM/박자 설정으로 일정한 그리드 사용")
+    args = parser.parse_args()
+
+    backend = None
+    if args.simulate is not None:
+        backend = SimulatedBackend(args.simulate or None, realtime=args.realtime, scale=args.simulate_scale)
+    settings = load_settings()
+    if args.no_live:
+        settings = settings.replace(live_view=False)
+    if args.no_tempo_map:
+        settings = settings.replace(tempo_map=())
+    renderer = RenderQueue()
+    try:
+        run_analysis_process(settings, backend, show=not args.no_show, calibrate=args.calibrate, renderer=renderer)
+    finally:
+        # 남은 이미지 저장이 끝날 때까지 기다림
+        renderer.close()
\ No newline at end of file
@@ -0,0 +1,231 @@
+# recording.py
+import os
+import struct
+import numpy as np
+
+# 녹음 파일을 저장할 폴더명
+RECORDING_DIR = "recordings"
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# chunk 단위 처리 기본 크기 (약 1M 샘플, float32 기준 4MB)
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+# 24비트 PCM 샘플 (3바이트). open_wav 는 이 형식의 memmap 을 반환하고 read_range 등에서 블록 단위로 변환
+PCM24_DTYPE = np.dtype("V3")
+
+
+def _wav_header(sample_rate, channels, data_bytes, format_tag=WAVE_FORMAT_IEEE_FLOAT, bits=32):
+    """WAV 헤더(44바이트)를 생성합니다. (기본: 32비트 float)"""
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_bytes, b"WAVE",
+        b"fmt ", 16, format_tag, channels, sample_rate,
+        sample_rate * block_align, block_align, bits,
+        b"data", data_bytes,
+    )
+
+
+class MemorySink:
+    """
+    소비자 스레드가 전달한 블록을 메모리의 float32 배열 하나에 이어 쓰는 싱크입니다.
+    reserve 로 녹음 길이를 미리 알려주면 한 번만 할당하고, 모자라면 두 배씩 늘립니다.
+    get_array 는 복사 없이 기록된 부분의 view 를 반환합니다.
+    """
+    def __init__(self):
+        self.buffer = None
+        self.length = 0
+
+    def reset(self):
+        self.buffer = None
+        self.length = 0
+
+    def reserve(self, frames, channels=None):
+        """frames 샘플(다채널은 (frames, channels))을 담을 버퍼를 미리 할당합니다."""
+        shape = (frames,) if channels is None else (frames, channels)
+        self.buffer = np.zeros(shape, dtype=np.float32)
+        self.length = 0
+
+    def __call__(self, chunk, start_index):
+        end = self.length + len(chunk)
+        if self.buffer is None:
+            self.buffer = np.zeros((max(end, 1 << 16),) + chunk.shape[1:], dtype=np.float32)
+        elif end > len(self.buffer):
+            grown = np.zeros((max(end, 2 * len(self.buffer)),) + self.buffer.shape[1:], dtype=np.float32)
+            grown[:self.length] = self.buffer[:self.length]
+            self.buffer = grown
+        self.buffer[self.length:end] = chunk
+        self.length = end
+
+    def close(self):
+        pass
+
+    def get_array(self):
+        if self.buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        return self.buffer[:self.length]
+
+
+class WavFileSink:
+    """
+    녹음 데이터를 32비트 float WAV 파일에 바로 이어 쓰는 싱크입니다.
+    헤더의 길이 정보는 header_interval 초마다 갱신하므로 프로그램이 비정상 종료되어도
+    그때까지의 녹음이 남고, open_wav 는 헤더가 덜 갱신된 파일도 파일 크기 기준으로 읽습니다.
+    """
+    def __init__(self, path, sample_rate, channels=1, header_interval=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.header_interval_samples = int(sample_rate * header_interval)
+        self.file = None
+        self.samples_written = 0
+        self._samples_at_last_patch = 0
+
+    def reset(self):
+        self.close()
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.file = open(self.path, "wb+")
+        self.file.write(_wav_header(self.sample_rate, self.channels, 0))
+        self.samples_written = 0
+        self._samples_at_last_patch = 0
+
+    def reserve(self, frames, channels=None):
+        """파일에 바로 쓰므로 미리 할당하지 않습니다. (MemorySink 와 같은 인터페이스)"""
+
+    def _patch_header(self):
+        data_bytes = self.samples_written * self.channels * 4
+        pos = self.file.tell()
+        self.file.seek(0)
+        self.file.write(_wav_header(self.sample_rate, self.channels, data_bytes))
+        self.file.seek(pos)
+        self.file.flush()
+        self._samples_at_last_patch = self.samples_written
+
+    def __call__(self, chunk, start_index):
+        if self.file is None:
+            self.reset()
+        np.asarray(chunk, dtype="<f4").tofile(self.file)
+        self.samples_written += len(chunk)
+        if self.samples_written - self._samples_at_last_patch >= self.header_interval_samples:
+            self._patch_header()
+
+    def close(self):
+        if self.file is not None:
+            self._patch_header()
+            self.file.close()
+            self.file = None
+
+    def get_array(self):
+        """기록된 파일을 np.memmap 으로 엽니다. (전체를 메모리에 올리지 않음)"""
+        self.close()
+        data, _ = open_wav(self.path)
+        return data
+
+
+def write_pcm16_wav(path, signal, sample_rate, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    신호(모노 또는 (frames, channels))를 16비트 PCM WAV 로 저장합니다. (float32 녹음의 절반 크기, chunk 단위로 변환)
+    open_wav + read_range 로 다시 읽으면 1/32768 단위로 양자화된 같은 값이 됩니다.
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    with open(path, "wb") as f:
+        channels = 1 if signal.ndim == 1 else signal.shape[1]
+        f.write(_wav_header(sample_rate, channels, len(signal) * channels * 2, WAVE_FORMAT_PCM, 16))
+        for _, block in iter_chunks(signal, chunk_size):
+            pcm = np.clip(np.round(block * np.float32(32768)), -32768, 32767)
+            pcm.astype("<i2").tofile(f)
+
+
+def open_wav(path):
+    """
+    WAV 파일의 데이터 영역을 np.memmap 으로 엽니다.
+    반환값: (데이터 배열, 샘플 레이트). 모노는 1차원, 다채널은 (frames, channels) 입니다.
+    24비트 PCM 은 PCM24_DTYPE 배열이므로 값은 read_range / iter_chunks / pcm_values 로 읽습니다.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+            raise ValueError(f"WAV 파일이 아닙니다: {path}")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"data 청크를 찾을 수 없습니다: {path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt_bytes = f.read(chunk_size + (chunk_size & 1))
+                fmt = list(struct.unpack("<HHIIHH", fmt_bytes[:16]))
+                if fmt[0] == WAVE_FORMAT_EXTENSIBLE and len(fmt_bytes) >= 26:
+                    # 확장 형식은 SubFormat GUID 의 앞 2바이트가 실제 형식 코드
+                    fmt[0] = struct.unpack("<H", fmt_bytes[24:26])[0]
+            elif chunk_id == b"data":
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError(f"fmt 청크를 찾을 수 없습니다: {path}")
+    format_tag, channels, sample_rate, _, block_align, bits = fmt
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        dtype = np.dtype(f"<f{bits // 8}")
+    elif format_tag == WAVE_FORMAT_PCM and bits in (16, 24, 32):
+        dtype = PCM24_DTYPE if bits == 24 else np.dtype(f"<i{bits // 8}")
+    else:
+        raise ValueError(f"지원하지 않는 WAV 형식입니다 (format={format_tag}, bits={bits})")
+
+    # 헤더 갱신 전에 종료된 파일도 읽을 수 있도록 실제 파일 크기 기준으로 길이를 계산
+    frames = (file_size - data_offset) // block_align
+    shape = (frames,) if channels == 1 else (frames, channels)
+    if frames == 0:
+        return np.zeros(shape, dtype=dtype), sample_rate
+
+    # 24비트 PCM 은 3바이트 단위(PCM24_DTYPE) 그대로 열고, 읽는 블록만 pcm_values 로 변환
+    return np.memmap(path, dtype=dtype, mode="r", offset=data_offset, shape=shape), sample_rate
+
+
+def _pcm_scale(signal):
+    if np.issubdtype(signal.dtype, np.integer):
+        return 1.0 / float(np.iinfo(signal.dtype).max + 1)
+    return None
+
+
+def pcm_values(block):
+    """
+    24비트 PCM(PCM24_DTYPE) 블록을 int32 (상위 24비트) 로 변환합니다. 다른 형식은 그대로 반환합니다.
+    """
+    if block.dtype != PCM24_DTYPE:
+        return block
+    raw = np.ascontiguousarray(block).view(np.uint8).reshape(block.shape + (3,))
+    return (raw[..., 0].astype(np.int32) << 8) | (raw[..., 1].astype(np.int32) << 16) \
+        | (raw[..., 2].astype(np.int32) << 24)
+
+
+def read_range(signal, start, stop):
+    """
+    signal[start:stop] 을 float32 범위(-1.0 ~ 1.0)로 읽습니다. (정수 PCM 은 변환)
+    """
+    block = pcm_values(signal[start:stop])
+    scale = _pcm_scale(block)
+    if scale is not None:
+        block = block.astype(np.float32) * np.float32(scale)
+    return block
+
+
+def iter_chunks(signal, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    신호를 chunk_size 단위의 float32 블록으로 나눠 (시작 인덱스, 블록) 을 차례로 반환합니다.
+    정수 PCM 데이터는 -1.0 ~ 1.0 범위로 변환합니다.
+    """
+    for start in range(0, len(signal), chunk_size):
+        yield start, read_range(signal, start, start + chunk_size)
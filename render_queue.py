@@ -0,0 +1,110 @@
+# render_queue.py
+# 분석 그림 백그라운드 저장: 녹음 후 그림 생성과 savefig 를 작업 프로세스(Agg 백엔드)로 넘겨
+# 숫자 결과는 감지 직후 바로 출력하고, 이전 그림을 저장하는 동안에도 다음 녹음을 시작할 수 있게 합니다.
+# 그림은 저장된 take(take_store)에서 다시 그리므로 프로세스 사이에 오디오를 넘기지 않습니다.
+# take 하나는 작업 하나로, 그림을 한 번만 만들고 형식마다 savefig 만 반복합니다.
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from visualizer import image_path, OUTPUT_DIR
+
+# 작업 프로세스 수 (1이면 take 순서대로 저장)
+RENDER_WORKERS = 1
+
+# 작업 프로세스 -> 부모 프로세스 저장 완료 알림 큐 (작업 프로세스에서만 설정)
+_saved_events = None
+
+
+def _init_worker(saved_events):
+    global _saved_events
+    _saved_events = saved_events
+    # 작업 프로세스는 화면 없이 파일로만 저장
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def render_take(root, take_id, settings, timings, filename, output_dir):
+    """
+    작업 프로세스에서 실행: take 를 열어 채널별 채점 결과를 한 번 그리고 settings.image_formats 순서대로 저장합니다.
+    형식 하나를 저장할 때마다 (형식, 경로, 오류) 를 알림 큐에 넣습니다. (미리보기가 먼저 알려짐)
+    """
+    import matplotlib.pyplot as plt
+    from take_store import TakeStore
+    from visualizer import save_analysis_image
+
+    try:
+        store = TakeStore(root)
+        fig = store.figure(store.load_take(take_id), settings, timings)
+    except Exception as e:
+        for image_format in settings.image_formats:
+            _saved_events.put((image_format, None, f"{type(e).__name__}: {e}"))
+        return
+
+    try:
+        for image_format in settings.image_formats:
+            try:
+                path, error = save_analysis_image(fig, filename, output_dir, image_format), None
+            except Exception as e:
+                path, error = None, f"{type(e).__name__}: {e}"
+            _saved_events.put((image_format, path, error))
+    finally:
+        plt.close(fig)
+
+
+class RenderQueue:
+    """
+    take 그림 저장 작업을 작업 프로세스에 넘깁니다. (작업 프로세스와 matplotlib 임포트는 한 번만)
+    on_saved(image_format, path, error): 형식 하나의 저장이 끝날 때마다 알림 수신 스레드에서 호출
+                                         (실패하면 path 는 None, error 는 오류 문자열)
+    """
+    def __init__(self, on_saved=None, workers=RENDER_WORKERS):
+        self.on_saved = on_saved
+        self._events = multiprocessing.Queue()
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self._events,))
+        self._relay = threading.Thread(target=self._relay_events, daemon=True)
+        self._relay.start()
+
+    def submit(self, store, take_id, settings, timings, filename, output_dir=OUTPUT_DIR):
+        """
+        take 하나의 저장 작업을 넘기고 기다리지 않고 (형식, 저장될 경로) 리스트를 반환합니다. (settings.image_formats 순서)
+        store: take 가 저장된 take_store.TakeStore, timings: 채널별 timing.TimingAnalysis 리스트
+        """
+        # 작업 프로세스들이 동시에 폴더를 만들지 않도록 미리 생성
+        os.makedirs(output_dir, exist_ok=True)
+        future = self.pool.submit(render_take, store.root, take_id, settings, timings, filename, output_dir)
+        future.add_done_callback(lambda f: self._check_worker(f, settings.image_formats))
+        return [(image_format, image_path(filename, output_dir, image_format))
+                for image_format in settings.image_formats]
+
+    def _check_worker(self, future, image_formats):
+        # render_take 는 오류를 알림으로 보내므로 여기서는 작업 프로세스가 비정상 종료된 경우만 처리
+        error = future.exception()
+        if error is not None:
+            for image_format in image_formats:
+                self._events.put((image_format, None, f"{type(error).__name__}: {error}"))
+
+    def _relay_events(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            self._notify(*event)
+
+    def _notify(self, image_format, path, error):
+        if self.on_saved is not None:
+            self.on_saved(image_format, path, error)
+        elif error is None:
+            print(f"[그림] {image_format} 저장 완료: {path}", flush=True)
+        else:
+            print(f"[그림] {image_format} 저장 실패: {error}", flush=True)
+
+    def close(self, wait=True):
+        """남은 저장 작업을 (wait=True 이면 끝날 때까지 기다린 뒤) 정리합니다."""
+        self.pool.shutdown(wait=wait)
+        # 작업 프로세스가 보낸 알림을 모두 전달한 뒤 수신 스레드 종료
+        self._events.put(None)
+        if wait:
+            self._relay.join()
@@ -0,0 +1,213 @@
+# rhythm_stats.py
+# 리듬 통계: 연주 지점이 들어올 때마다 O(1) 로 갱신하는 누적 통계입니다.
+# - 부호 있는 오차의 평균/분산 (Welford)
+# - 박 안 위치(예: 두 번째 16분음표)별 오차 평균/분산과 히스토그램
+# - 최근 DRIFT_WINDOW 개 연주의 오차 기울기(최소제곱)로 빨라짐(rushing)/느려짐(dragging) 구간 감지
+# 녹음 중(live_view)에는 감지기 이벤트마다, 녹음 후에는 TimingAnalysis 로 같은 객체를 채우며,
+# summary() 는 take 와 함께 저장하는 JSON 요약입니다. (대시보드가 오디오를 다시 읽지 않아도 됨)
+
+import numpy as np
+
+PHASE_SLOTS = 48         # 박 안 위치 단위 (1/48 박: 2/3/4/6/8/12/16 분할이 모두 정확히 들어감)
+HIST_BIN_MS = 2.0        # 오차 히스토그램 칸 크기 (ms)
+HIST_RANGE_MS = 50.0     # 히스토그램 범위 (+-ms, 넘는 값은 양 끝 칸에 포함)
+DRIFT_WINDOW = 16        # 템포 기울기를 계산할 최근 연주 수
+DRIFT_THRESHOLD = 0.01   # 빨라짐/느려짐으로 판정할 템포 차이 (비율, 0.01 = 1%)
+
+DRIFT_STEADY = "steady"
+DRIFT_RUSHING = "rushing"
+DRIFT_DRAGGING = "dragging"
+
+
+def tempo_change(slope):
+    """오차 기울기(초/초)를 클릭 대비 연주 템포 차이 비율로 바꿉니다. (양수 = 빠름)"""
+    return 1.0 / (1.0 + slope) - 1.0
+
+
+class RhythmStats:
+    """
+    연주 지점별 (시각, 부호 있는 오차, 박 안 위치)를 하나씩 받아 누적하는 통계입니다.
+    add() 는 배열을 새로 만들지 않고 고정 크기 버퍼만 갱신합니다.
+    """
+    def __init__(self, window=DRIFT_WINDOW, drift_threshold=DRIFT_THRESHOLD,
+                 bin_ms=HIST_BIN_MS, range_ms=HIST_RANGE_MS):
+        self.window = window
+        self.drift_threshold = drift_threshold
+        self.bin_ms = bin_ms
+        self.range_ms = range_ms
+        bins = int(np.ceil(2 * range_ms / bin_ms))
+
+        # 전체 오차 (Welford)
+        self.count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+        # 박 안 위치별 오차
+        self.phase_count = np.zeros(PHASE_SLOTS, dtype=np.int64)
+        self.phase_mean = np.zeros(PHASE_SLOTS)
+        self.phase_m2 = np.zeros(PHASE_SLOTS)
+        self.histogram = np.zeros((PHASE_SLOTS, bins), dtype=np.int64)
+
+        # 최근 window 개 연주 (순환 버퍼)와 최소제곱용 누적 합 (시각은 첫 연주 기준)
+        self._times = np.zeros(window)
+        self._errors = np.zeros(window)
+        self._t0 = None
+        self._sums = np.zeros(5)  # n, sum t, sum e, sum t*t, sum t*e
+
+        # 빨라짐/느려짐 구간: (상태, 시작 시각, 끝 시각, 최대 템포 차이)
+        self.drift_state = DRIFT_STEADY
+        self.drift = 0.0
+        self.segments = []
+        self._segment = None
+
+    @property
+    def mean(self):
+        return self._mean if self.count else float("nan")
+
+    @property
+    def std(self):
+        return float(np.sqrt(self._m2 / self.count)) if self.count else float("nan")
+
+    def add(self, time, error, phase):
+        """
+        연주 지점 하나를 추가합니다.
+        time: 녹음 시각 (초), error: 가장 가까운 그리드 대비 오차 (초, 양수 = 늦음), phase: 박 안 위치 (박, 0 ~ 1)
+        """
+        if not np.isfinite(error):
+            return
+        self.count += 1
+        delta = error - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (error - self._mean)
+
+        slot = int(round(phase * PHASE_SLOTS)) % PHASE_SLOTS
+        n = self.phase_count[slot] + 1
+        delta = error - self.phase_mean[slot]
+        self.phase_count[slot] = n
+        self.phase_mean[slot] += delta / n
+        self.phase_m2[slot] += delta * (error - self.phase_mean[slot])
+        bins = self.histogram.shape[1]
+        k = int((error * 1000 + self.range_ms) // self.bin_ms)
+        self.histogram[slot, min(max(k, 0), bins - 1)] += 1
+
+        self._update_drift(time, error)
+
+    def _update_drift(self, time, error):
+        if self._t0 is None:
+            self._t0 = time
+        t = time - self._t0
+        k = (self.count - 1) % self.window
+        sums = self._sums
+        if self.count > self.window:
+            # 가장 오래된 연주를 누적 합에서 제외
+            old_t, old_e = self._times[k], self._errors[k]
+            sums[0] -= 1
+            sums[1] -= old_t
+            sums[2] -= old_e
+            sums[3] -= old_t * old_t
+            sums[4] -= old_t * old_e
+        self._times[k], self._errors[k] = t, error
+        sums[0] += 1
+        sums[1] += t
+        sums[2] += error
+        sums[3] += t * t
+        sums[4] += t * error
+        if self.count < self.window:
+            return
+
+        n, st, se, stt, ste = sums
+        denom = n * stt - st * st
+        slope = (n * ste - st * se) / denom if denom > 0 else 0.0
+        self.drift = tempo_change(slope)
+        if self.drift > self.drift_threshold:
+            state = DRIFT_RUSHING
+        elif self.drift < -self.drift_threshold:
+            state = DRIFT_DRAGGING
+        else:
+            state = DRIFT_STEADY
+
+        # 구간 시작은 기울기를 계산한 창의 첫 연주 시각 (앞 구간과 겹치지 않게 자름)
+        if state != self.drift_state:
+            self._close_segment()
+            if state != DRIFT_STEADY:
+                start = self._times[self.count % self.window] + self._t0
+                if self.segments:
+                    start = max(start, self.segments[-1][2])
+                self._segment = [state, start, time, self.drift]
+            self.drift_state = state
+        elif self._segment is not None:
+            self._segment[2] = time
+            if abs(self.drift) > abs(self._segment[3]):
+                self._segment[3] = self.drift
+
+    def _close_segment(self):
+        if self._segment is not None:
+            self.segments.append(tuple(self._segment))
+            self._segment = None
+
+    def extend(self, times, errors, phases):
+        for time, error, phase in zip(times, errors, phases):
+            self.add(float(time), float(error), float(phase))
+
+    def all_segments(self):
+        """끝난 구간 + 진행 중인 구간"""
+        return self.segments + ([tuple(self._segment)] if self._segment is not None else [])
+
+    def summary(self):
+        """JSON 으로 저장할 수 있는 요약 dict (ms / 초 단위)"""
+        positions = []
+        for slot in np.flatnonzero(self.phase_count):
+            n = int(self.phase_count[slot])
+            positions.append({
+                "phase": round(slot / PHASE_SLOTS, 4),
+                "count": n,
+                "mean_error_ms": round(float(self.phase_mean[slot]) * 1000, 3),
+                "std_error_ms": round(float(np.sqrt(self.phase_m2[slot] / n)) * 1000, 3),
+                "histogram": self.histogram[slot].tolist(),
+            })
+        segments = [
+            {"state": state, "start_s": round(start, 3), "end_s": round(end, 3),
+             "peak_tempo_pct": round(peak * 100, 2)}
+            for state, start, end, peak in self.all_segments()
+        ]
+        return {
+            "count": self.count,
+            "mean_error_ms": round(self.mean * 1000, 3) if self.count else None,
+            "std_error_ms": round(self.std * 1000, 3) if self.count else None,
+            "histogram_bin_ms": self.bin_ms,
+            "histogram_range_ms": self.range_ms,
+            "positions": positions,
+            "drift_window": self.window,
+            "drift_threshold_pct": self.drift_threshold * 100,
+            "drift_segments": segments,
+            "rushing_s": round(sum(s["end_s"] - s["start_s"] for s in segments if s["state"] == DRIFT_RUSHING), 3),
+            "dragging_s": round(sum(s["end_s"] - s["start_s"] for s in segments if s["state"] == DRIFT_DRAGGING), 3),
+        }
+
+
+def analysis_stats(analysis, grid_beats):
+    """
+    녹음 후 그리드 매칭 결과(timing.TimingAnalysis)로 RhythmStats 를 채웁니다.
+    grid_beats: analysis.grid_times 와 같은 순서의 마디 안 위치 (박, tempo_map 그리드 지점의 beat)
+    """
+    stats = RhythmStats()
+    onsets = analysis.onsets
+    if len(analysis.grid_times):
+        phases = np.mod(np.asarray(grid_beats)[onsets["slot"]], 1.0)
+        stats.extend(onsets["time"], onsets["error"], phases)
+    return stats
+
+
+def print_rhythm_summary(summary):
+    """summary() 결과를 출력합니다. (위치별 평균 오차, 빨라짐/느려짐 구간)"""
+    if not summary["count"]:
+        return
+    for position in summary["positions"]:
+        print(f"[리듬] 박 안 위치 {position['phase']:.3f}: 평균 {position['mean_error_ms']:+.1f}ms | "
+              f"표준편차 {position['std_error_ms']:.1f}ms | {position['count']}개")
+    for segment in summary["drift_segments"]:
+        label = "빨라짐" if segment["state"] == DRIFT_RUSHING else "느려짐"
+        print(f"[리듬] {label} {segment['start_s']:.1f}s ~ {segment['end_s']:.1f}s "
+              f"(최대 {segment['peak_tempo_pct']:+.1f}%)")
+    if not summary["drift_segments"]:
+        print(f"[리듬] 템포 {summary['drift_threshold_pct']:g}% 이상 빨라지거나 느려진 구간이 없습니다.")
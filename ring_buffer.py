@@ -0,0 +1,103 @@
+# ring_buffer.py
+import threading
+import numpy as np
+
+
+class RingBuffer:
+    """
+    오디오 콜백(생산자 1개)과 소비자 스레드(1개) 사이의 고정 크기 링 버퍼입니다.
+    쓰기/읽기 위치는 각각 한 스레드만 갱신하므로 락이 필요 없습니다.
+    공간이 부족하면 블록을 버리고 overflow_count / dropped_samples 를 증가시킵니다.
+    channels 를 주면 (frames, channels) 블록을 저장합니다. (샘플 수는 프레임 단위)
+    """
+    def __init__(self, capacity, dtype=np.float32, channels=None):
+        # 인덱스 계산을 비트 마스크로 하기 위해 2의 거듭제곱으로 올림
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.buffer = np.zeros(size if channels is None else (size, channels), dtype=dtype)
+        self.mask = size - 1
+        self.write_index = 0  # 생산자만 갱신
+        self.read_index = 0   # 소비자만 갱신
+
+        self.overflow_count = 0
+        self.dropped_samples = 0
+
+    @property
+    def capacity(self):
+        return len(self.buffer)
+
+    def available(self):
+        return self.write_index - self.read_index
+
+    def write(self, data):
+        """생산자(오디오 콜백) 전용: 데이터를 복사하고 쓰기 위치를 갱신합니다."""
+        n = len(data)
+        if self.capacity - (self.write_index - self.read_index) < n:
+            self.overflow_count += 1
+            self.dropped_samples += n
+            return False
+
+        start = self.write_index & self.mask
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if first < n:
+            self.buffer[:n - first] = data[first:]
+        # 데이터 복사가 끝난 뒤에 위치를 공개
+        self.write_index += n
+        return True
+
+    def read_into(self, out):
+        """소비자 전용: 최대 len(out) 샘플을 out 에 복사하고 읽은 개수를 반환합니다."""
+        n = min(len(out), self.write_index - self.read_index)
+        if n <= 0:
+            return 0
+
+        start = self.read_index & self.mask
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n:
+            out[first:n] = self.buffer[:n - first]
+        self.read_index += n
+        return n
+
+    def discard(self):
+        """소비자 전용: 아직 읽지 않은 데이터를 모두 버립니다."""
+        self.read_index = self.write_index
+
+
+class RingBufferConsumer(threading.Thread):
+    """
+    링 버퍼를 주기적으로 비워 등록된 싱크(sink)에 전달하는 소비자 스레드입니다.
+    싱크는 sink(chunk, start_index) 형태의 호출 가능한 객체입니다. (분석기, 파일 저장, 화면 표시 등)
+    """
+    def __init__(self, ring, sinks, chunk_size=8192, poll_interval=0.005):
+        super().__init__(daemon=True)
+        self.ring = ring
+        self.sinks = list(sinks)
+        self.chunk = np.zeros((chunk_size,) + ring.buffer.shape[1:], dtype=ring.buffer.dtype)
+        self.poll_interval = poll_interval
+        self.samples_consumed = 0
+        self._stop_event = threading.Event()
+
+    def drain(self):
+        """버퍼에 쌓인 데이터를 모두 싱크로 전달합니다."""
+        while True:
+            n = self.ring.read_into(self.chunk)
+            if n == 0:
+                return
+            block = self.chunk[:n]
+            for sink in self.sinks:
+                sink(block, self.samples_consumed)
+            self.samples_consumed += n
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.drain()
+            self._stop_event.wait(self.poll_interval)
+        self.drain()
+
+    def stop(self):
+        """스레드를 종료하고 남은 데이터를 모두 처리할 때까지 기다립니다."""
+        self._stop_event.set()
+        self.join()
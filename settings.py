@@ -0,0 +1,122 @@
+# settings.py
+# 녹음/분석 설정: 실행마다 만들어 각 모듈에 명시적으로 넘기는 불변 객체입니다.
+# config.py 는 기본값으로만 쓰고, 사용자가 바꾼 값은 settings.json 에 저장합니다.
+
+import json
+import os
+import dataclasses
+from dataclasses import dataclass
+
+from tempo_map import TempoMap, TempoSection
+
+try:
+    import config
+except ImportError:
+    config = None
+
+SETTINGS_FILE = "settings.json"
+
+# 템포 맵이 있으면 쓰이지 않는 일정 그리드 설정 (Settings.replace_grid 로 바꾸면 템포 맵을 지움)
+GRID_FIELDS = ("metronome_bpm", "beats_per_bar", "chromatic_enabled", "chromatic_beats")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    한 번의 녹음/분석에 쓰는 설정값. 값을 바꿀 때는 replace() 로 새 객체를 만듭니다.
+    같은 프로세스에서 서로 다른 설정의 분석을 동시에 실행할 수 있습니다.
+    """
+    asio_device_id: int = 0
+    input_channels: tuple = (0,)  # 녹음할 입력 채널 번호 (0부터, 여러 개면 첫 채널이 기준)
+    sample_rate: int = 44100
+    block_size: int = 64
+    record_duration: int = 10
+    software_gain: float = 60.0
+    metronome_bpm: float = 100
+    countin_bars: int = 2
+    beats_per_bar: int = 4
+    chromatic_enabled: bool = True
+    chromatic_beats: int = 4
+    # 템포 맵 (tempo_map.TempoSection 튜플). 비어 있으면 metronome_bpm / beats_per_bar / chromatic_beats 로 일정한 그리드
+    tempo_map: tuple = ()
+    tolerance: float = 0.03
+    threshold: float = 0.25
+    silence_threshold: float = 0.1
+    log_verbosity: int = 1
+    live_view: bool = True  # 녹음 중 실시간 타이밍 보기 창 (분석 창을 띄우는 실행에서만)
+    # 분석 이미지 저장 형식 (visualizer.IMAGE_FORMATS, 순서대로 저장: 저해상도 미리보기 먼저)
+    image_formats: tuple = ("preview", "png")
+
+    @classmethod
+    def from_config(cls):
+        """config.py 의 대문자 상수를 기본값으로 읽습니다. (config.py 가 없으면 클래스 기본값)"""
+        defaults = {}
+        for field in dataclasses.fields(cls):
+            name = field.name.upper()
+            if hasattr(config, name):
+                defaults[field.name] = getattr(config, name)
+        return cls(**defaults)
+
+    @classmethod
+    def from_dict(cls, data, base=None):
+        """dict 의 값을 base(기본: config.py 기본값)에 덮어써 만듭니다. 모르는 키는 무시합니다."""
+        base = base or cls.from_config()
+        names = {field.name for field in dataclasses.fields(cls)}
+        values = {key: value for key, value in data.items() if key in names}
+        if "input_channels" in values:
+            # JSON 에서는 리스트로 읽힘
+            values["input_channels"] = tuple(int(ch) for ch in values["input_channels"])
+        if "image_formats" in values:
+            values["image_formats"] = tuple(values["image_formats"])
+        if "tempo_map" in values:
+            # JSON 에서는 dict 리스트로 읽힘
+            values["tempo_map"] = tuple(
+                section if isinstance(section, TempoSection) else TempoSection(**section)
+                for section in values["tempo_map"]
+            )
+        return base.replace(**values)
+
+    def to_dict(self):
+        return dataclasses.asdict(self)
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def replace_grid(self, **changes):
+        """
+        replace() 와 같지만 일정 그리드 값(GRID_FIELDS)이 하나라도 주어지면 템포 맵을 지웁니다.
+        (템포 맵이 남아 있으면 바꾼 BPM/박자/그리드 단위가 무시되므로 CLI/GUI 에서 값을 바꿀 때 사용)
+        """
+        if any(name in changes for name in GRID_FIELDS):
+            changes.setdefault("tempo_map", ())
+        return self.replace(**changes)
+
+    @property
+    def grid_label(self):
+        """현재 그리드 설명 (예: '템포 맵 2구간, 100-140 BPM', '100 BPM, 4박, 4분할')"""
+        label = TempoMap.from_settings(self).label
+        if self.tempo_map:
+            return f"템포 맵 {len(self.tempo_map)}구간, {label}"
+        grid = f", {self.chromatic_beats}분할" if self.chromatic_enabled else ""
+        return f"{label}, {self.beats_per_bar}박{grid}"
+
+    @property
+    def required_silence(self):
+        """재감지 전 필요한 무음 길이 (50ms, 샘플 수)"""
+        return int(self.sample_rate * 0.05)
+
+
+def load_settings(path=SETTINGS_FILE):
+    """설정 파일을 읽습니다. 파일이 없으면 config.py 기본값을 반환합니다."""
+    if not os.path.exists(path):
+        return Settings.from_config()
+    with open(path, "r", encoding="utf-8") as f:
+        return Settings.from_dict(json.load(f))
+
+
+def save_settings(settings, path=SETTINGS_FILE):
+    """설정을 JSON 으로 저장합니다. (임시 파일에 쓴 뒤 교체하여 저장 중 종료돼도 기존 파일 보존)"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(settings.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
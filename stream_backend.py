@@ -0,0 +1,221 @@
+# stream_backend.py
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class CallbackStatus:
+    """sounddevice.CallbackFlags 와 같은 속성을 가진 가상 장치용 상태 플래그"""
+    def __init__(self, input_overflow=False, output_underflow=False):
+        self.input_overflow = input_overflow
+        self.output_underflow = output_underflow
+
+    def __bool__(self):
+        return self.input_overflow or self.output_underflow
+
+
+class SoundDeviceBackend:
+    """
+    실제 오디오 장치 백엔드입니다. (sounddevice + ASIO)
+    sounddevice 는 이 백엔드를 만들 때만 임포트합니다.
+    """
+    def __init__(self):
+        # ASIO 활성화를 위해 라이브러리 임포트 전 환경변수 설정
+        os.environ["SD_ENABLE_ASIO"] = "1"
+        import sounddevice as sd
+        self.sd = sd
+
+    def query_channels(self, device):
+        info = self.sd.query_devices(device)
+        return min(info["max_input_channels"], info["max_output_channels"])
+
+    def open_stream(self, device, samplerate, blocksize, channels, callback):
+        return self.sd.Stream(
+            device=device,
+            samplerate=samplerate,
+            blocksize=blocksize,
+            dtype="float32",
+            channels=channels,
+            callback=callback,
+        )
+
+    def sleep(self, ms):
+        self.sd.sleep(ms)
+
+    def wait(self, event, ms):
+        """event 가 설정되거나 ms 가 지날 때까지 기다립니다. 반환값: event 설정 여부"""
+        return event.wait(ms / 1000)
+
+
+class SimulatedStream:
+    """
+    가상 오디오 스트림입니다. 입력 소스에서 BLOCK_SIZE 단위 블록을 만들어 callback 을 호출하고
+    출력(outdata)을 모아둡니다.
+
+    - realtime=True: 별도 스레드가 실제 시간 간격(speed 배속)으로 블록을 처리
+    - realtime=False: sleep(ms) 호출 시 그 시간만큼의 블록을 즉시 처리 (실제 시간보다 빠르고 결정적)
+    - loopback_delay: 샘플 수를 주면 입력 소스 대신 그만큼 늦춘 출력(첫 채널)을 입력으로 사용 (지연 측정 시험용)
+    """
+    def __init__(self, source, samplerate, blocksize, channels, callback, realtime=False, speed=1.0,
+                 loopback_delay=None):
+        self.source = source
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.callback = callback
+        self.realtime = realtime
+        self.speed = speed
+        self.loopback_delay = loopback_delay
+
+        self.samples_processed = 0
+        self.captured_output = []
+        self.active = False
+        self._target_samples = 0
+        self._outdata = np.zeros((blocksize, channels), dtype=np.float32)
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._history = np.zeros(samplerate, dtype=np.float32)  # 루프백용 출력 기록 (필요 시 2배씩 확장)
+
+    def _loopback_input(self, start, frames):
+        """loopback_delay 샘플 전의 출력을 입력 블록으로 만듭니다. (아직 출력되지 않은 구간은 0)"""
+        block = np.zeros(frames, dtype=np.float32)
+        lo = start - self.loopback_delay
+        src_lo, src_hi = max(lo, 0), min(lo + frames, self.samples_processed)
+        if src_hi > src_lo:
+            block[src_lo - lo:src_hi - lo] = self._history[src_lo:src_hi]
+        return block
+
+    def _record_history(self, start, frames):
+        if start + frames > len(self._history):
+            self._history = np.concatenate((self._history, np.zeros_like(self._history)))
+        self._history[start:start + frames] = self._outdata[:frames, 0]
+
+    def _read_input(self, start, frames):
+        """소스에서 (frames, channels) 입력 블록을 만듭니다. 소스가 끝나면 0으로 채웁니다."""
+        if self.loopback_delay is not None:
+            block = self._loopback_input(start, frames)
+        elif callable(self.source):
+            block = np.asarray(self.source(start, frames), dtype=np.float32)
+        elif self.source is None:
+            block = np.zeros(frames, dtype=np.float32)
+        else:
+            block = np.zeros((frames,) + self.source.shape[1:], dtype=np.float32)
+            part = self.source[start:start + frames]
+            block[:len(part)] = part
+
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        if block.shape[1] < self.channels:
+            block = np.repeat(block[:, :1], self.channels, axis=1)
+        return block[:, :self.channels]
+
+    def _run_block(self):
+        frames = self.blocksize
+        indata = self._read_input(self.samples_processed, frames)
+        self._outdata.fill(0)
+        time_info = SimpleNamespace(
+            inputBufferAdcTime=self.samples_processed / self.samplerate,
+            outputBufferDacTime=self.samples_processed / self.samplerate,
+            currentTime=self.samples_processed / self.samplerate,
+        )
+        self.callback(indata, self._outdata, frames, time_info, CallbackStatus())
+        self.captured_output.append(self._outdata.copy())
+        if self.loopback_delay is not None:
+            self._record_history(self.samples_processed, frames)
+        self.samples_processed += frames
+
+    def advance(self, ms):
+        """ms 만큼의 오디오를 즉시 처리합니다. (블록 크기 단위로 누적)"""
+        self._target_samples += int(self.samplerate * ms / 1000)
+        while self.samples_processed + self.blocksize <= self._target_samples:
+            self._run_block()
+
+    def advance_until(self, event, ms):
+        """event 가 설정될 때까지 최대 ms 만큼의 오디오를 블록 단위로 즉시 처리합니다."""
+        target = self.samples_processed + int(self.samplerate * ms / 1000)
+        while not event.is_set() and self.samples_processed < target:
+            self._run_block()
+        self._target_samples = self.samples_processed
+
+    def _realtime_loop(self):
+        block_seconds = self.blocksize / self.samplerate / self.speed
+        next_time = time.perf_counter()
+        while not self._stop_event.is_set():
+            self._run_block()
+            next_time += block_seconds
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def output_array(self):
+        """지금까지 callback 이 출력한 오디오를 (samples, channels) 배열로 반환합니다."""
+        if not self.captured_output:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        return np.concatenate(self.captured_output)
+
+    def __enter__(self):
+        self.active = True
+        if self.realtime:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._realtime_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.active = False
+        return False
+
+
+class SimulatedBackend:
+    """
+    ASIO 장치 없이 전체 녹음/분석 과정을 실행하기 위한 가상 장치 백엔드입니다.
+    source: None(무음), (samples[, channels]) 배열, WAV 파일 경로, 또는 callable(start, frames) -> 배열
+    scale: 입력 배율 (녹음된 take 를 다시 넣을 때는 1 / SOFTWARE_GAIN)
+    loopback_delay: 출력을 이 샘플 수만큼 늦춰 입력으로 되돌림 (source 대신 사용, 왕복 지연 측정 시험용)
+    """
+    def __init__(self, source=None, channels=2, realtime=False, speed=1.0, scale=1.0, loopback_delay=None):
+        if isinstance(source, str):
+            from recording import open_wav, iter_chunks
+            data, _ = open_wav(source)
+            # 정수 PCM 도 -1.0 ~ 1.0 float32 로 변환
+            source = np.concatenate([block for _, block in iter_chunks(data)]) if len(data) else \
+                np.zeros(0, dtype=np.float32)
+        if source is not None and not callable(source) and scale != 1.0:
+            source = np.asarray(source, dtype=np.float32) * np.float32(scale)
+
+        self.source = source
+        self.channels = channels
+        self.realtime = realtime
+        self.speed = speed
+        self.loopback_delay = loopback_delay
+        self.stream = None
+
+    def query_channels(self, device):
+        return self.channels
+
+    def open_stream(self, device, samplerate, blocksize, channels, callback):
+        self.stream = SimulatedStream(
+            self.source, samplerate, blocksize, channels, callback, self.realtime, self.speed,
+            self.loopback_delay
+        )
+        return self.stream
+
+    def sleep(self, ms):
+        if self.stream is not None and self.stream.active and not self.realtime:
+            self.stream.advance(ms)
+        else:
+            time.sleep(ms / 1000)
+
+    def wait(self, event, ms):
+        """event 가 설정되거나 ms 가 지날 때까지 기다립니다. (가상 시간이면 그만큼의 블록을 바로 처리)"""
+        if self.stream is not None and self.stream.active and not self.realtime:
+            self.stream.advance_until(event, ms)
+            return event.is_set()
+        return event.wait(ms / 1000)
@@ -0,0 +1,65 @@
+# synthetic.py
+# 벤치마크/검증용 합성 기타 신호 생성기: 연주 시작 시각(정답)을 알고 있는 피킹 신호를 만듭니다.
+
+import numpy as np
+from utils import generate_sine_wave
+
+# 기타 개방현 기본 주파수 (E2 ~ E4)
+OPEN_STRINGS_HZ = (82.41, 110.0, 146.83, 196.0, 246.94, 329.63)
+
+
+def generate_take(duration, sample_rate, bpm=120, notes_per_beat=4, jitter_ms=5.0, noise_floor=0.02,
+                  amplitude=(0.4, 0.9), decay_factor=40, start_offset=0.0, seed=0):
+    """
+    그리드에 맞춰 감쇠 사인파(피킹)를 배치한 합성 녹음을 생성합니다.
+    녹음 데이터와 같은 범위(-1.0 ~ 1.0, 증폭 후)의 float32 신호입니다.
+
+    - jitter_ms: 각 연주 시각의 무작위 오차 표준편차 (ms)
+    - noise_floor: 배경 잡음 표준편차
+    - amplitude: 피킹 세기 범위 (최소, 최대)
+    반환값: (신호, 실제 연주 시작 샘플 인덱스 배열, 의도한 그리드 시각 배열(초))
+    """
+    rng = np.random.default_rng(seed)
+    num_samples = int(duration * sample_rate)
+    signal = rng.normal(0.0, noise_floor, num_samples).astype(np.float32)
+
+    note_interval = 60.0 / bpm / notes_per_beat
+    grid_times = np.arange(start_offset, duration - note_interval, note_interval)
+    played = grid_times + rng.normal(0.0, jitter_ms / 1000, len(grid_times))
+    onsets = np.sort(np.clip(np.round(played * sample_rate).astype(np.int64), 0, num_samples - 1))
+
+    plucks = [generate_sine_wave(note_interval * 1000, f, sample_rate, decay_factor) for f in OPEN_STRINGS_HZ]
+    for onset in onsets:
+        pluck = plucks[rng.integers(len(plucks))]
+        end = min(onset + len(pluck), num_samples)
+        signal[onset:end] += rng.uniform(*amplitude) * pluck[:end - onset]
+
+    np.clip(signal, -1.0, 1.0, out=signal)
+    return signal, onsets, grid_times
+
+
+def score_detection(detected, truth, sample_rate, window_ms=10.0):
+    """
+    감지 결과를 정답과 비교합니다. window_ms 이내에서 1:1 로 짝지은 뒤
+    재현율(recall), 정밀도(precision), 평균 절대 오차(ms)를 반환합니다.
+    """
+    detected = np.asarray(detected, dtype=np.int64)
+    truth = np.asarray(truth, dtype=np.int64)
+    if len(detected) == 0 or len(truth) == 0:
+        return {"recall": 0.0, "precision": 0.0, "mean_abs_error_ms": float("nan")}
+
+    window = window_ms / 1000 * sample_rate
+    k = np.searchsorted(truth, detected)
+    left = truth[np.clip(k - 1, 0, len(truth) - 1)]
+    right = truth[np.clip(k, 0, len(truth) - 1)]
+    nearest = np.where(np.abs(detected - left) <= np.abs(detected - right), left, right)
+    errors = detected - nearest
+    matched = np.abs(errors) <= window
+    unique_hits = len(np.unique(nearest[matched]))
+
+    return {
+        "recall": unique_hits / len(truth),
+        "precision": unique_hits / len(detected),
+        "mean_abs_error_ms": float(np.mean(np.abs(errors[matched])) / sample_rate * 1000) if matched.any()
+        else float("nan"),
+    }
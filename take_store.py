@@ -0,0 +1,383 @@
+# take_store.py
+# 녹음 take 저장소: 녹음마다 16비트 PCM 오디오 + 메타데이터(JSON) + 감지된 연주 지점을 저장하고,
+# 분석 결과는 오디오 내용 해시 + 분석 설정으로 만든 키로 캐시합니다. (LRU 방식으로 오래된 항목 삭제)
+# 허용 오차/그리드/템포를 바꿔 다시 채점하거나 다시 그릴 때 재녹음도, 감지 재실행도 필요 없습니다.
+#
+# 실행: python take_store.py list
+#       python take_store.py rescore TAKE_ID --tolerance 0.02 --chromatic-beats 8 --png
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+from datetime import datetime
+
+import numpy as np
+from settings import Settings
+from recording import open_wav, write_pcm16_wav, DEFAULT_CHUNK_SIZE
+from analyzer import find_onset_indices_multires, refine_onset_positions, ENVELOPE_RATE
+from timing import analyze_timing, settings_grid_points, TimingAnalysis
+from rhythm_stats import analysis_stats
+
+# take 를 저장할 폴더명
+TAKES_DIR = "takes"
+INDEX_FILE = "index.json"
+CACHE_DIR = "cache"
+MAX_CACHE_ENTRIES = 256  # 캐시 항목 수 상한 (넘으면 가장 오래 사용하지 않은 항목부터 삭제)
+
+# 캐시 키에 들어가는 설정 (감지 결과는 감지 설정에만, 채점 결과는 그리드 설정에도 의존)
+DETECTION_FIELDS = ("sample_rate", "threshold", "silence_threshold")
+TIMING_FIELDS = DETECTION_FIELDS + (
+    "metronome_bpm", "beats_per_bar", "chromatic_enabled", "chromatic_beats", "tempo_map", "tolerance",
+)
+# take 목록(index.json)에 함께 기록하는 첫 채널 리듬 통계 (대시보드용)
+INDEX_RHYTHM_FIELDS = ("mean_error_ms", "std_error_ms", "rushing_s", "dragging_s")
+
+
+def _write_json(path, data):
+    """JSON 을 임시 파일에 쓴 뒤 교체합니다. (저장 중 종료돼도 기존 파일 보존)"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def content_hash(signal, chunk_size=DEFAULT_CHUNK_SIZE):
+    """오디오 데이터(np.memmap 포함)의 내용 해시를 chunk 단위로 계산합니다."""
+    digest = hashlib.blake2b(digest_size=16)
+    for start in range(0, len(signal), chunk_size):
+        digest.update(np.ascontiguousarray(signal[start:start + chunk_size]).tobytes())
+    return digest.hexdigest()
+
+
+def analysis_params(settings, fields, **extra):
+    # to_dict 값은 JSON 으로 직렬화 가능 (템포 맵 구간도 dict 로 바뀜)
+    values = settings.to_dict()
+    params = {name: values[name] for name in fields}
+    params.update(extra)
+    return params
+
+
+class AnalysisCache:
+    """
+    분석 결과(배열 dict)를 .npz 파일로 저장하는 캐시입니다.
+    사용할 때마다 파일 수정 시각을 갱신하고, 항목이 max_entries 를 넘으면 가장 오래된 것부터 삭제합니다.
+    """
+    def __init__(self, folder, max_entries=MAX_CACHE_ENTRIES):
+        self.folder = folder
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(kind, audio_hash, params):
+        text = json.dumps({"kind": kind, "hash": audio_hash, "params": params}, sort_keys=True)
+        return f"{kind}_{hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + ".npz")
+
+    def get(self, key):
+        """저장된 배열 dict 를 반환합니다. (없으면 None)"""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return arrays
+
+    def put(self, key, **arrays):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = [os.path.join(self.folder, n) for n in os.listdir(self.folder) if n.endswith(".npz")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class Take:
+    """
+    저장된 take 하나 (오디오는 memmap 으로 열림, 정수 PCM 은 recording.read_range 로 변환해 사용)
+    indices/positions 는 채널별 리스트입니다.
+    """
+    def __init__(self, take_id, folder, meta, audio, indices, positions):
+        self.take_id = take_id
+        self.folder = folder
+        self.meta = meta
+        self.audio = audio
+        self.indices = indices
+        self.positions = positions
+
+    @property
+    def channels(self):
+        return 1 if self.audio.ndim == 1 else self.audio.shape[1]
+
+    def signal(self, channel=0):
+        return self.audio if self.audio.ndim == 1 else self.audio[:, channel]
+
+    @property
+    def settings(self):
+        """녹음할 때의 설정"""
+        return Settings.from_dict(self.meta["settings"])
+
+    @property
+    def audio_hash(self):
+        return self.meta["audio_hash"]
+
+    @property
+    def grid_offset(self):
+        return self.meta["grid_offset"]
+
+
+class TakeStore:
+    """
+    take 저장/목록/다시 분석을 담당합니다.
+    폴더 구조: root/index.json, root/<take_id>/{audio.wav, meta.json, onsets.npz}, root/cache/*.npz
+    """
+    def __init__(self, root=TAKES_DIR, max_cache_entries=MAX_CACHE_ENTRIES):
+        self.root = root
+        self.cache = AnalysisCache(os.path.join(root, CACHE_DIR), max_cache_entries)
+
+    def _take_folder(self, take_id):
+        return os.path.join(self.root, take_id)
+
+    def list_takes(self):
+        """take 목록 (오래된 순)"""
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_take(self, audio, settings, indices, positions, grid_offset=0.0, latency_samples=None, rhythm=None):
+        """
+        녹음(증폭 후 -1.0 ~ 1.0 신호, 다채널은 (frames, channels))과 녹음 중 감지된 연주 지점을 저장하고
+        take id 를 반환합니다. indices/positions 는 채널별 리스트입니다.
+        grid_offset/latency_samples 는 다시 분석할 때 같은 그리드 위치를 쓰기 위해 함께 기록합니다.
+        rhythm: 채널별 리듬 통계 요약 (rhythm_stats.RhythmStats.summary, meta.json 에 저장하고 첫 채널 값은 목록에도 기록)
+        """
+        base_id = take_id = datetime.now().strftime("take_%Y%m%d_%H%M%S")
+        suffix = 1
+        while os.path.exists(self._take_folder(take_id)):
+            # 같은 초에 저장된 take 가 있으면 번호를 붙임
+            suffix += 1
+            take_id = f"{base_id}_{suffix}"
+        folder = self._take_folder(take_id)
+        os.makedirs(folder)
+
+        audio_path = os.path.join(folder, "audio.wav")
+        write_pcm16_wav(audio_path, audio, settings.sample_rate)
+        stored, _ = open_wav(audio_path)
+        audio_hash = content_hash(stored)
+
+        # 채널별 연주 지점은 이어 붙여 저장하고 채널별 개수(counts)로 나눔
+        counts = np.array([len(i) for i in indices], dtype=np.int64)
+        with open(os.path.join(folder, "onsets.npz"), "wb") as f:
+            np.savez(
+                f, counts=counts,
+                indices=np.concatenate([np.asarray(i, dtype=np.int64) for i in indices]),
+                positions=np.concatenate([np.asarray(p, dtype=np.float64) for p in positions]),
+            )
+
+        meta = {
+            "take_id": take_id,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "audio_hash": audio_hash,
+            "num_samples": len(stored),
+            "settings": settings.to_dict(),
+            "grid_offset": float(grid_offset),
+            "latency_samples": None if latency_samples is None else float(latency_samples),
+            "rhythm": rhythm,
+        }
+        _write_json(os.path.join(folder, "meta.json"), meta)
+
+        entries = self.list_takes()
+        entries.append({
+            "take_id": take_id,
+            "created": meta["created"],
+            "duration_s": round(len(stored) / settings.sample_rate, 3),
+            "bpm": settings.metronome_bpm,
+            "channels": list(settings.input_channels),
+            "onset_count": int(counts.sum()),
+            "audio_hash": audio_hash,
+        })
+        if rhythm:
+            entries[-1].update({name: rhythm[0][name] for name in INDEX_RHYTHM_FIELDS})
+        _write_json(os.path.join(self.root, INDEX_FILE), entries)
+        return take_id
+
+    def load_take(self, take_id):
+        folder = self._take_folder(take_id)
+        with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        audio, _ = open_wav(os.path.join(folder, "audio.wav"))
+        with np.load(os.path.join(folder, "onsets.npz")) as data:
+            split = np.cumsum(data["counts"])[:-1]
+            indices, positions = np.split(data["indices"], split), np.split(data["positions"], split)
+        return Take(take_id, folder, meta, audio, indices, positions)
+
+    def detect(self, take, settings, channel=0):
+        """
+        settings 의 감지 설정으로 찾은 채널의 연주 지점 (인덱스, 샘플 이하 해상도 위치)을 반환합니다.
+        녹음 때와 감지 설정이 같으면 저장된 결과를, 다르면 캐시를 사용하고 없을 때만 감지를 실행합니다.
+        """
+        params = analysis_params(settings, DETECTION_FIELDS)
+        if params == analysis_params(take.settings, DETECTION_FIELDS):
+            return take.indices[channel], take.positions[channel]
+
+        params["channel"] = channel
+        key = self.cache.key("detect", take.audio_hash, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached["indices"], cached["positions"]
+
+        signal = take.signal(channel)
+        indices = find_onset_indices_multires(
+            signal, settings.threshold, settings.silence_threshold, settings.required_silence,
+            settings.sample_rate // ENVELOPE_RATE
+        )
+        positions = refine_onset_positions(signal, indices, settings.threshold)
+        self.cache.put(key, indices=indices, positions=positions)
+        return indices, positions
+
+    def analyze(self, take, settings, grid_offset=None, channel=0):
+        """
+        settings 로 다시 채점한 채널의 timing.TimingAnalysis 를 반환합니다. (결과 캐시 사용)
+        grid_offset: 그리드 이동량 (초, 기본: 녹음 때 값)
+        """
+        if grid_offset is None:
+            grid_offset = take.grid_offset
+        params = analysis_params(settings, TIMING_FIELDS, grid_offset=grid_offset, channel=channel)
+        key = self.cache.key("timing", take.audio_hash, params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return TimingAnalysis(cached["grid_times"], cached["grid_kinds"], cached["onsets"], settings.tolerance)
+
+        indices, positions = self.detect(take, settings, channel)
+        timing = analyze_timing(indices, len(take.audio), settings, positions, grid_offset)
+        self.cache.put(key, grid_times=timing.grid_times, grid_kinds=timing.grid_kinds, onsets=timing.onsets)
+        return timing
+
+    def rhythm(self, take, settings, grid_offset=None, channel=0):
+        """settings 로 다시 채점한 채널의 리듬 통계 요약 (rhythm_stats.RhythmStats.summary)"""
+        if grid_offset is None:
+            grid_offset = take.grid_offset
+        timing = self.analyze(take, settings, grid_offset, channel)
+        grid_beats = settings_grid_points(len(take.audio), settings, grid_offset)["beat"]
+        return analysis_stats(timing, grid_beats).summary()
+
+    def envelope(self, take, buckets, channel=0):
+        """파형 그림용 포락선 (visualizer.compute_envelope 결과, 캐시 사용)"""
+        from visualizer import compute_envelope
+
+        key = self.cache.key("envelope", take.audio_hash, {"buckets": buckets, "channel": channel})
+        cached = self.cache.get(key)
+        if cached is not None:
+            return int(cached["bucket_size"]), cached["mins"], cached["maxs"]
+
+        bucket_size, mins, maxs = compute_envelope(take.signal(channel), buckets)
+        self.cache.put(key, bucket_size=np.int64(bucket_size), mins=mins, maxs=maxs)
+        return bucket_size, mins, maxs
+
+    def figure(self, take, settings, timings):
+        """채점 결과(채널별 TimingAnalysis 리스트)의 분석 그림을 만듭니다. (포락선은 캐시 사용)"""
+        from visualizer import create_waveform_with_metronome, ENVELOPE_BUCKETS
+
+        envelopes = [self.envelope(take, ENVELOPE_BUCKETS, ch) for ch in range(take.channels)]
+        if take.channels == 1:
+            return create_waveform_with_metronome(take.audio, settings, timing=timings[0], envelope=envelopes[0])
+        return create_waveform_with_metronome(take.audio, settings, timing=timings, envelope=envelopes)
+
+    def render(self, take, settings, timings, filename=None, output_dir=None, image_format="png"):
+        """
+        채점 결과를 그려 이미지로 저장하고 경로를 반환합니다.
+        image_format: visualizer.IMAGE_FORMATS 의 저장 형식
+        """
+        import matplotlib.pyplot as plt
+        from visualizer import save_analysis_image, OUTPUT_DIR
+
+        fig = self.figure(take, settings, timings)
+        path = save_analysis_image(fig, filename=filename, output_dir=output_dir or OUTPUT_DIR,
+                                   image_format=image_format)
+        plt.close(fig)
+        return path
+
+
+def main(argv=None):
+    from batch_analyze import SETTINGS_OVERRIDES
+    from timing import print_timing_summary, compare_channels, print_channel_comparison
+    from rhythm_stats import print_rhythm_summary
+
+    parser = argparse.ArgumentParser(description="저장된 take 목록 확인 및 재녹음 없이 다시 채점")
+    parser.add_argument("--root", default=TAKES_DIR, help="take 저장 폴더")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="저장된 take 목록")
+    rescore = commands.add_parser("rescore", help="설정을 바꿔 다시 채점")
+    rescore.add_argument("take_id")
+    rescore.add_argument("--png", action="store_true", help="분석 이미지 저장")
+    rescore.add_argument("--grid-offset-ms", type=float, help="그리드 이동량 (기본: 녹음 때 값)")
+    rescore.add_argument("--bpm", type=float)
+    rescore.add_argument("--beats-per-bar", type=int)
+    rescore.add_argument("--chromatic-beats", type=int)
+    rescore.add_argument("--no-tempo-map", action="store_true",
+                         help="녹음 때의 템포 맵 대신 BPM/박자 설정으로 일정한 그리드 사용 (--bpm 등을 주면 자동)")
+    rescore.add_argument("--tolerance", type=float)
+    rescore.add_argument("--threshold", type=float)
+    rescore.add_argument("--silence-threshold", type=float)
+    args = parser.parse_args(argv)
+
+    store = TakeStore(args.root)
+    if args.command == "list":
+        for entry in store.list_takes():
+            print(f"{entry['take_id']} | {entry['created']} | {entry['duration_s']:.1f}s | "
+                  f"{entry['bpm']} BPM | 채널 {entry['channels']} | 연주 {entry['onset_count']}개")
+        return 0
+
+    try:
+        take = store.load_take(args.take_id)
+    except (OSError, ValueError) as e:
+        print(f"[오류] take 를 열 수 없습니다: {e}", file=sys.stderr)
+        return 1
+
+    overrides = {
+        name: getattr(args, option) for option, name in SETTINGS_OVERRIDES.items()
+        if getattr(args, option) is not None
+    }
+    if args.no_tempo_map:
+        overrides["tempo_map"] = ()
+    # BPM/박자/그리드 단위를 바꾸면 그 값을 덮어쓰는 템포 맵은 지움
+    settings = take.settings.replace_grid(**overrides)
+    print(f"[설정] 그리드: {settings.grid_label}")
+    offset = None if args.grid_offset_ms is None else args.grid_offset_ms / 1000
+    timings = [store.analyze(take, settings, offset, ch) for ch in range(take.channels)]
+    if take.channels == 1:
+        print_timing_summary(timings[0])
+    else:
+        print_channel_comparison(timings, compare_channels(timings), settings.input_channels)
+    for ch in range(take.channels):
+        if take.channels > 1:
+            print(f"\n[채널 {settings.input_channels[ch]}]")
+        print_rhythm_summary(store.rhythm(take, settings, offset, ch))
+
+    if args.png:
+        import matplotlib
+        matplotlib.use("Agg")
+        print(f"[완료] {store.render(take, settings, timings, filename=f'{take.take_id}_rescore.png')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# tempo_map.py
+# 템포 맵 / 박자 변경을 반영한 그리드 엔진:
+# 구간(TempoSection)마다 마디 수, 템포(마디 단위로 바뀌는 가속/감속 포함), 마디당 박 수, 박당 세부 그리드 수를 정하고,
+# 세션 전체의 그리드 지점을 한 번에 정렬된 구조화 배열로 계산합니다.
+# 오디오 콜백의 클릭 재생(audio_engine)과 분석의 그리드 매칭(timing)이 같은 배열을 사용합니다.
+
+from dataclasses import dataclass
+
+import numpy as np
+
+# 그리드 지점 종류
+GRID_BAR = 0   # 마디 시작 (강박)
+GRID_BEAT = 1  # 박 (약박)
+GRID_SUB = 2   # 세부 그리드 (8/16분음표, 셋잇단 등)
+
+# 그리드 지점
+GRID_POINT_DTYPE = np.dtype([
+    ("time", np.float64),   # 시각 (초)
+    ("kind", np.int64),     # GRID_BAR / GRID_BEAT / GRID_SUB
+    ("beat", np.float64),   # 마디 안 위치 (박)
+    ("bar", np.int64),      # 마디 번호 (맵 시작 마디 = 0, 그 전(카운트인)은 음수)
+])
+
+# 한 박 안에서 세부 그리드가 정박과 겹치는지 판정하는 허용 오차 (박 단위)
+_BEAT_EPS = 1e-9
+
+
+@dataclass(frozen=True)
+class TempoSection:
+    """
+    템포 맵의 한 구간. 구간 안의 마디마다 템포를 bpm 에서 bpm_end 까지 일정하게 바꿉니다. (마디 안에서는 일정)
+    마지막 구간은 bars 마디 이후에도 bpm_end 템포로 세션 끝까지 이어집니다.
+    subdivisions: 박당 그리드 수 (1 = 박만, 2 = 8분, 3 = 셋잇단, 4 = 16분)
+    """
+    bars: int
+    bpm: float
+    beats_per_bar: int = 4
+    subdivisions: float = 1
+    bpm_end: float = None
+
+    def __post_init__(self):
+        if self.bars < 1 or self.beats_per_bar < 1:
+            raise ValueError(f"마디 수와 마디당 박 수는 1 이상이어야 합니다: {self}")
+        if self.bpm <= 0 or (self.bpm_end is not None and self.bpm_end <= 0):
+            raise ValueError(f"템포는 0보다 커야 합니다: {self}")
+        if self.subdivisions <= 0:
+            raise ValueError(f"세부 그리드 수는 0보다 커야 합니다: {self}")
+
+    @property
+    def end_bpm(self):
+        return self.bpm if self.bpm_end is None else self.bpm_end
+
+    def bar_tempos(self):
+        """구간 안 마디별 템포"""
+        return np.linspace(self.bpm, self.end_bpm, self.bars)
+
+
+class TempoMap:
+    """
+    구간 목록으로 만든 템포 맵. 맵 시작(0초)은 첫 구간 첫 마디 시작이고,
+    그 전(카운트인)은 첫 구간 첫 마디 템포/박자로 거꾸로 이어집니다.
+    """
+    def __init__(self, sections):
+        if not sections:
+            raise ValueError("템포 맵에는 구간이 하나 이상 있어야 합니다.")
+        self.sections = tuple(sections)
+        first = self.sections[0]
+        # 카운트인 마디 길이 (초)
+        self.first_bar_seconds = first.beats_per_bar * 60.0 / first.bpm
+
+    @classmethod
+    def from_settings(cls, settings):
+        """settings.tempo_map 이 비어 있으면 metronome_bpm / beats_per_bar / chromatic_beats 로 한 구간을 만듭니다."""
+        if settings.tempo_map:
+            return cls(settings.tempo_map)
+        subdivisions = settings.chromatic_beats / 4 if settings.chromatic_enabled else 1
+        return cls([TempoSection(1, settings.metronome_bpm, settings.beats_per_bar, subdivisions)])
+
+    @property
+    def label(self):
+        """그림 제목용 템포 표시 (예: '100 BPM', '100-140 BPM')"""
+        tempos = [t for s in self.sections for t in (s.bpm, s.end_bpm)]
+        low, high = min(tempos), max(tempos)
+        return f"{low:g} BPM" if low == high else f"{low:g}-{high:g} BPM"
+
+    @property
+    def max_beats_per_bar(self):
+        return max(s.beats_per_bar for s in self.sections)
+
+    def countin_samples(self, countin_bars, sample_rate):
+        """카운트인(첫 구간 첫 마디 템포) 길이 (샘플 수)"""
+        return int(round(countin_bars * self.first_bar_seconds * sample_rate))
+
+    def _bars(self, start, end):
+        """
+        [start, end) 초 범위와 겹치는 마디의 (시작 시각, 박 길이, 박 수, 세부 그리드 수, 마디 번호) 배열.
+        구간 경계의 마디 시작 시각은 앞 마디 길이의 누적 합입니다.
+        """
+        first = self.sections[0]
+        # 맵 시작 전 마디 (카운트인 / 음수 offset)
+        pre = max(0, int(np.ceil(-start / self.first_bar_seconds - _BEAT_EPS)))
+        tempos = [np.full(pre, float(first.bpm))]
+        beats = [np.full(pre, first.beats_per_bar)]
+        subs = [np.full(pre, float(first.subdivisions))]
+
+        elapsed = 0.0
+        for i, section in enumerate(self.sections):
+            section_tempos = section.bar_tempos()
+            if i == len(self.sections) - 1:
+                # 마지막 구간은 끝 템포로 end 까지 연장
+                remaining = end - elapsed - (section.beats_per_bar * 60.0 / section_tempos).sum()
+                extra = max(0, int(np.ceil(remaining * section.end_bpm / (section.beats_per_bar * 60.0))))
+                section_tempos = np.concatenate((section_tempos, np.full(extra, float(section.end_bpm))))
+            tempos.append(section_tempos)
+            beats.append(np.full(len(section_tempos), section.beats_per_bar))
+            subs.append(np.full(len(section_tempos), float(section.subdivisions)))
+            elapsed += (section.beats_per_bar * 60.0 / section_tempos).sum()
+            if elapsed >= end:
+                break
+
+        tempos, beats, subs = np.concatenate(tempos), np.concatenate(beats), np.concatenate(subs)
+        beat_seconds = 60.0 / tempos
+        lengths = beats * beat_seconds
+        starts = np.concatenate(([0.0], np.cumsum(lengths[pre:])[:-1]))
+        starts = np.concatenate((-self.first_bar_seconds * np.arange(pre, 0, -1), starts))
+        numbers = np.arange(-pre, len(tempos) - pre)
+
+        keep = (starts < end) & (starts + lengths > start)
+        return starts[keep], beat_seconds[keep], beats[keep], subs[keep], numbers[keep]
+
+    def grid_points(self, duration, offset=0.0, start=0.0):
+        """
+        맵 시작을 offset 초에 둔 그리드 중 [start, duration) 범위의 지점을 정렬된 GRID_POINT_DTYPE 배열로 반환합니다.
+        (세션 그리드는 세션 전체로 한 번만 계산하고 grid_window 로 잘라 사용)
+        """
+        starts, beat_seconds, beats, subs, numbers = self._bars(start - offset, duration - offset)
+
+        # 마디별 지점 수 (박 수 x 세부 그리드 수, 마디 끝에서 잘림)
+        counts = np.ceil(beats * subs - _BEAT_EPS).astype(np.int64)
+        total = int(counts.sum())
+        bar = np.repeat(np.arange(len(starts)), counts)
+        j = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        position = j / subs[bar]  # 마디 안 위치 (박)
+        on_beat = np.abs(position - np.round(position)) < _BEAT_EPS
+        position = np.where(on_beat, np.round(position), position)
+
+        points = np.zeros(total, dtype=GRID_POINT_DTYPE)
+        points["time"] = offset + starts[bar] + position * beat_seconds[bar]
+        points["kind"] = np.where(j == 0, GRID_BAR, np.where(on_beat, GRID_BEAT, GRID_SUB))
+        points["beat"] = position
+        points["bar"] = numbers[bar]
+        # 마디 시작 시각은 누적 합이므로 정렬되어 있음 (범위 밖 지점만 제외)
+        return points[(points["time"] >= start) & (points["time"] < duration)]
+
+    def grid(self, duration, offset=0.0):
+        """grid_points 의 (시각 배열, 종류 배열)"""
+        points = self.grid_points(duration, offset)
+        return points["time"], points["kind"]
+
+
+def window_points(points, start, duration):
+    """grid_window 와 같은 범위의 그리드 지점 전체(GRID_POINT_DTYPE, 마디 안 위치 포함) 복사본"""
+    lo, hi = np.searchsorted(points["time"], [start, start + duration])
+    window = points[lo:hi].copy()
+    window["time"] -= start
+    return window
+
+
+def grid_window(points, start, duration):
+    """
+    정렬된 그리드 지점 중 [start, start + duration) 범위를 이진 탐색으로 잘라 start 기준 시각으로 옮깁니다.
+    반환값: (시각 배열, 종류 배열)
+    """
+    times = points["time"]
+    lo, hi = np.searchsorted(times, [start, start + duration])
+    return times[lo:hi] - start, points["kind"][lo:hi]
+
+
+def click_schedule(points, sample_rate):
+    """
+    그리드 지점 중 0초 이후의 박(강박/약박)만 골라 클릭 재생 위치(샘플, 가장 가까운 샘플로 반올림)와
+    강박 여부를 반환합니다.
+    """
+    beats = points[(points["kind"] != GRID_SUB) & (points["time"] >= 0)]
+    return np.round(beats["time"] * sample_rate).astype(np.int64), beats["kind"] == GRID_BAR
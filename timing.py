@@ -0,0 +1,198 @@
+# timing.py
+import numpy as np
+# 그리드 지점 종류(GRID_*)는 tempo_map 에 정의 (기존 import 경로 유지)
+from tempo_map import TempoMap, TempoSection, GRID_BAR, GRID_BEAT, GRID_SUB
+
+# 감지된 연주 지점별 분석 결과
+ONSET_DTYPE = np.dtype([
+    ("index", np.int64),     # 샘플 인덱스
+    ("time", np.float64),    # 시각 (초)
+    ("slot", np.int64),      # 가장 가까운 그리드 지점 번호 (그리드가 비어 있으면 -1)
+    ("error", np.float64),   # 부호 있는 오차 (초, 양수 = 늦음)
+    ("on_grid", np.bool_),   # 허용 오차(tolerance) 이내 여부
+])
+
+# 기준 채널 대비 다른 채널(연주자)의 시차 통계
+CHANNEL_PAIR_DTYPE = np.dtype([
+    ("channel", np.int64),          # 비교 채널 번호 (analyses 순서)
+    ("paired", np.int64),           # 두 채널 모두 허용 오차 이내로 연주한 그리드 지점 수
+    ("mean_offset", np.float64),    # 평균 시차 (초, 양수 = 기준 채널보다 늦음, 함께 연주한 지점이 없으면 nan)
+    ("std_offset", np.float64),     # 시차 표준편차 (초)
+])
+
+
+def build_grid(duration, bpm, beats_per_bar, chromatic_enabled=True, chromatic_beats=4, offset=0.0):
+    """
+    일정한 템포/박자의 정박과 세부 그리드 시각을 정렬된 배열로 반환합니다. (tempo_map.TempoMap 한 구간)
+    offset: 첫 마디 시작 시각 (초). 녹음 시작 전(음수)이나 후(양수)에 마디가 시작될 때 사용하며,
+            [0, duration) 범위의 지점만 반환합니다.
+    반환값: (시각 배열, 종류 배열(GRID_BAR / GRID_BEAT / GRID_SUB))
+    """
+    subdivisions = chromatic_beats / 4 if chromatic_enabled else 1
+    return TempoMap([TempoSection(1, bpm, beats_per_bar, subdivisions)]).grid(duration, offset)
+
+
+def match_onsets(detected_indices, grid_times, sample_rate, tolerance, positions=None):
+    """
+    감지된 연주 지점을 정렬된 그리드와 이진 탐색(searchsorted)으로 매칭합니다.
+    positions(샘플 이하 해상도 위치, analyzer.refine_onset_positions)를 주면 시각 계산에 사용합니다.
+    반환값: ONSET_DTYPE 구조화 배열
+    """
+    indices = np.asarray(detected_indices, dtype=np.int64)
+    onsets = np.zeros(len(indices), dtype=ONSET_DTYPE)
+    onsets["index"] = indices
+    onsets["time"] = (indices if positions is None else np.asarray(positions, dtype=np.float64)) / sample_rate
+
+    if len(grid_times) == 0:
+        onsets["slot"] = -1
+        onsets["error"] = np.nan
+        return onsets
+
+    times = onsets["time"]
+    k = np.searchsorted(grid_times, times)
+    left = np.clip(k - 1, 0, len(grid_times) - 1)
+    right = np.clip(k, 0, len(grid_times) - 1)
+    use_right = np.abs(grid_times[right] - times) < np.abs(times - grid_times[left])
+    slots = np.where(use_right, right, left)
+
+    onsets["slot"] = slots
+    onsets["error"] = times - grid_times[slots]
+    onsets["on_grid"] = np.abs(onsets["error"]) < tolerance
+    return onsets
+
+
+class TimingAnalysis:
+    """
+    그리드 매칭 결과 모음입니다. 시각화와 통계 출력은 이 결과만 사용합니다.
+    """
+    def __init__(self, grid_times, grid_kinds, onsets, tolerance):
+        self.grid_times = grid_times
+        self.grid_kinds = grid_kinds
+        self.onsets = onsets
+        self.tolerance = tolerance
+
+        on_grid = onsets[onsets["on_grid"]]
+        # 같은 그리드 지점에 두 번 이상 매칭된 연주는 추가 연주로 취급
+        duplicate = np.zeros(len(on_grid), dtype=bool)
+        duplicate[1:] = on_grid["slot"][1:] == on_grid["slot"][:-1]
+
+        hit = np.zeros(len(grid_times), dtype=bool)
+        hit[on_grid["slot"]] = True
+        self.missed_slots = np.flatnonzero(~hit)
+        self.extra_indices = np.sort(np.concatenate((
+            onsets["index"][~onsets["on_grid"]], on_grid["index"][duplicate]
+        )))
+
+    @property
+    def off_grid_count(self):
+        return int(np.count_nonzero(~self.onsets["on_grid"]))
+
+    @property
+    def off_grid_ratio(self):
+        if len(self.onsets) == 0:
+            return 0.0
+        return self.off_grid_count / len(self.onsets)
+
+
+def settings_grid(num_samples, settings, grid_offset=0.0):
+    """settings 의 템포 맵(tempo_map.TempoMap.from_settings)으로 녹음 길이에 맞는 그리드를 만듭니다."""
+    return TempoMap.from_settings(settings).grid(num_samples / settings.sample_rate, grid_offset)
+
+
+def settings_grid_points(num_samples, settings, grid_offset=0.0):
+    """settings_grid 와 같은 그리드 지점 (GRID_POINT_DTYPE, 마디 안 위치 포함)"""
+    return TempoMap.from_settings(settings).grid_points(num_samples / settings.sample_rate, grid_offset)
+
+
+def analyze_timing(detected_indices, num_samples, settings, positions=None, grid_offset=0.0, grid=None):
+    """
+    녹음 길이에 맞는 그리드를 만들고 감지된 연주 지점을 매칭합니다.
+    (템포 맵/허용 오차/샘플 레이트는 settings 값 사용, positions 는 match_onsets 참고)
+    grid_offset: 그리드 이동량 (초, latency.grid_offset 참고)
+    grid: 미리 계산한 (시각 배열, 종류 배열) (세션 그리드를 자른 것, 주면 grid_offset 은 무시)
+    """
+    grid_times, grid_kinds = grid if grid is not None else settings_grid(num_samples, settings, grid_offset)
+    onsets = match_onsets(detected_indices, grid_times, settings.sample_rate, settings.tolerance, positions)
+    return TimingAnalysis(grid_times, grid_kinds, onsets, settings.tolerance)
+
+
+def analyze_timing_channels(channel_indices, num_samples, settings, channel_positions=None, grid_offset=0.0,
+                            grid=None):
+    """
+    여러 채널(연주자)의 연주 지점을 같은 그리드에 한 번에 매칭합니다.
+    채널별 연주 지점을 이어 붙여 match_onsets 를 한 번만 호출한 뒤 채널별로 나눕니다.
+    (grid 는 analyze_timing 참고)
+    반환값: 채널별 TimingAnalysis 리스트
+    """
+    grid_times, grid_kinds = grid if grid is not None else settings_grid(num_samples, settings, grid_offset)
+    counts = [len(indices) for indices in channel_indices]
+    indices = np.concatenate([np.asarray(i, dtype=np.int64) for i in channel_indices])
+    positions = None if channel_positions is None else \
+        np.concatenate([np.asarray(p, dtype=np.float64) for p in channel_positions])
+    onsets = match_onsets(indices, grid_times, settings.sample_rate, settings.tolerance, positions)
+    return [
+        TimingAnalysis(grid_times, grid_kinds, part, settings.tolerance)
+        for part in np.split(onsets, np.cumsum(counts)[:-1])
+    ]
+
+
+def slot_times(analysis):
+    """그리드 지점별 첫 정박 연주 시각 (연주가 없으면 nan)"""
+    times = np.full(len(analysis.grid_times), np.nan)
+    on_grid = analysis.onsets[analysis.onsets["on_grid"]]
+    slots, first = np.unique(on_grid["slot"], return_index=True)
+    times[slots] = on_grid["time"][first]
+    return times
+
+
+def compare_channels(analyses, reference=0):
+    """
+    같은 그리드로 분석한 채널들을 기준 채널과 비교합니다. (두 채널 모두 정박으로 연주한 그리드 지점만 사용)
+    반환값: 기준 채널을 제외한 채널별 CHANNEL_PAIR_DTYPE 구조화 배열
+    """
+    table = np.stack([slot_times(analysis) for analysis in analyses])  # (채널, 그리드 지점)
+    offsets = table - table[reference]
+    paired = np.isfinite(offsets)
+    counts = paired.sum(axis=1)
+
+    with np.errstate(invalid="ignore"):
+        mean = np.where(paired, offsets, 0.0).sum(axis=1) / counts
+        var = (np.where(paired, offsets - mean[:, np.newaxis], 0.0) ** 2).sum(axis=1) / counts
+
+    others = np.array([ch for ch in range(len(analyses)) if ch != reference], dtype=np.int64)
+    result = np.zeros(len(others), dtype=CHANNEL_PAIR_DTYPE)
+    result["channel"] = others
+    result["paired"] = counts[others]
+    result["mean_offset"] = mean[others]
+    result["std_offset"] = np.sqrt(var[others])
+    return result
+
+
+def print_timing_summary(analysis):
+    """
+    그리드 매칭 결과를 요약해 출력합니다.
+    """
+    onsets = analysis.onsets
+    print(f"[타이밍] 연주 {len(onsets)}개 | 정박 {len(onsets) - analysis.off_grid_count}개 | "
+          f"어긋남 {analysis.off_grid_count}개 ({analysis.off_grid_ratio * 100:.1f}%)")
+    if len(onsets) and len(analysis.grid_times):
+        errors_ms = onsets["error"] * 1000
+        print(f"[타이밍] 평균 오차 {errors_ms.mean():+.1f}ms | 표준편차 {errors_ms.std():.1f}ms")
+    print(f"[타이밍] 놓친 그리드 {len(analysis.missed_slots)}개 | 추가 연주 {len(analysis.extra_indices)}개")
+
+
+def print_channel_comparison(analyses, comparison, labels):
+    """
+    채널별 타이밍 요약과 기준(첫) 채널 대비 시차를 출력합니다.
+    labels: 채널 이름 (예: 입력 채널 번호)
+    """
+    for label, analysis in zip(labels, analyses):
+        print(f"\n[채널 {label}]")
+        print_timing_summary(analysis)
+    print()
+    for row in comparison:
+        if row["paired"] == 0:
+            print(f"[채널 간] {labels[row['channel']]} - {labels[0]}: 함께 정박으로 연주한 그리드 지점이 없습니다.")
+            continue
+        print(f"[채널 간] {labels[row['channel']]} - {labels[0]}: 함께 연주 {row['paired']}개 | "
+              f"평균 시차 {row['mean_offset'] * 1000:+.1f}ms | 표준편차 {row['std_offset'] * 1000:.1f}ms")
@@ -2,110 +2,195 @@ import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
 import os
-import config
+from recording import iter_chunks, DEFAULT_CHUNK_SIZE
+from timing import analyze_timing, analyze_timing_channels, GRID_BAR, GRID_BEAT, GRID_SUB
+from tempo_map import TempoMap
 
 # 이미지를 저장할 폴더명
 OUTPUT_DIR = "images"
 
-def create_waveform_with_metronome(audio_data, detected_indices=None, tolerance=0.03):
+# 저장 이미지 해상도 (포락선 구간 수도 이 해상도의 픽셀 폭에 맞춤)
+SAVE_DPI = 150
+FIGURE_SIZE = (18, 7)
+# 저장 이미지의 픽셀 하나당 포락선 구간 하나
+ENVELOPE_BUCKETS = int(FIGURE_SIZE[0] * SAVE_DPI)
+# 미리보기 이미지 해상도 (전체 해상도보다 먼저 저장)
+PREVIEW_DPI = 50
+# 저장 형식 -> (파일 이름 끝, 해상도)
+IMAGE_FORMATS = {
+    "preview": ("_preview.png", PREVIEW_DPI),
+    "png": (".png", SAVE_DPI),
+    "svg": (".svg", SAVE_DPI),
+    "pdf": (".pdf", SAVE_DPI),
+}
+
+
+def compute_envelope(audio_data, buckets, chunk_size=DEFAULT_CHUNK_SIZE):
     """
-    음성 파형을 시각화하고 메트로놈 가이드 라인과 감지된 피크 지점을 표시합니다.
-    그리드와 어긋난 연주 지점에는 그래프 하단에 'X' 표시를 추가합니다.
+    신호를 buckets 개 구간으로 나눠 구간별 최소/최대값을 chunk 단위로 계산합니다.
+    np.memmap 입력도 전체를 메모리에 올리지 않습니다.
+    반환값: (구간 크기(샘플), 최소값 배열, 최대값 배열)
     """
-    duration = len(audio_data) / config.SAMPLE_RATE
-    time_axis = np.linspace(0, duration, len(audio_data))
-    bpm = config.METRONOME_BPM
+    bucket_size = max(1, -(-len(audio_data) // buckets))
+    if len(audio_data) == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return bucket_size, empty, empty
+    # chunk 경계가 구간 경계와 맞도록 chunk 크기를 구간 크기의 배수로 맞춤
+    chunk_size = max(bucket_size, chunk_size // bucket_size * bucket_size)
+
+    mins, maxs = [], []
+    for _, block in iter_chunks(audio_data, chunk_size):
+        full = len(block) // bucket_size * bucket_size
+        if full:
+            shaped = block[:full].reshape(-1, bucket_size)
+            mins.append(shaped.min(axis=1))
+            maxs.append(shaped.max(axis=1))
+        if full < len(block):
+            mins.append(block[full:].min(keepdims=True))
+            maxs.append(block[full:].max(keepdims=True))
 
-    # 그래프 생성
-    fig, ax = plt.subplots(figsize=(18, 7), dpi=100)
+    return bucket_size, np.concatenate(mins), np.concatenate(maxs)
 
+
+def _draw_channel(ax, audio_data, timing, sample_rate, render_mode, envelope):
+    """한 채널의 파형, 그리드, 연주 지점을 ax 에 그립니다."""
     # 1. 오디오 파형 그리기
-    ax.plot(time_axis, audio_data, color="#2E86DE", linewidth=0.5, alpha=0.8, label="Guitar Signal")
-    ax.fill_between(time_axis, audio_data, alpha=0.3, color="#2E86DE")
+    # 포락선은 chunk 단위로 읽으므로 memmap 도 전체를 올리지 않음
+    if envelope is None:
+        envelope = compute_envelope(audio_data, ENVELOPE_BUCKETS)
+    bucket_size, mins, maxs = envelope
+    envelope_time = np.arange(len(mins), dtype=np.float32) * np.float32(bucket_size / sample_rate)
+    if render_mode == "envelope":
+        ax.fill_between(envelope_time, mins, maxs, color="#2E86DE", linewidth=0.5, alpha=0.8, label="Guitar Signal")
+    else:
+        # 선은 모든 샘플을 그리고, 채움은 샘플별 다각형 대신 포락선으로 그림 (시간 축도 float32)
+        time_axis = np.arange(len(audio_data), dtype=np.float32) * np.float32(1 / sample_rate)
+        ax.plot(time_axis, audio_data, color="#2E86DE", linewidth=0.5, alpha=0.8, label="Guitar Signal")
+        ax.fill_between(envelope_time, np.minimum(mins, 0), np.maximum(maxs, 0), alpha=0.3, color="#2E86DE")
 
-    # 2. 메트로놈 박자 및 그리드 생성
-    beat_interval = 60.0 / bpm
-    beat_positions = np.arange(0, duration, beat_interval)
-    
-    # 전체 그리드 위치 저장 (정박 + 서브디비전)
-    target_grid_positions = list(beat_positions)
-
-    # 기본 메트로놈 박자 표시 
-    for i, pos in enumerate(beat_positions):
-        # 강박
-        if i % config.BEATS_PER_BAR == 0:
-            ax.axvline(pos, color="#FF0000", linestyle="-", linewidth=1.5, alpha=0.8, label="Bar Start" if i == 0 else "")
-        # 약박
-        else:
-            ax.axvline(pos, color="#F18B8B", linestyle="-", linewidth=1.2, alpha=0.6, label="Beat" if i == 1 else "")
-
-    # 설정된 음표 단위(4, 8, 16 등)에 따른 세부 그리드 표시
-    if config.CHROMATIC_ENABLED:
-        subdivisions = config.CHROMATIC_BEATS / 4
-        chromatic_interval = beat_interval / subdivisions
-        chromatic_positions = np.arange(0, duration, chromatic_interval)
-        
-        for pos in chromatic_positions:
-            if not any(np.isclose(pos, beat_positions, atol=1e-5)):
-                ax.axvline(pos, color="#ff0000", linestyle="-", linewidth=1.2, alpha=0.6)
-                target_grid_positions.append(pos)
-    
-    target_grid_positions = np.sort(target_grid_positions)
-
-    # 3. Attack 지점 표시 및 어긋남 검사
-    if detected_indices is not None and len(detected_indices) > 0:
-
-        first_mark = True
-        first_x_mark = True
-
-        for idx in detected_indices:
-            peak_time = idx / config.SAMPLE_RATE
-            
-            # 현재 연주 지점이 그리드 중 하나와 근접한지 확인
-            is_on_grid = any(np.abs(target_grid_positions - peak_time) < tolerance)
-
-            # 연주 시작 지점 표시 (초록 점선)
-            ax.axvline(peak_time, color="#2ECC71", linestyle="--", linewidth=1.2, alpha=0.9, 
-                       label="Detected Attack" if first_mark else "")
-            first_mark = False
-
-            # 그리드와 어긋난 경우 'X' 표시 추가 (하단 y=-0.6 위치)
-            if not is_on_grid:
-                ax.text(peak_time, -0.6, 'X', color='red', fontsize=15, fontweight='bold', 
-                        ha='center', va='center')
-                
-                # 범례를 위한 가짜 아티스트(Proxy Artist)
-                if first_x_mark:
-                    ax.plot([], [], 'rx', label="Off-Grid", markersize=10, markeredgewidth=2)
-                    first_x_mark = False
+    # 2. 메트로놈 박자 및 그리드 표시
+    # 종류별로 하나의 LineCollection 으로 그림 (선 개수만큼 아티스트를 만들지 않음)
+    x_transform = ax.get_xaxis_transform()
+    grid_styles = [
+        (GRID_BAR, dict(colors="#FF0000", linewidth=1.5, alpha=0.8, label="Bar Start")),  # 강박
+        (GRID_BEAT, dict(colors="#F18B8B", linewidth=1.2, alpha=0.6, label="Beat")),      # 약박
+        (GRID_SUB, dict(colors="#ff0000", linewidth=1.2, alpha=0.6)),                     # 세부 그리드
+    ]
+    for kind, style in grid_styles:
+        positions = timing.grid_times[timing.grid_kinds == kind]
+        if len(positions):
+            ax.vlines(positions, 0, 1, transform=x_transform, linestyles="-", zorder=2, **style)
+
+    # 3. Attack 지점 표시 및 어긋남 표시
+    if len(timing.onsets) > 0:
+        # 연주 시작 지점 표시 (초록 점선)
+        ax.vlines(timing.onsets["time"], 0, 1, transform=x_transform, colors="#2ECC71", linestyles="--",
+                  linewidth=1.2, alpha=0.9, zorder=2, label="Detected Attack")
+
+        # 그리드와 어긋난 경우 'X' 표시 추가 (하단 y=-0.6 위치)
+        off_grid_times = timing.onsets["time"][~timing.onsets["on_grid"]]
+        if len(off_grid_times):
+            ax.scatter(off_grid_times, np.full(len(off_grid_times), -0.6), marker="x", s=120,
+                       color="red", linewidths=2.5, zorder=3, label="Off-Grid")
 
-    # 그래프 스타일 설정
-    ax.set_xlim(0, duration)
     ax.set_ylim(-1.1, 1.1)
-    ax.set_title(f"Guitar Analysis | {bpm} BPM | {config.CHROMATIC_BEATS}th Notes", fontsize=15, fontweight="bold")
-    ax.set_xlabel("Time (seconds)")
     ax.set_ylabel("Amplitude")
     ax.grid(True, alpha=0.2)
-    
+
+
+def create_waveform_with_metronome(audio_data, settings, detected_indices=None, timing=None,
+                                   render_mode="envelope", envelope=None):
+    """
+    음성 파형을 시각화하고 메트로놈 가이드 라인과 감지된 피크 지점을 표시합니다.
+    그리드와 어긋난 연주 지점에는 그래프 하단에 'X' 표시를 추가합니다.
+    timing(timing.TimingAnalysis)을 주면 그리드 매칭을 다시 하지 않습니다.
+    템포 맵/그리드/샘플 레이트는 settings 값을 사용합니다.
+
+    render_mode:
+      - "envelope": 파형을 픽셀 폭 단위의 최소/최대 포락선으로 줄여 그림 (녹음 길이와 무관하게 일정한 렌더링 시간)
+      - "full": 모든 샘플을 그림 (짧은 녹음 확대 확인용)
+    envelope: 미리 계산한 compute_envelope(audio_data, ENVELOPE_BUCKETS) 결과 (저장된 take 다시 그리기용)
+
+    다채널 (frames, channels) 녹음은 채널마다 한 줄씩 그리며, timing 은 채널별 TimingAnalysis 리스트
+    (timing.analyze_timing_channels), detected_indices 와 envelope 는 채널별 리스트입니다.
+    """
+    sample_rate = settings.sample_rate
+    duration = len(audio_data) / sample_rate
+
+    # 그리드 매칭은 timing 모듈에서 한 번만 수행
+    if audio_data.ndim == 1:
+        channel_data = [audio_data]
+        if timing is None:
+            timing = analyze_timing(detected_indices if detected_indices is not None else [],
+                                    len(audio_data), settings)
+        timings, envelopes = [timing], [envelope]
+    else:
+        channel_data = [audio_data[:, ch] for ch in range(audio_data.shape[1])]
+        timings = timing
+        if timings is None:
+            # detected_indices 는 채널별 연주 지점 리스트
+            timings = analyze_timing_channels(detected_indices if detected_indices is not None else
+                                              [[] for _ in channel_data], len(audio_data), settings)
+        envelopes = envelope if envelope is not None else [None] * len(channel_data)
+
+    # 그래프 생성 (채널마다 한 줄, 시간 축 공유)
+    rows = len(channel_data)
+    fig, axes = plt.subplots(rows, 1, figsize=(FIGURE_SIZE[0], FIGURE_SIZE[1] * (1 + 0.5 * (rows - 1))),
+                             dpi=100, sharex=True, squeeze=False)
+    axes = axes[:, 0]
+    for ch, ax in enumerate(axes):
+        _draw_channel(ax, channel_data[ch], timings[ch], sample_rate, render_mode, envelopes[ch])
+        if rows > 1:
+            ax.set_title(f"Channel {settings.input_channels[ch]}", fontsize=11, loc="left")
+
+    # 그래프 스타일 설정
+    axes[0].set_xlim(0, duration)
+    title = f"Guitar Analysis | {TempoMap.from_settings(settings).label}"
+    if not settings.tempo_map:
+        title += f" | {settings.chromatic_beats}th Notes"
+    if rows == 1:
+        axes[0].set_title(title, fontsize=15, fontweight="bold")
+    else:
+        fig.suptitle(title, fontsize=15, fontweight="bold")
+    axes[-1].set_xlabel("Time (seconds)")
+
     # 범례 표시
-    ax.legend(loc="upper right", frameon=True, shadow=True)
-    
+    axes[0].legend(loc="upper right", frameon=True, shadow=True)
+
     plt.tight_layout()
     return fig
 
-def save_analysis_image(fig):
+def default_image_filename():
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"guitar_chromatic_{timestamp}.png"
+
+
+def primary_image_format(image_formats):
+    """대표(전체 해상도) 이미지 형식: png 가 있으면 png, 없으면 미리보기가 아닌 첫 형식 (미리보기뿐이면 None)"""
+    if "png" in image_formats:
+        return "png"
+    return next((image_format for image_format in image_formats if image_format != "preview"), None)
+
+
+def image_path(filename, output_dir=OUTPUT_DIR, image_format="png"):
+    """저장 형식에 맞춘 이미지 경로 (filename 의 확장자는 형식에 맞게 바꿈)"""
+    ending, _ = IMAGE_FORMATS[image_format]
+    return os.path.join(output_dir, os.path.splitext(filename)[0] + ending)
+
+
+def save_analysis_image(fig, filename=None, output_dir=OUTPUT_DIR, image_format="png"):
     # images 폴더가 없으면 생성합니다.
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-        print(f"📁 '{OUTPUT_DIR}' 폴더 생성됨")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"📁 '{output_dir}' 폴더 생성됨")
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"guitar_chromatic_{timestamp}.png"
+    if filename is None:
+        filename = default_image_filename()
     
-    # 폴더 경로와 파일명을 합쳐 전체 경로를 만듭니다.
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    # 폴더 경로와 파일명을 합쳐 전체 경로를 만듭니다. (형식별 확장자/해상도)
+    filepath = image_path(filename, output_dir, image_format)
     
-    fig.savefig(filepath, dpi=150, bbox_inches="tight")
+    fig.savefig(filepath, dpi=IMAGE_FORMATS[image_format][1], bbox_inches="tight")
     
     # 전체 경로를 반환합니다.
-    return filepath
\ No newline at end of file
+    return filepath
@@ -0,0 +1,194 @@
+# worker.py
+# 상주 분석 워커: 런처가 한 번 실행해 두면 NumPy/sounddevice/matplotlib 임포트와 ASIO 장치 검색을
+# 매 실행마다 반복하지 않고, 로컬 IPC 채널로 받은 설정(settings.Settings)으로 바로 녹음/분석을 시작합니다.
+#
+# 실행: python -u worker.py --port PORT   (인증키는 환경변수 METRONOME_WORKER_KEY, hex 문자열)
+
+import os
+import sys
+import argparse
+import subprocess
+import threading
+from multiprocessing.connection import Client, Listener
+
+WORKER_KEY_ENV = "METRONOME_WORKER_KEY"
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+def serve(conn, simulate=None, show=True):
+    """런처의 요청을 기다렸다가 분석을 실행하고 결과 이벤트를 돌려줍니다."""
+    # 무거운 임포트와 장치 초기화는 시작할 때 한 번만 수행
+    from main import run_analysis_process
+    from latency import calibrate_latency
+    from settings import Settings
+    from stream_backend import SoundDeviceBackend, SimulatedBackend
+    from render_queue import RenderQueue
+
+    # 이미지 저장 완료 알림은 결과 수신 스레드에서 보내므로 연결 쓰기를 잠금으로 보호
+    send_lock = threading.Lock()
+
+    def send(event):
+        with send_lock:
+            conn.send(event)
+
+    def on_saved(image_format, path, error):
+        try:
+            send({"event": "image_saved", "format": image_format, "ok": error is None, "path": path,
+                  "error": error})
+        except OSError:
+            pass
+
+    if simulate is not None:
+        backend = SimulatedBackend(simulate or None)
+    else:
+        backend = SoundDeviceBackend()
+        backend.sd.query_devices()
+    # 이미지 저장용 작업 프로세스 (분석이 끝나면 다음 요청을 바로 받고, 저장은 그동안 계속됨)
+    renderer = RenderQueue(on_saved)
+    send({"event": "ready", "pid": os.getpid()})
+    print("[워커] 준비 완료", flush=True)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        command = message.get("cmd")
+        if command == "run":
+            settings = Settings.from_dict(message.get("settings", {}))
+            result = run_analysis_process(settings, backend, show=show, calibrate=message.get("calibrate", False),
+                                          renderer=renderer)
+            recommendation = result["recommendation"] if result else None
+            send({
+                "event": "done",
+                "ok": result is not None,
+                "image_path": result["image_path"] if result else None,
+                "recommendation": None if recommendation is None else {
+                    "threshold": float(recommendation["threshold"]),
+                    "silence_threshold": float(recommendation["silence_threshold"]),
+                },
+            })
+        elif command == "latency":
+            settings = Settings.from_dict(message.get("settings", {}))
+            try:
+                latency, score, saved = calibrate_latency(settings, backend)
+            except Exception as e:
+                print(f"\n[에러] 지연 측정 중 오류 발생: {e}", flush=True)
+                latency, score, saved = 0.0, 0.0, False
+            send({
+                "event": "latency_done",
+                "ok": saved,
+                "latency_ms": latency / settings.sample_rate * 1000,
+                "score": score,
+            })
+        elif command == "shutdown":
+            break
+
+    # 남은 이미지 저장을 끝낸 뒤 종료
+    renderer.close()
+
+
+class WorkerClient:
+    """
+    런처 쪽에서 상주 워커 프로세스를 실행하고 요청을 보냅니다.
+    on_output(line): 워커 표준 출력 한 줄, on_event(dict): 워커가 보낸 이벤트 (별도 스레드에서 호출)
+    """
+    def __init__(self, on_output, on_event, script=WORKER_SCRIPT, extra_args=()):
+        self.on_output = on_output
+        self.on_event = on_event
+        self.script = script
+        self.extra_args = list(extra_args)
+        self.process = None
+        self.conn = None
+        self._connected = threading.Event()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """워커 프로세스를 실행하고 연결을 기다리는 스레드를 시작합니다."""
+        authkey = os.urandom(16)
+        listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        env = dict(os.environ, **{WORKER_KEY_ENV: authkey.hex()})
+        self._connected.clear()
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", self.script, "--port", str(listener.address[1])] + self.extra_args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            encoding="utf-8",
+            env=env,
+        )
+        threading.Thread(target=self._accept, args=(listener,), daemon=True).start()
+        threading.Thread(target=self._relay_output, args=(self.process,), daemon=True).start()
+
+    def _accept(self, listener):
+        try:
+            self.conn = listener.accept()
+        finally:
+            listener.close()
+        self._connected.set()
+        while True:
+            try:
+                event = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            self.on_event(event)
+
+    def _relay_output(self, process):
+        for line in process.stdout:
+            self.on_output(line)
+        process.wait()
+        self.on_event({"event": "exited", "returncode": process.returncode})
+
+    def submit(self, settings, calibrate=False, timeout=60):
+        """
+        분석 실행 요청(settings.Settings)을 보냅니다. 워커가 없거나 종료되었으면 새로 실행합니다.
+        calibrate: True 이면 완료 이벤트에 임계값 추천값(recommendation)이 담김
+        """
+        self._send({"cmd": "run", "settings": settings.to_dict(), "calibrate": calibrate}, timeout)
+
+    def submit_latency(self, settings, timeout=60):
+        """루프백 왕복 지연 측정 요청을 보냅니다. (완료 시 latency_done 이벤트)"""
+        self._send({"cmd": "latency", "settings": settings.to_dict()}, timeout)
+
+    def _send(self, message, timeout):
+        """워커가 없거나 종료되었으면 새로 실행하고, 연결되면 요청을 보냅니다."""
+        if not self.is_alive():
+            self.start()
+        if not self._connected.wait(timeout):
+            raise TimeoutError("워커 프로세스에 연결할 수 없습니다.")
+        self.conn.send(message)
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.send({"cmd": "shutdown"})
+            except OSError:
+                pass
+        if self.is_alive():
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="상주 분석 워커")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--simulate", metavar="SOURCE", nargs="?", const="",
+                        help="ASIO 장치 대신 가상 장치 사용 (WAV 경로를 주면 입력으로 재생, 생략 시 무음)")
+    parser.add_argument("--no-show", action="store_true", help="분석 창을 띄우지 않음")
+    args = parser.parse_args()
+
+    authkey = bytes.fromhex(os.environ[WORKER_KEY_ENV])
+    conn = Client(("127.0.0.1", args.port), authkey=authkey)
+    try:
+        serve(conn, simulate=args.simulate, show=not args.no_show)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()